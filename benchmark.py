@@ -0,0 +1,324 @@
+"""
+Benchmark Suite for The Evolving Kingdom
+Plays full reigns through GameState, KingdomAI and KingdomEngine against the
+offline mock backend and reports the engine's own costs as JSON: turn wall
+time, save() writes, prompt sizes per task, peak RSS and state load time
+
+    python benchmark.py --output report.json
+    python benchmark.py --baseline report.json   # exits 1 on a regression
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import platform
+from concurrent.futures import ProcessPoolExecutor
+from config import FACTIONS, STORAGE_BACKEND
+from game_state import GameState
+from storage import JSONFileStore, EventLogStore, create_store
+from openai_client import KingdomAI
+from llm_backends import MockBackend
+from engine import KingdomEngine, decision_options
+
+try:
+    import resource  # Unix only; peak RSS is reported as None elsewhere
+except ImportError:
+    resource = None
+
+DEFAULT_TURNS = (8, 50, 500)
+DEFAULT_FACTION_COUNTS = (4, 8)
+DEFAULT_REPEAT = 3  # Runs per scenario; the fastest is reported, which filters out scheduler noise
+DEFAULT_TOLERANCE = 0.25  # Relative slowdown or growth that counts as a regression
+
+# Metrics compared against a baseline report: (path into a scenario result, noisy wall-clock metric?)
+REGRESSION_METRICS = [
+    (("turn_seconds", "mean"), True),
+    (("turn_seconds", "p95"), True),
+    (("saves", "count"), False),
+    (("saves", "bytes_total"), False),
+    (("state_bytes",), False),
+    (("load_seconds",), True),
+    (("peak_rss_kb",), False)
+]
+
+# ==================== INSTRUMENTATION ====================
+class RecordingBackend:
+    """Wraps a backend and records request and response sizes per task"""
+    
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self.model = backend.model
+        self.calls = {}  # task -> list of (prompt bytes, response bytes)
+    
+    def complete(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        response, usage = self.backend.complete(system_prompt, user_prompt, temperature, task, timeout)
+        self._record(task, system_prompt, user_prompt, response)
+        return response, usage
+    
+    def stream(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        chunks = []
+        for delta, usage in self.backend.stream(system_prompt, user_prompt, temperature, task, timeout):
+            chunks.append(delta)
+            yield delta, usage
+        self._record(task, system_prompt, user_prompt, "".join(chunks))
+    
+    def _record(self, task, system_prompt, user_prompt, response):
+        prompt_bytes = len(system_prompt.encode("utf-8")) + len(user_prompt.encode("utf-8"))
+        self.calls.setdefault(task, []).append((prompt_bytes, len((response or "").encode("utf-8"))))
+
+class CountingStore:
+    """Wraps a store and records every commit: count, time and bytes written"""
+    
+    def __init__(self, store):
+        self.store = store
+        self.commits = []  # (seconds, bytes written)
+    
+    def load(self):
+        return self.store.load()
+    
+    def reset(self, state):
+        self.store.reset(state)
+    
+    def commit(self, state, events):
+        before = self._sizes()
+        started = time.perf_counter()
+        self.store.commit(state, events)
+        elapsed = time.perf_counter() - started
+        self.commits.append((elapsed, self._written(before, self._sizes())))
+    
+    def _sizes(self):
+        if isinstance(self.store, JSONFileStore):
+            paths = [self.store.filename]
+        elif isinstance(self.store, EventLogStore):
+            paths = [self.store.snapshot_path, self.store.log_path]
+        else:
+            paths = []
+        return [os.path.getsize(p) if os.path.exists(p) else 0 for p in paths]
+    
+    def _written(self, before, after):
+        """Bytes a commit wrote: whole-file rewrites count in full, appends by their growth"""
+        if isinstance(self.store, EventLogStore):
+            (snapshot_before, log_before), (snapshot_after, log_after) = before, after
+            if log_after >= log_before:
+                return log_after - log_before
+            return snapshot_after + log_after  # Compacted into a fresh snapshot
+        return sum(after)
+    
+    def footprint(self):
+        """Bytes the saved game occupies on disk"""
+        return sum(self._sizes())
+
+def make_factions(count):
+    """The configured factions, padded with synthetic ones up to count"""
+    roster = dict(list(FACTIONS.items())[:count])
+    for number in range(len(roster) + 1, count + 1):
+        roster[f"guild_{number}"] = {
+            "name": f"The Guild of the {number}th Banner",
+            "base_personality": random.Random(number).choice(
+                ["shrewd and ambitious", "pious and wary", "restless and proud", "loyal but demanding"]
+            )
+        }
+    return roster
+
+def summarize(values):
+    """count/total/mean/p50/p95/max of a list of numbers"""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+    
+    return {
+        "count": len(values),
+        "total": round(sum(values), 6),
+        "mean": round(sum(values) / len(values), 6),
+        "p50": round(percentile(0.5), 6),
+        "p95": round(percentile(0.95), 6),
+        "max": round(ordered[-1], 6)
+    }
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB, or None where unsupported"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS reports bytes
+
+# ==================== SCENARIO ====================
+def run_scenario(turns, faction_count, seed=0, storage=None, latency_scale=0.0):
+    """
+    Play one reign and measure it
+    Runs in a fresh worker process so the peak RSS belongs to this scenario alone
+    """
+    storage = storage or STORAGE_BACKEND
+    workdir = tempfile.mkdtemp(prefix="kingdom-bench-")
+    try:
+        filename = os.path.join(workdir, "game_state.json")
+        store = CountingStore(create_store(filename, storage))
+        game_state = GameState(filename, store=store)
+        backend = RecordingBackend(MockBackend(seed=seed, latency_scale=latency_scale))
+        # No response cache: every request must reach the backend to be measured
+        ai = KingdomAI(cache=False, backend=backend)
+        engine = KingdomEngine(game_state, ai, total_turns=turns, background_post_turn=False)
+        rng = random.Random(seed)
+        
+        game_state.initialize_new_game("Benchmark Monarch", make_factions(faction_count))
+        turn_seconds = []
+        for turn in range(1, turns + 1):
+            options = decision_options(turn)
+            started = time.perf_counter()
+            if turn > 2:
+                # The interactive game offers the advisor from turn 3 on
+                faction_states = {
+                    fid: {"personality": f["current_personality"], "trust": f["trust_score"]}
+                    for fid, f in game_state.get_all_factions().items()
+                }
+                ai.predict_faction_reactions(options, faction_states)
+            engine.play_turn(turn, rng.choice(options))
+            turn_seconds.append(time.perf_counter() - started)
+        
+        started = time.perf_counter()
+        engine.final_review()
+        review_seconds = time.perf_counter() - started
+        engine.close()
+        game_state.flush()
+        
+        load_times = []
+        for _ in range(3):
+            started = time.perf_counter()
+            GameState(filename, store=create_store(filename, storage)).load()
+            load_times.append(time.perf_counter() - started)
+        
+        commit_seconds = [seconds for seconds, _ in store.commits]
+        commit_bytes = [written for _, written in store.commits]
+        return {
+            "turns": turns,
+            "factions": faction_count,
+            "storage": storage,
+            "turn_seconds": summarize(turn_seconds),
+            "first_turn_seconds": round(turn_seconds[0], 6),
+            "last_turn_seconds": round(turn_seconds[-1], 6),
+            "review_seconds": round(review_seconds, 6),
+            "saves": {
+                "count": len(store.commits),
+                "seconds_total": round(sum(commit_seconds), 6),
+                "bytes_total": sum(commit_bytes),
+                "bytes_max": max(commit_bytes, default=0)
+            },
+            "prompts": {
+                task: {
+                    "calls": len(calls),
+                    "prompt_bytes": summarize([p for p, _ in calls]),
+                    "response_bytes_mean": round(sum(r for _, r in calls) / len(calls), 1)
+                }
+                for task, calls in sorted(backend.calls.items())
+            },
+            "stages": (engine.telemetry_summary() or {}).get("stages"),
+            "state_bytes": store.footprint(),
+            "load_seconds": round(min(load_times), 6),
+            "peak_rss_kb": peak_rss_kb()
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# ==================== REPORT ====================
+def find_regressions(report, baseline, tolerance):
+    """Metrics that grew by more than tolerance against the baseline report"""
+    previous = {(s["turns"], s["factions"], s["storage"]): s for s in baseline.get("scenarios", [])}
+    regressions = []
+    for scenario in report["scenarios"]:
+        key = (scenario["turns"], scenario["factions"], scenario["storage"])
+        if key not in previous:
+            continue
+        checks = list(REGRESSION_METRICS)
+        checks += [(("prompts", task, "prompt_bytes", "max"), False) for task in scenario["prompts"]]
+        for path, noisy in checks:
+            new, old = scenario, previous[key]
+            for step in path:
+                new = new.get(step) if isinstance(new, dict) else None
+                old = old.get(step) if isinstance(old, dict) else None
+            if not isinstance(new, (int, float)) or not isinstance(old, (int, float)) or old <= 0:
+                continue
+            # Wall-clock metrics below a millisecond are mostly noise
+            if noisy and new < 0.001:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append({
+                    "scenario": {"turns": key[0], "factions": key[1], "storage": key[2]},
+                    "metric": ".".join(path),
+                    "baseline": old,
+                    "current": new,
+                    "change": round(new / old - 1, 3)
+                })
+    return regressions
+
+def run_suite(turn_counts, faction_counts, seed=0, storage=None, latency_scale=0.0, repeat=DEFAULT_REPEAT, log=sys.stderr):
+    """Run every (turns, factions) scenario repeat times, each run in its own process, keeping the fastest"""
+    scenarios = []
+    for turns in turn_counts:
+        for faction_count in faction_counts:
+            print(f"Benchmarking {turns} turns x {faction_count} factions...", file=log, flush=True)
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    runs.append(pool.submit(run_scenario, turns, faction_count, seed, storage, latency_scale).result())
+            scenarios.append(min(runs, key=lambda run: run["turn_seconds"]["total"]))
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "latency_scale": latency_scale,
+        "repeat": repeat,
+        "scenarios": scenarios
+    }
+
+def build_parser():
+    """Command line interface"""
+    parser = argparse.ArgumentParser(description="Benchmark The Evolving Kingdom against the offline mock backend")
+    parser.add_argument("--turns", type=int, nargs="+", default=list(DEFAULT_TURNS), help="reign lengths to sweep")
+    parser.add_argument("--factions", type=int, nargs="+", default=list(DEFAULT_FACTION_COUNTS), help="faction counts to sweep")
+    parser.add_argument("--storage", choices=["json", "eventlog"], help=f"storage backend (default: {STORAGE_BACKEND})")
+    parser.add_argument("--seed", type=int, default=0, help="seed for decisions and mock answers")
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="multiplier on mock latencies (default 0: engine overhead only)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs per scenario (the fastest is reported)")
+    parser.add_argument("--output", help="report file to write (default: stdout)")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative regression")
+    return parser
+
+def main(argv=None):
+    """Entry point"""
+    args = build_parser().parse_args(argv)
+    report = run_suite(args.turns, args.factions, args.seed, args.storage, args.latency_scale, args.repeat)
+    
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report["regressions"] = find_regressions(report, baseline, args.tolerance)
+        for regression in report["regressions"]:
+            print(
+                f"REGRESSION {regression['scenario']} {regression['metric']}: "
+                f"{regression['baseline']} -> {regression['current']} ({regression['change']:+.0%})",
+                file=sys.stderr
+            )
+        exit_code = 1 if report["regressions"] else 0
+    
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
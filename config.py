@@ -3,6 +3,21 @@
 # Game Settings
 TOTAL_TURNS = 8
 INITIAL_FACTION_TRUST = 50  # 0-100 scale
+MAX_PARALLEL_FACTIONS = 4  # Worker threads for concurrent faction LLM calls
+BATCH_FACTION_GENERATION = False  # Ask for all faction responses in one LLM request
+BATCH_INCLUDES_SENTIMENT = True  # Have the batched request score sentiment too
+STREAM_FACTION_RESPONSES = True  # Show faction responses in the terminal as they are generated
+SPECULATIVE_GENERATION = False  # Generate faction responses for every option while the player decides
+SPECULATION_TOKEN_BUDGET = 12000  # Estimated tokens a turn may spend speculating; options past it wait for the choice
+SPECULATION_REPLY_TOKENS = 250  # Estimated tokens per faction for its reply and sentiment analysis
+OVERLAP_CLASSIFICATION = False  # Classify alongside the chronicle and evolution, from the state before them
+BACKGROUND_POST_TURN = True  # Chronicle, evolve, classify and add story beats while the player reads on
+POST_TURN_STALE_READS = False  # Let the next turn's factions answer before the last turn's evolutions are committed
+SAVE_FLUSH_INTERVAL = 0  # Seconds a dirty game state may wait before being written (0 = write through)
+STORAGE_BACKEND = "json"  # "json" (one document), "eventlog" (append-only JSONL + snapshots) or "memory" (not persisted)
+EVENT_LOG_COMPACT_EVERY = 200  # Events appended before the log is folded into a snapshot
+SAVE_FORMAT = "json"  # Saved states and event-log snapshots: "json" (readable) or "binary" (see snapshot.py); loading reads either
+SNAPSHOT_COMPRESSION = 6  # zlib level for binary snapshots (0 = uncompressed)
 
 # Faction Definitions
 FACTIONS = {
@@ -58,3 +73,146 @@ COLORS = {
 # OpenAI Settings
 OPENAI_MODEL = "gpt-3.5-turbo"  # Using GPT-3.5 for cost efficiency
 OPENAI_TEMPERATURE = 0.7
+
+# LLM backend: "openai" (live API) or "mock" (offline, seeded answers with synthetic latency)
+LLM_BACKEND = "openai"
+MOCK_SEED = 0  # Same seed + same requests = same answers and latencies
+MOCK_LATENCY_SCALE = 1.0  # Multiplier on every mock latency (0 = answer instantly)
+MOCK_ERROR_RATE = 0.0  # Share of mock requests that fail like a dropped API call
+MOCK_FIRST_CHUNK_SHARE = 0.25  # Share of a streamed mock request's latency spent before its first chunk
+MOCK_MALFORMED_RATE = 0.0  # Share of mock JSON answers given a typical defect (prose, fences, bad commas, cut off)
+# Mock latency per task: (distribution, a, b) - ("fixed", s, _), ("uniform", low, high),
+# ("normal", mean, stddev) or ("lognormal", median, sigma), in seconds
+MOCK_LATENCY = {
+    "default": ("lognormal", 1.0, 0.4),
+    "generate_faction_response": ("lognormal", 1.2, 0.4),
+    "generate_all_faction_responses": ("lognormal", 3.5, 0.4),
+    "analyze_sentiment": ("lognormal", 0.5, 0.3),
+    "create_chronicle": ("lognormal", 2.0, 0.4),
+    "continue_chronicle": ("lognormal", 1.5, 0.4),
+    "evolve_personality": ("lognormal", 1.0, 0.3),
+    "predict_faction_reactions": ("lognormal", 1.5, 0.4),
+    "classify_kingdom_state": ("lognormal", 0.6, 0.3),
+    "generate_epic_review": ("lognormal", 8.0, 0.3),
+    "generate_story_beat": ("lognormal", 1.0, 0.3)
+}
+
+# Prompt budgets: hard ceiling (system + user prompt, in estimated tokens) per LLM task
+PROMPT_TOKEN_BUDGETS = {
+    "generate_faction_response": 1200,
+    "generate_all_faction_responses": 3000,
+    "analyze_sentiment": 800,
+    "create_chronicle": 2500,
+    "continue_chronicle": 1500,
+    "evolve_personality": 1500,
+    "predict_faction_reactions": 1200,
+    "classify_kingdom_state": 1200,
+    "generate_epic_review": 6000,
+    "generate_story_beat": 1200
+}
+CHARS_PER_TOKEN = 4  # Used to estimate token counts without a tokenizer
+MEMORY_QUOTE_CHARS = 200  # Longest faction quote carried into a prompt
+INCREMENTAL_CHRONICLE = True  # Chronicle from the previous entry plus a compact delta, keeping a reign summary
+CHRONICLE_KEY_QUOTES = 2  # Faction quotes carried into each chronicle delta
+REIGN_SUMMARY_CHARS = 1200  # Longest rolling "reign so far" summary kept
+
+# Faction memory tiers (see faction_memory.py): per-faction memory stays bounded in long reigns
+MEMORY_HOT_TURNS = 4  # Recent turns whose memory entries are kept as written
+MEMORY_WARM_TURNS = 16  # Older turns kept as one compressed record each
+MEMORY_COLD_SUMMARIES = 6  # Summaries of everything older; the two oldest merge past this many
+MEMORY_WARM_QUOTE_CHARS = 160  # Longest quote kept in a warm record
+
+# Response cache (low-temperature tasks often repeat the same request)
+RESPONSE_CACHE_ENABLED = True
+CACHED_TASKS = ("analyze_sentiment", "classify_kingdom_state", "predict_faction_reactions")
+RESPONSE_CACHE_MEMORY_ENTRIES = 512  # In-memory LRU tier
+RESPONSE_CACHE_DIR = ".kingdom_cache"  # On-disk tier (None to keep the cache in memory only)
+RESPONSE_CACHE_TTL = 7 * 24 * 3600  # Seconds before a cached response expires
+RESPONSE_CACHE_MAX_BYTES = 50 * 1024 * 1024  # Disk tier size before the oldest entries are evicted
+
+# Structured output: JSON answers are validated against per-task schemas (see structured_output.py)
+JSON_MODE = True  # Ask the API for JSON mode on tasks that answer in JSON (dropped if the model refuses it)
+STRUCTURED_OUTPUT_REASKS = 1  # Times a task whose answer cannot be repaired is asked again before its default is used
+
+# Sentiment analysis: "llm" (one API call per response), "local" (lexicon only),
+# or "hybrid" (lexicon first, escalating to the LLM when it is unsure)
+SENTIMENT_BACKEND = "hybrid"
+SENTIMENT_HYBRID_THRESHOLD = 0.6  # Minimum local confidence (0.0-1.0) to skip the LLM
+
+# Async client settings (AsyncKingdomAI)
+USE_ASYNC_CLIENT = False  # Drive LLM calls through AsyncKingdomAI on an event loop
+MAX_INFLIGHT_REQUESTS = 8  # Upper bound on concurrent OpenAI requests per client
+HTTP_POOL_CONNECTIONS = 20  # Size of the shared HTTP connection pool
+HTTP_POOL_KEEPALIVE = 10  # Idle connections kept open for reuse
+
+# Request scheduler (see scheduler.py): which waiting LLM call goes next when calls have to wait
+SCHEDULER_ENABLED = True
+SCHEDULER_MAX_ACTIVE = 8  # LLM calls in progress at once per client, retries included
+SCHEDULER_INTERACTIVE_RESERVE = 2  # Of those, slots background calls leave free for interactive ones
+SCHEDULER_BACKGROUND_HEADROOM = 0.2  # Share of each rate budget background calls leave untouched
+LLM_REQUESTS_PER_MINUTE = None  # The account's request rate limit, accounted locally (None = not enforced)
+LLM_TOKENS_PER_MINUTE = None  # The account's token rate limit, accounted locally (None = not enforced)
+TASK_PRIORITIES = {  # 0 = interactive (the player is waiting), 1 = normal, 2 = background (can wait for idle time)
+    "default": 1,
+    "generate_faction_response": 0,
+    "generate_all_faction_responses": 0,
+    "analyze_sentiment": 0,
+    "predict_faction_reactions": 0,
+    "evolve_personality": 1,
+    "create_chronicle": 2,
+    "continue_chronicle": 2,
+    "classify_kingdom_state": 2,
+    "generate_story_beat": 2,
+    "generate_epic_review": 2
+}
+TASK_DEADLINES = {  # Seconds a call may wait for admission before it goes ahead of everything else
+    "default": 30,
+    "generate_faction_response": 5,
+    "generate_all_faction_responses": 10,
+    "analyze_sentiment": 5,
+    "predict_faction_reactions": 10,
+    "create_chronicle": 60,
+    "continue_chronicle": 60,
+    "generate_story_beat": 60,
+    "generate_epic_review": 120
+}
+TASK_REPLY_TOKENS = {  # Expected answer length, charged to the token budget until the real usage is known
+    "default": 200,
+    "generate_all_faction_responses": 800,
+    "create_chronicle": 400,
+    "continue_chronicle": 500,
+    "generate_epic_review": 1500
+}
+
+# Game server (python -m kingdom serve): many reigns over HTTP sharing one AsyncKingdomAI
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8080
+SERVER_MAX_SESSIONS = 500  # Live reigns before new ones are refused
+SERVER_TURN_WORKERS = 32  # Threads running turns; each waits on the event loop for its LLM calls
+SERVER_MAX_BODY = 64 * 1024  # Largest request body accepted, in bytes
+SERVER_IDLE_SECONDS = 30 * 60  # A saved reign untouched this long is dropped from memory (reopened when asked for)
+SERVER_SWEEP_SECONDS = 60  # How often idle reigns are looked for
+
+# Telemetry: a span per LLM call and per turn stage (see telemetry.py)
+TELEMETRY_ENABLED = True  # Aggregate spans in memory for the per-game summary
+TELEMETRY_JSONL_PATH = None  # Also append every span to this JSONL file
+TELEMETRY_PROMETHEUS_PATH = None  # Write Prometheus-format metrics here when the game ends
+
+# Resilience: every LLM call is bounded and never leaves the game without an answer
+LLM_TIMEOUTS = {  # Seconds one request may take before it is abandoned
+    "default": 20,
+    "generate_faction_response": 15,
+    "analyze_sentiment": 10,
+    "classify_kingdom_state": 10,
+    "generate_all_faction_responses": 40,
+    "generate_epic_review": 90
+}
+LLM_MAX_RETRIES = 2  # Retries after a failed or timed-out attempt
+LLM_BACKOFF_BASE = 0.5  # Seconds; the backoff ceiling doubles with every retry
+LLM_BACKOFF_MAX = 8.0  # Longest backoff between two attempts
+LLM_RATE_LIMIT_MAX_WAIT = 30.0  # Longest Retry-After we are willing to honour
+LLM_ATTEMPT_WORKERS = 32  # Threads running sync requests so slow ones can be abandoned
+HEDGED_TASKS = ("generate_faction_response",)  # Tasks that send a duplicate request when the first is slow
+HEDGE_AFTER = 4.0  # Seconds before hedging, until the task's observed p95 latency takes over
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failed requests that open the circuit
+CIRCUIT_RESET_SECONDS = 30  # Seconds the circuit stays open before a trial request
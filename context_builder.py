@@ -0,0 +1,234 @@
+"""
+Context Builder for The Evolving Kingdom
+Packs game state into LLM prompts under a token budget: estimates token
+counts, ranks and compresses memories, and degrades the epic review context
+step by step until it fits
+"""
+
+import json
+import math
+from config import CHARS_PER_TOKEN, MEMORY_QUOTE_CHARS
+from models import to_json
+
+ELLIPSIS = " [...] "
+
+def estimate_tokens(text):
+    """Rough token count (OpenAI models average about four characters per token)"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def compact_json(data):
+    """JSON without indentation or padding; roughly a third smaller than indent=2"""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=to_json)
+
+def truncate_text(text, max_chars):
+    """Shorten text to at most max_chars, marking the cut"""
+    if text is None or len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 3)].rstrip() + "..."
+
+def clamp_prompt(system_prompt, user_prompt, max_tokens):
+    """
+    Hard limit on a request's size
+    Cuts the middle of the user prompt so the instructions at both ends survive
+    """
+    budget_chars = (max_tokens - estimate_tokens(system_prompt)) * CHARS_PER_TOKEN
+    if len(user_prompt) <= budget_chars:
+        return user_prompt
+    if budget_chars <= len(ELLIPSIS):
+        return user_prompt[:max(0, budget_chars)]  # No room to mark the cut
+    keep = budget_chars - len(ELLIPSIS)
+    head = keep * 2 // 3
+    tail = keep - head
+    return user_prompt[:head] + ELLIPSIS + (user_prompt[-tail:] if tail else "")
+
+# ==================== MEMORY ====================
+def compress_memory_entry(entry, quote_chars=MEMORY_QUOTE_CHARS):
+    """Drop empty fields and shorten the quoted response of a memory entry"""
+    compact = {k: v for k, v in entry.items() if v is not None}
+    if "response" in compact:
+        compact["response"] = truncate_text(compact["response"], quote_chars)
+    if "intensity" in compact:
+        compact["intensity"] = round(compact["intensity"], 2)
+    return compact
+
+def merge_memory_by_turn(memory):
+    """
+    Fold a faction's memory into one record per turn
+    update_faction_trust and add_faction_memory each append an entry per turn,
+    and both repeat the turn and decision; warm-tier records are already merged
+    """
+    merged = {}
+    for entry in memory:
+        record = merged.setdefault(entry.get("turn"), {"turn": entry.get("turn")})
+        if "reason" in entry:
+            record["trust_change"] = record.get("trust_change", 0) + entry["trust_change"]
+            record["new_trust"] = entry.get("new_trust")
+            record.setdefault("decision", entry.get("reason"))
+        else:
+            for key, value in entry.items():
+                if key != "turn":
+                    record[key] = value
+    return list(merged.values())
+
+def rank_memory(memory, limit, quote_chars=MEMORY_QUOTE_CHARS):
+    """
+    The most telling per-turn memories, in chronological order
+    Strong reactions and big trust swings outrank recency alone
+    """
+    records = merge_memory_by_turn(memory)
+    count = len(records)
+    
+    def weight(item):
+        index, record = item
+        recency = (index + 1) / count
+        swing = abs(record.get("trust_change", 0)) / 15
+        intensity = record.get("intensity", 0) if record.get("sentiment") != "neutral" else 0
+        return recency + swing + intensity
+    
+    chosen = sorted(enumerate(records), key=weight, reverse=True)[:limit]
+    return [compress_memory_entry(record, quote_chars) for _, record in sorted(chosen, key=lambda item: item[0])]
+
+def compress_turns(turns_data, quote_chars=MEMORY_QUOTE_CHARS):
+    """Turn records with shortened responses and only the sentiment label and intensity"""
+    compressed = []
+    for turn in turns_data:
+        if "responses" not in turn:
+            compressed.append(turn)
+            continue
+        responses = {}
+        for faction_id, data in turn.get("responses", {}).items():
+            sentiment = data.get("sentiment") or {}
+            responses[faction_id] = {
+                "response": truncate_text(data.get("response"), quote_chars),
+                "sentiment": sentiment.get("sentiment"),
+                "intensity": round(sentiment.get("intensity", 0), 2),
+                "trust_change": data.get("trust_change", 0)
+            }
+        compressed.append(dict(turn, responses=responses))
+    return compressed
+
+def chronicle_delta(turns_data, key_quotes=2, quote_chars=MEMORY_QUOTE_CHARS):
+    """
+    What changed over some turns, without the full responses: each turn's decision,
+    every faction's sentiment and trust change, and only the most striking quotes
+    """
+    turns = []
+    quotes = []
+    for turn in turns_data:
+        reactions = {}
+        for faction_id, data in turn.get("responses", {}).items():
+            sentiment = data.get("sentiment") or {}
+            reactions[faction_id] = f"{sentiment.get('sentiment', 'neutral')} {data.get('trust_change', 0):+d}"
+            if data.get("response"):
+                strength = (abs(data.get("trust_change", 0)), sentiment.get("intensity", 0))
+                quotes.append((strength, turn.get("turn"), faction_id, data["response"]))
+        turns.append({"turn": turn.get("turn"), "decision": turn.get("decision"), "reactions": reactions})
+    
+    quotes.sort(key=lambda quote: quote[0], reverse=True)
+    return {
+        "turns": turns,
+        "key_quotes": [
+            {"turn": turn, "faction": faction_id, "quote": truncate_text(text, quote_chars)}
+            for _, turn, faction_id, text in sorted(quotes[:key_quotes], key=lambda quote: quote[1])
+        ]
+    }
+
+def keep_latest(text, max_chars):
+    """Shorten text to at most max_chars by dropping its beginning"""
+    if text is None or len(text) <= max_chars:
+        return text
+    return "..." + text[len(text) - max(0, max_chars - 3):].lstrip()
+
+# ==================== EPIC REVIEW ====================
+# Successively cheaper ways to describe a reign; the first one that fits is used
+REVIEW_LEVELS = [
+    {"quotes": 3, "quote_chars": 240, "chronicles": None, "turn_detail": True},
+    {"quotes": 2, "quote_chars": 160, "chronicles": None, "turn_detail": True},
+    {"quotes": 2, "quote_chars": 120, "chronicles": 8, "turn_detail": False},
+    {"quotes": 1, "quote_chars": 100, "chronicles": 4, "turn_detail": False},
+    {"quotes": 1, "quote_chars": 80, "chronicles": 2, "turn_detail": False, "last_turns": 20, "history": 6},
+    {"quotes": 0, "quote_chars": 0, "chronicles": 1, "turn_detail": False, "last_turns": 8, "history": 2},
+]
+SUMMARIZED_CHRONICLES = 4  # Chronicles kept next to a reign summary, which already tells the older ones
+
+def _review_context(state, level):
+    history = level.get("history")
+    
+    def recent(entries):
+        return entries[-history:] if history else entries
+    
+    factions = {}
+    for faction_id, faction in state["factions"].items():
+        factions[faction_id] = {
+            "name": faction["name"],
+            "base_personality": faction["base_personality"],
+            "current_personality": faction["current_personality"],
+            "trust": faction["trust_score"],
+            "evolution": [
+                {"turn": e["turn"], "from": e["old"], "to": e["new"], "why": truncate_text(e["reason"], 160)}
+                for e in recent(faction.get("personality_evolution_log", []))
+            ],
+            "earlier": [
+                {"turns": f"{c['from_turn']}-{c['to_turn']}", "net_trust": c["net_trust"], "sentiments": c["sentiments"]}
+                for c in recent(faction.get("memory_cold", []))
+            ]
+        }
+        if level["quotes"]:
+            # Every tier can supply quotes: raw and warm entries, and each cold summary's key moment
+            memory = faction.get("memory_warm", []) + faction.get("memory", [])
+            memory += [c["key_moment"] for c in faction.get("memory_cold", [])]
+            quoted = [m for m in memory if m.get("response")]
+            quoted.sort(key=lambda m: m.get("intensity", 0), reverse=True)
+            factions[faction_id]["key_quotes"] = [
+                {"turn": m["turn"], "quote": truncate_text(m["response"], level["quote_chars"])}
+                for m in sorted(quoted[:level["quotes"]], key=lambda m: m["turn"])
+            ]
+    
+    turns = state.get("turn_history", [])
+    if level.get("last_turns"):
+        turns = turns[-level["last_turns"]:]
+    timeline = []
+    for turn in turns:
+        entry = {"turn": turn.get("turn"), "decision": turn.get("decision")}
+        responses = turn.get("responses", {})
+        if level["turn_detail"]:
+            entry["reactions"] = {
+                fid: f"{(r.get('sentiment') or {}).get('sentiment', 'neutral')} {r.get('trust_change', 0):+d}"
+                for fid, r in responses.items()
+            }
+        else:
+            entry["net_trust"] = sum(r.get("trust_change", 0) for r in responses.values())
+        timeline.append(entry)
+    
+    chronicles = state.get("kingdom_chronicles", [])
+    reign_summary = (state.get("reign_summary") or {}).get("summary")
+    limit = level["chronicles"]
+    if reign_summary:
+        limit = min(limit or SUMMARIZED_CHRONICLES, SUMMARIZED_CHRONICLES)
+    if limit is not None:
+        chronicles = chronicles[-limit:]
+    
+    context = {
+        "player_name": state.get("player_name"),
+        "turns_played": len(state.get("turn_history", [])),
+        "factions": factions,
+        "timeline": timeline,
+        "reign_so_far": reign_summary,
+        "chronicles": [{"turns": c["turns"], "chronicle": c["chronicle"]} for c in chronicles],
+        "story_beats": [{"turn": b["turn"], "beat": b["beat"]} for b in state.get("story_beats", [])[-6:]],
+        "kingdom_states": [{"turn": k["turn"], "state": k["state"]} for k in recent(state.get("kingdom_state_history", []))]
+    }
+    return context
+
+def build_review_context(state, max_tokens):
+    """
+    A compact, ranked view of the whole reign that fits in max_tokens
+    Returns compact JSON text
+    """
+    text = ""
+    for level in REVIEW_LEVELS:
+        text = compact_json(_review_context(state, level))
+        if estimate_tokens(text) <= max_tokens:
+            return text
+    # Even the leanest view is too large; the caller's clamp trims the rest
+    return text
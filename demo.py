@@ -1,11 +1,13 @@
 """
 Example playthrough to demonstrate the game's features
 Run this to see how the game works without playing manually
+Pass --async to see all four factions answer at once through AsyncKingdomAI
 """
 
+import asyncio
 from config import FACTIONS
 from game_state import GameState
-from openai_client import KingdomAI
+from openai_client import KingdomAI, AsyncKingdomAI
 
 def demonstrate_self_digestion():
     """
@@ -130,8 +132,50 @@ def demonstrate_self_digestion():
     print("To play the full game: python main.py")
     print()
 
+async def demonstrate_async_client():
+    """
+    Demonstrates the async client: every faction responds concurrently
+    All requests share one pooled HTTP session on a single event loop
+    """
+    
+    print("=" * 70)
+    print("THE EVOLVING KINGDOM - ASYNC CLIENT DEMONSTRATION")
+    print("=" * 70)
+    print()
+    
+    gs = GameState("demo_state.json")
+    gs.initialize_new_game("Demo Player")
+    ai = AsyncKingdomAI()
+    
+    decision = "Raise taxes to fund a grand festival"
+    context = gs.get_game_context()
+    
+    async def respond(faction_id):
+        faction_data = gs.get_faction_data(faction_id)
+        response = await ai.generate_faction_response(faction_data, decision, context)
+        sentiment = await ai.analyze_sentiment(response)
+        return faction_id, response, sentiment
+    
+    print(f"Decision: {decision}")
+    print(f"Asking all {len(FACTIONS)} factions at once...")
+    print()
+    
+    results = await asyncio.gather(*(respond(faction_id) for faction_id in FACTIONS))
+    
+    # gather keeps submission order, so results are committed in faction order
+    for faction_id, response, sentiment in results:
+        print(f"{FACTIONS[faction_id]['icon']} {FACTIONS[faction_id]['name']}: \"{response}\"")
+        print(f"   Sentiment: {sentiment['sentiment']} (intensity: {sentiment['intensity']:.2f})")
+        print()
+        gs.add_faction_memory(faction_id, decision, response, sentiment)
+    
+    await ai.aclose()
+    print("✅ All responses saved to demo_state.json")
+    print()
+
 if __name__ == "__main__":
     import os
+    import sys
     from dotenv import load_dotenv
     
     load_dotenv()
@@ -139,5 +183,7 @@ if __name__ == "__main__":
     if not os.getenv("OPENAI_API_KEY"):
         print("ERROR: OPENAI_API_KEY not found in .env file")
         print("Please create a .env file and add your API key")
+    elif "--async" in sys.argv:
+        asyncio.run(demonstrate_async_client())
     else:
         demonstrate_self_digestion()
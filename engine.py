@@ -0,0 +1,638 @@
+"""
+Turn Engine for The Evolving Kingdom
+The game's turn logic without terminal I/O: the interactive game, the
+headless simulator and anything else that drives a reign share it
+"""
+
+import copy
+import queue
+import asyncio
+import contextvars
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import (
+    TOTAL_TURNS, DECISION_CATEGORIES, MAX_PARALLEL_FACTIONS,
+    BATCH_FACTION_GENERATION, BATCH_INCLUDES_SENTIMENT, STREAM_FACTION_RESPONSES, INCREMENTAL_CHRONICLE,
+    SPECULATIVE_GENERATION, SPECULATION_TOKEN_BUDGET, OVERLAP_CLASSIFICATION, BACKGROUND_POST_TURN,
+    POST_TURN_STALE_READS
+)
+from telemetry import span_context, current_context, in_context
+
+# Predefined interesting decisions
+DECISION_OPTIONS = {
+    1: [
+        "Raise taxes to fund a grand festival",
+        "Lower taxes to win the people's favor",
+        "Keep taxes the same but audit the wealthy"
+    ],
+    2: [
+        "Conscript commoners for border defense",
+        "Hire expensive mercenaries instead",
+        "Negotiate a peace treaty with neighbors"
+    ],
+    3: [
+        "Build a grand cathedral",
+        "Build markets and trade roads",
+        "Build fortifications and walls"
+    ],
+    4: [
+        "Execute a corrupt noble as an example",
+        "Exile the noble but seize their lands",
+        "Pardon the noble for a large fine"
+    ],
+    5: [
+        "Host a diplomatic summit with rival kingdoms",
+        "Declare neutrality and isolate the kingdom",
+        "Form a military alliance with a powerful neighbor"
+    ],
+    6: [
+        "Fund new irrigation projects for farms",
+        "Invest in merchant shipping ventures",
+        "Build a royal academy of learning"
+    ],
+    7: [
+        "Declare a week-long tournament and feast",
+        "Commission epic poetry about your reign",
+        "Ban public celebrations to save resources"
+    ],
+    8: [
+        "A plague outbreak - quarantine the city",
+        "A plague outbreak - pray and trust in faith",
+        "A plague outbreak - evacuate to the countryside"
+    ]
+}
+
+DEFAULT_OPTIONS = [
+    "Make a conservative, safe decision",
+    "Make a bold, risky decision",
+    "Delegate the decision to advisors"
+]
+
+def decision_options(turn):
+    """Decision options for a turn"""
+    return DECISION_OPTIONS.get(turn, DEFAULT_OPTIONS)
+
+def decision_category(turn):
+    """Decision category for a turn (for variety in gameplay)"""
+    return DECISION_CATEGORIES[(turn - 1) % len(DECISION_CATEGORIES)]
+
+def trust_delta_for(sentiment):
+    """Trust change caused by a faction's sentiment"""
+    if sentiment["sentiment"] == "positive":
+        return int(sentiment["intensity"] * 15)
+    if sentiment["sentiment"] == "negative":
+        return -int(sentiment["intensity"] * 15)
+    return 0
+
+class TurnObserver:
+    """
+    Hooks KingdomEngine calls as a turn unfolds
+    All of them do nothing here; the terminal game overrides them to render the turn
+    """
+    
+    def faction_started(self, faction_id, faction_data):
+        """A faction's response is about to be awaited"""
+    
+    def faction_streamed(self, faction_id, faction_data, chunk):
+        """Part of a faction's response has arrived (when responses are streamed)"""
+    
+    def faction_responded(self, faction_id, faction_data, response, sentiment, trust_delta):
+        """A faction's response has been analyzed and committed"""
+    
+    def chronicle_started(self, turn_range):
+        """The chronicler is about to summarize recent turns"""
+    
+    def chronicle_written(self, turn_range, chronicle):
+        """A chronicle has been added"""
+    
+    def personalities_evolving(self):
+        """Personality evolution is starting"""
+    
+    def personality_evolved(self, faction_id, faction_data, old_personality, evolution):
+        """A faction's personality changed"""
+    
+    def personalities_evolved(self):
+        """Personality evolution has finished (outside the timed stage, so it may wait for the player)"""
+    
+    def kingdom_classified(self, classification):
+        """The kingdom's overall state has been classified"""
+    
+    def story_beat_added(self, trigger, beat):
+        """A dramatic story beat was generated"""
+
+class Speculation:
+    """
+    Faction responses generated for a turn's options before the player has chosen
+    Only the chosen branch is ever committed; the others are cancelled and discarded
+    """
+    
+    def __init__(self, turn, branches, estimated_tokens):
+        self.turn = turn  # current_turn of the game state the branches were generated from
+        self.branches = branches  # decision -> {faction_id: future of (response, sentiment)}
+        self.estimated_tokens = estimated_tokens
+    
+    def take(self, decision, turn):
+        """
+        The chosen decision's chains, or None if it was not speculated (or the state has moved on)
+        Every other branch is cancelled; requests already running finish and are ignored
+        """
+        chosen = self.branches.pop(decision, None) if turn == self.turn else None
+        self.discard()
+        return chosen
+    
+    def discard(self):
+        """Cancel every remaining branch"""
+        for chains in self.branches.values():
+            for chain in chains.values():
+                chain.cancel()
+        self.branches.clear()
+
+class PostTurn:
+    """
+    The work that follows a turn's faction responses, started but not yet committed
+    Each part is a future (None when the turn has no such work); the story beat is (trigger, future)
+    """
+    
+    def __init__(self, turn, observer, chronicle, evolutions, classification, story_beat):
+        self.turn = turn
+        self.observer = observer
+        self.chronicle = chronicle
+        self.evolutions = evolutions
+        self.classification = classification
+        self.story_beat = story_beat
+    
+    def done(self):
+        """Whether every part has finished, so committing it will not wait"""
+        futures = [self.chronicle, self.classification, self.story_beat and self.story_beat[1]]
+        futures += list((self.evolutions or {}).values())
+        return all(future.done() for future in futures if future)
+
+class KingdomEngine:
+    """Runs turns of a reign against a GameState and a KingdomAI (sync or async)"""
+    
+    def __init__(self, game_state, ai, total_turns=TOTAL_TURNS, pool=None, loop=None, tracer=None,
+                 speculative=None, streaming=None, overlap_classification=None, background_post_turn=None,
+                 stale_reads=None):
+        self.game_state = game_state
+        self.ai = ai
+        self.total_turns = total_turns
+        self.owns_pool = pool is None  # A pool passed in is shared, and left running by close()
+        self.pool = pool if pool is not None else ThreadPoolExecutor(max_workers=MAX_PARALLEL_FACTIONS)
+        self.loop = loop  # Event loop running AsyncKingdomAI calls, if the async client is used
+        # Stage spans go to the client's tracer unless told otherwise
+        self.tracer = tracer if tracer is not None else getattr(ai, "tracer", None)
+        self.speculative = SPECULATIVE_GENERATION if speculative is None else speculative
+        self.streaming = STREAM_FACTION_RESPONSES if streaming is None else streaming
+        self.incremental_chronicle = INCREMENTAL_CHRONICLE
+        self.overlap_classification = OVERLAP_CLASSIFICATION if overlap_classification is None else overlap_classification
+        self.background_post_turn = BACKGROUND_POST_TURN if background_post_turn is None else background_post_turn
+        self.stale_reads = POST_TURN_STALE_READS if stale_reads is None else stale_reads
+        self.post_turn = None  # PostTurn still running in the background, committed by finish_post_turn()
+        # Waits on the post-turn requests off the game thread, outside the pool that runs them
+        self.post_turn_pool = ThreadPoolExecutor(max_workers=1)
+    
+    def close(self, wait=True):
+        """Shut down the engine's threads; post-turn work still pending is abandoned"""
+        self.post_turn_pool.shutdown(wait=wait, cancel_futures=True)
+        if self.owns_pool:
+            self.pool.shutdown(wait=wait)
+    
+    def stage(self, name):
+        """Time a stage of the turn for telemetry"""
+        return self.tracer.stage(name) if self.tracer else nullcontext()
+    
+    def run_on_loop(self, coro, **fields):
+        """Schedule a coroutine on the event loop, carrying the span context over"""
+        return asyncio.run_coroutine_threadsafe(in_context(dict(current_context(), **fields), coro), self.loop)
+    
+    def run_in_pool(self, fn, *args):
+        """Run fn in the worker pool, carrying the span context over"""
+        return self.pool.submit(contextvars.copy_context().run, fn, *args)
+    
+    def wait_for(self, result):
+        """Resolve an AI call, waiting on the event loop when the async client returned a coroutine"""
+        if asyncio.iscoroutine(result):
+            return self.run_on_loop(result).result()
+        return result
+    
+    def submit_call(self, fn, *args, **fields):
+        """Start an AI call without waiting for it (fields tag its spans); returns a future"""
+        if self.loop is not None:
+            return self.run_on_loop(fn(*args), **fields)
+        with span_context(**fields):
+            return self.run_in_pool(fn, *args)
+    
+    # ==================== FACTION RESPONSES ====================
+    def submit_faction_chains(self, decision, game_context, factions=None, streams=None):
+        """
+        Start every faction's generate -> sentiment chain (factions defaults to the live game state)
+        streams maps faction_id -> queue receiving that response as it is generated (not batched)
+        Returns {faction_id: future of (response, sentiment)}
+        """
+        factions = dict(factions if factions is not None else self.game_state.get_all_factions())
+        if not BATCH_FACTION_GENERATION:
+            return {
+                faction_id: self.submit_faction_chain(
+                    faction_data, decision, game_context, streams.get(faction_id) if streams else None
+                )
+                for faction_id, faction_data in factions.items()
+            }
+        
+        # One request answers for every faction; fan its result out to per-faction futures
+        if self.loop is not None:
+            batch = self.run_on_loop(
+                self.ai.generate_all_faction_responses(factions, decision, game_context, BATCH_INCLUDES_SENTIMENT)
+            )
+        else:
+            batch = self.run_in_pool(
+                self.ai.generate_all_faction_responses,
+                factions, decision, game_context, BATCH_INCLUDES_SENTIMENT
+            )
+        chains = {faction_id: Future() for faction_id in factions}
+        
+        def fan_out(done):
+            if done.cancelled():
+                return
+            error = done.exception()
+            for faction_id, chain in chains.items():
+                if chain.cancelled():
+                    continue
+                if error is not None:
+                    chain.set_exception(error)
+                else:
+                    chain.set_result(done.result()[faction_id])
+        
+        def cancel_batch(chain):
+            # The request is only worth abandoning once no faction is waiting on it
+            if chain.cancelled() and all(other.cancelled() for other in chains.values()):
+                batch.cancel()
+        
+        for chain in chains.values():
+            chain.add_done_callback(cancel_batch)
+        batch.add_done_callback(fan_out)
+        return chains
+    
+    def submit_faction_chain(self, faction_data, decision, game_context, stream=None):
+        """Start a faction's generate -> sentiment chain; returns a future"""
+        if self.loop is not None:
+            return self.run_on_loop(
+                self.run_faction_chain_async(faction_data, decision, game_context, stream),
+                faction=faction_data["id"]
+            )
+        return self.run_in_pool(self.run_faction_chain, faction_data, decision, game_context, stream)
+    
+    def run_faction_chain(self, faction_data, decision, game_context, stream=None):
+        """
+        Generate a faction's response and analyze its sentiment
+        With a stream (a queue), the response is put on it chunk by chunk, then None
+        Runs in a worker thread, so it must not touch the game state
+        """
+        with span_context(faction=faction_data["id"]):
+            # LLM generates response based on current personality and memory
+            if stream is None:
+                response = self.ai.generate_faction_response(faction_data, decision, game_context)
+            else:
+                chunks = []
+                try:
+                    for chunk in self.ai.stream_faction_response(faction_data, decision, game_context):
+                        chunks.append(chunk)
+                        stream.put(chunk)
+                finally:
+                    stream.put(None)  # Complete (or failed): the reader stops here
+                response = "".join(chunks)
+            # Sentiment needs the whole response
+            sentiment = self.ai.analyze_sentiment(response)
+        return response, sentiment
+    
+    async def run_faction_chain_async(self, faction_data, decision, game_context, stream=None):
+        """Async variant of run_faction_chain for AsyncKingdomAI"""
+        if stream is None:
+            response = await self.ai.generate_faction_response(faction_data, decision, game_context)
+        else:
+            chunks = []
+            try:
+                async for chunk in self.ai.stream_faction_response(faction_data, decision, game_context):
+                    chunks.append(chunk)
+                    stream.put(chunk)
+            finally:
+                stream.put(None)
+            response = "".join(chunks)
+        sentiment = await self.ai.analyze_sentiment(response)
+        return response, sentiment
+    
+    def apply_faction_result(self, turn_data, faction_id, decision, response, sentiment):
+        """Commit a faction's trust and memory updates; returns the trust change"""
+        # STEP 3: Update trust based on sentiment
+        trust_delta = trust_delta_for(sentiment)
+        if trust_delta != 0:
+            self.game_state.update_faction_trust(faction_id, trust_delta, decision)
+        
+        # Store response in game state (for LLM to read later)
+        self.game_state.add_faction_memory(faction_id, decision, response, sentiment)
+        
+        turn_data["responses"][faction_id] = {
+            "response": response,
+            "sentiment": sentiment,
+            "trust_change": trust_delta
+        }
+        return trust_delta
+    
+    # ==================== SPECULATION ====================
+    def speculate(self, turn, options, budget=None):
+        """
+        Start generating faction responses for every option while the player decides
+        Options are taken in order while their estimated cost fits in budget tokens
+        (SPECULATION_TOKEN_BUDGET); the rest are generated once chosen, as usual
+        Returns a Speculation to hand to play_turn, or None when speculation is off
+        """
+        if not self.speculative:
+            return None
+        budget = SPECULATION_TOKEN_BUDGET if budget is None else budget
+        # Branches answer from the last turn's evolved personalities, as play_turn's would
+        if not self.stale_reads:
+            self.finish_post_turn()
+        
+        # Branches read a snapshot, so committing the chosen one cannot race with the others
+        factions = copy.deepcopy(self.game_state.get_all_factions())
+        game_context = self.game_state.get_game_context()
+        branches = {}
+        spent = 0
+        with span_context(turn=turn, speculative=True):
+            for decision in options:
+                cost = self.ai.faction_responses_cost(factions, decision, game_context, BATCH_FACTION_GENERATION)
+                if spent + cost > budget:
+                    break
+                spent += cost
+                branches[decision] = self.submit_faction_chains(decision, game_context, factions)
+        return Speculation(self.game_state.state["current_turn"], branches, spent)
+    
+    # ==================== TURN ====================
+    def play_turn(self, turn, decision, observer=None, speculation=None):
+        """
+        Process a turn - this is where the magic happens!
+        The LLM generates responses, analyzes them, and updates state
+        With a Speculation from speculate(), the chosen option's responses may already be done
+        Returns the turn record
+        """
+        observer = observer or TurnObserver()
+        
+        # Barrier: the factions answer from the last turn's evolved personalities and chronicle,
+        # unless stale reads let them start from the ones before (see below)
+        if not self.stale_reads:
+            self.finish_post_turn()
+        
+        # All state mutations of the turn are written to disk once, at the end of the batch
+        with span_context(turn=turn), self.game_state.batch():
+            turn_data = {
+                "turn": turn,
+                "decision": decision,
+                "responses": {}
+            }
+            
+            game_context = self.game_state.get_game_context()
+            
+            # STEP 1 & 2: Generate responses and analyze sentiment (LLM Tasks: Generation, Sentiment Analysis)
+            # Each faction's chain runs concurrently; results are consumed in faction order below
+            with self.stage("faction_responses"):
+                chains = speculation.take(decision, self.game_state.state["current_turn"]) if speculation else None
+                streams = None
+                if chains is None:
+                    # A batched request answers in one JSON document, which cannot be shown as it streams
+                    if self.streaming and not BATCH_FACTION_GENERATION:
+                        streams = {faction_id: queue.Queue() for faction_id in self.game_state.get_all_factions()}
+                    # With stale reads pending, the chains read a snapshot the commit below cannot change
+                    factions = copy.deepcopy(self.game_state.get_all_factions()) if self.post_turn else None
+                    chains = self.submit_faction_chains(decision, game_context, factions, streams)
+                
+                # Stale reads: the last turn's work is committed while the factions answer
+                self.finish_post_turn()
+                
+                for faction_id in chains:
+                    faction_data = self.game_state.get_faction_data(faction_id)
+                    observer.faction_started(faction_id, faction_data)
+                    
+                    if streams is not None:
+                        # Later factions keep generating meanwhile; their chunks wait in their queues
+                        for chunk in iter(streams[faction_id].get, None):
+                            observer.faction_streamed(faction_id, faction_data, chunk)
+                    
+                    response, sentiment = chains[faction_id].result()
+                    trust_delta = self.apply_faction_result(turn_data, faction_id, decision, response, sentiment)
+                    observer.faction_responded(faction_id, faction_data, response, sentiment, trust_delta)
+            
+            # STEP 4: Save turn data
+            self.game_state.add_turn_record(turn_data)
+            
+            # STEPS 5-7: Chronicle, personality evolution, classification and story beat
+            # In the background they run while the player reads on, until finish_post_turn()
+            post_turn = self.submit_post_turn(turn, game_context, observer)
+            if self.background_post_turn:
+                self.post_turn = post_turn
+            else:
+                self.commit_post_turn(post_turn)
+            
+            with self.stage("save"):
+                self.game_state.flush()
+        
+        return turn_data
+    
+    # ==================== POST-TURN ====================
+    def submit_post_turn(self, turn, game_context, observer):
+        """
+        Start the work that follows a turn's faction responses, committing none of it
+        Every 2 turns: a chronicle and personality evolutions (not after the last turn) and a
+        classification; a story beat whenever average trust crosses a dramatic threshold
+        """
+        chronicle = evolutions = classification = None
+        if turn % 2 == 0 and turn < self.total_turns:
+            # Neither reads what the other writes, so every request starts at once
+            chronicle = self.submit_chronicle(turn)
+            evolutions = self.submit_evolutions()
+        if turn % 2 == 0:
+            if self.overlap_classification:
+                # Classifies the state from before this turn's chronicle and evolution
+                classification = self.submit_classification()
+            elif self.background_post_turn:
+                classification = self.submit_projected_classification(chronicle, evolutions)
+            # Otherwise it is classified from the live state once they are committed
+        story_beat = self.submit_story_beat(turn, game_context)
+        return PostTurn(turn, observer, chronicle, evolutions, classification, story_beat)
+    
+    def commit_post_turn(self, post_turn):
+        """
+        Wait for a turn's post-turn work and commit it in a fixed order: chronicle,
+        factions in order, classification, story beat (rendered through the turn's observer)
+        """
+        observer = post_turn.observer
+        with span_context(turn=post_turn.turn), self.game_state.batch():
+            if post_turn.chronicle is not None:
+                with self.stage("chronicle"):
+                    self.commit_chronicle(post_turn.turn, post_turn.chronicle, observer)
+                with self.stage("personality_evolution"):
+                    self.commit_evolutions(post_turn.evolutions, observer)
+                observer.personalities_evolved()
+            
+            if post_turn.turn % 2 == 0:
+                with self.stage("classification"):
+                    self.classify_kingdom(observer, post_turn.classification)
+            
+            with self.stage("story_beat"):
+                self.commit_story_beat(post_turn.story_beat, observer)
+    
+    def finish_post_turn(self, wait=True):
+        """
+        Commit the last turn's background work, if any is pending
+        With wait=False it is only committed if it has already finished
+        Returns whether nothing is left pending
+        """
+        post_turn = self.post_turn
+        if post_turn is None:
+            return True
+        if not wait and not post_turn.done():
+            return False
+        self.post_turn = None
+        self.commit_post_turn(post_turn)
+        return True
+    
+    def create_chronicle(self, turn, observer):
+        """
+        Create a chronicle summarizing recent turns
+        This is LLM Task: Summarization (digesting its own outputs)
+        """
+        return self.commit_chronicle(turn, self.submit_chronicle(turn), observer)
+    
+    def submit_chronicle(self, turn):
+        """Start writing the chronicle of the last two turns; returns a future"""
+        turn_range = (turn - 1, turn)
+        recent_turns = self.game_state.get_recent_turns(2)
+        if self.incremental_chronicle:
+            # Only the previous chronicle, the reign summary and a compact delta are sent
+            return self.submit_call(
+                self.ai.continue_chronicle,
+                self.game_state.get_latest_chronicle(), self.game_state.get_reign_summary(), recent_turns, turn_range
+            )
+        return self.submit_call(self.ai.create_chronicle, recent_turns, turn_range)
+    
+    def commit_chronicle(self, turn, future, observer):
+        """Wait for a submitted chronicle and add it (with the reign summary, when incremental)"""
+        turn_range = (turn - 1, turn)
+        observer.chronicle_started(turn_range)
+        
+        result = future.result()
+        if self.incremental_chronicle:
+            chronicle = result["chronicle"]
+            self.game_state.add_chronicle(turn_range, chronicle)
+            self.game_state.update_reign_summary(result["reign_summary"], turn)
+        else:
+            chronicle = result
+            self.game_state.add_chronicle(turn_range, chronicle)
+        
+        observer.chronicle_written(turn_range, chronicle)
+        return chronicle
+    
+    def evolve_personalities(self, turn, observer):
+        """
+        Evolve faction personalities based on accumulated experiences
+        This is LLM Task: Transformation (digesting its own outputs!)
+        """
+        self.commit_evolutions(self.submit_evolutions(), observer)
+    
+    def submit_evolutions(self):
+        """
+        Start every faction's personality evolution at once
+        Returns {faction_id: future of the evolution} for the factions with enough history
+        """
+        evolutions = {}
+        for faction_id, faction_data in self.game_state.get_all_factions().items():
+            recent_memory = faction_data["memory"][-4:]  # Last 4 interactions
+            
+            if len(recent_memory) >= 2:  # Need some history to evolve
+                if self.stale_reads:
+                    faction_data = copy.deepcopy(faction_data)  # The next turn may change it meanwhile
+                evolutions[faction_id] = self.submit_call(
+                    self.ai.evolve_personality, faction_data, recent_memory, faction=faction_id
+                )
+        return evolutions
+    
+    def commit_evolutions(self, evolutions, observer):
+        """Apply submitted evolutions in faction order, whatever order they finished in"""
+        observer.personalities_evolving()
+        
+        for faction_id, future in evolutions.items():
+            evolution = future.result()
+            faction_data = self.game_state.get_faction_data(faction_id)
+            old_personality = faction_data["current_personality"]
+            
+            if evolution["new_personality"] != old_personality:
+                self.game_state.update_faction_personality(
+                    faction_id,
+                    evolution["new_personality"],
+                    evolution["key_change"]
+                )
+                observer.personality_evolved(faction_id, faction_data, old_personality, evolution)
+    
+    def submit_classification(self):
+        """Start classifying the kingdom's current state; returns a future"""
+        return self.submit_call(self.ai.classify_kingdom_state, self.game_state.get_game_context())
+    
+    def submit_projected_classification(self, chronicle, evolutions):
+        """Start classifying the state as it will read once a submitted chronicle and evolutions are committed"""
+        return self.post_turn_pool.submit(
+            contextvars.copy_context().run, self.classify_projected,
+            self.game_state.get_game_context(), chronicle, evolutions
+        )
+    
+    def classify_projected(self, game_context, chronicle, evolutions):
+        """Wait for a chronicle and evolutions, then classify game_context as they will change it"""
+        if chronicle is not None:
+            result = chronicle.result()
+            game_context["latest_chronicle"] = result["chronicle"] if self.incremental_chronicle else result
+        for faction_id, future in (evolutions or {}).items():
+            game_context["faction_summary"][faction_id]["personality"] = future.result()["new_personality"]
+        return self.wait_for(self.ai.classify_kingdom_state(game_context))
+    
+    def classify_kingdom(self, observer, future=None):
+        """Classify the kingdom's overall state and record it (from a submitted classification if given)"""
+        classification = (future or self.submit_classification()).result()
+        self.game_state.add_kingdom_classification(classification)
+        
+        observer.kingdom_classified(classification)
+        return classification
+    
+    def check_story_beat(self, turn, game_context, observer):
+        """Generate a story beat when average trust crosses a dramatic threshold"""
+        return self.commit_story_beat(self.submit_story_beat(turn, game_context), observer)
+    
+    def submit_story_beat(self, turn, game_context):
+        """Start a story beat if average trust crosses a dramatic threshold; returns (trigger, future) or None"""
+        avg_trust = self.game_state.get_average_trust()
+        if avg_trust > 80 and turn > 3:
+            trigger = "high_trust"
+        elif avg_trust < 30:
+            trigger = "rebellion_risk"
+        else:
+            return None
+        return trigger, self.submit_call(self.ai.generate_story_beat, game_context, trigger)
+    
+    def commit_story_beat(self, story_beat, observer):
+        """Wait for a submitted story beat and add it"""
+        if story_beat is None:
+            return None
+        trigger, future = story_beat
+        beat = future.result()
+        self.game_state.add_story_beat(beat, trigger)
+        observer.story_beat_added(trigger, beat)
+        return beat
+    
+    def telemetry_summary(self, game=None):
+        """Where the game's turn time went (see MemorySink.summary), or None without telemetry"""
+        return self.tracer.summary(game) if self.tracer else None
+    
+    def final_review(self):
+        """
+        Generate the epic final review
+        This is where the LLM digests ALL of its previous outputs!
+        """
+        self.finish_post_turn()
+        full_state = self.game_state.get_full_state_for_review()
+        return self.wait_for(self.ai.generate_epic_review(full_state))
@@ -0,0 +1,104 @@
+"""
+Faction Memory Tiers for The Evolving Kingdom
+Keeps each faction's memory bounded however long a reign runs: a hot window
+of raw entries, a warm tier of compressed per-turn records, and a cold tier
+of summaries that records past the warm tier's last MEMORY_WARM_TURNS are folded into
+"""
+
+from config import MEMORY_HOT_TURNS, MEMORY_WARM_TURNS, MEMORY_COLD_SUMMARIES, MEMORY_WARM_QUOTE_CHARS
+from context_builder import merge_memory_by_turn, compress_memory_entry
+
+def empty_tiers():
+    """Tier fields of a new faction (memory itself is the hot tier)"""
+    return {
+        "memory_warm": [],  # One compressed record per turn, oldest first
+        "memory_cold": [],  # Summaries of older turn spans, oldest first
+        "memory_trimmed": 0  # Raw entries ever moved out of the hot tier
+    }
+
+def ensure_tiers(faction):
+    """Add the tier fields to a faction saved before they existed"""
+    for key, value in empty_tiers().items():
+        faction.setdefault(key, value)
+
+def memory_entries(faction):
+    """Warm per-turn records followed by the hot raw entries, oldest first"""
+    return faction.get("memory_warm", []) + faction["memory"]
+
+def memory_summaries(faction):
+    """Cold summaries of the turns before the warm tier, oldest first"""
+    return faction.get("memory_cold", [])
+
+def demote_hot(faction, hot_turns=None):
+    """
+    Move raw entries older than the last hot_turns turns into the warm tier,
+    folding what that pushes past the warm tier's cap into the cold tier
+    Entries are appended in turn order, so the demoted ones are always a prefix
+    """
+    hot_turns = MEMORY_HOT_TURNS if hot_turns is None else hot_turns
+    memory = faction["memory"]
+    turns = list(dict.fromkeys(entry.get("turn") for entry in memory))
+    if len(turns) <= hot_turns:
+        return
+    
+    ensure_tiers(faction)
+    demoted = set(turns[:len(turns) - hot_turns])
+    cut = 0
+    while cut < len(memory) and memory[cut].get("turn") in demoted:
+        cut += 1
+    faction["memory_warm"].extend(
+        compress_memory_entry(record, MEMORY_WARM_QUOTE_CHARS) for record in merge_memory_by_turn(memory[:cut])
+    )
+    faction["memory_trimmed"] += cut
+    del memory[:cut]
+    fold_warm(faction)
+
+def fold_warm(faction, warm_turns=None, cold_summaries=None):
+    """
+    Fold warm records beyond the last warm_turns into one cold summary
+    Past cold_summaries summaries, the two oldest are merged
+    """
+    warm_turns = MEMORY_WARM_TURNS if warm_turns is None else warm_turns
+    cold_summaries = max(1, MEMORY_COLD_SUMMARIES if cold_summaries is None else cold_summaries)
+    ensure_tiers(faction)
+    warm = faction["memory_warm"]
+    overflow = len(warm) - warm_turns
+    if overflow <= 0:
+        return
+    
+    cold = faction["memory_cold"]
+    cold.append(summarize_records(warm[:overflow]))
+    del warm[:overflow]
+    while len(cold) > cold_summaries:
+        cold[:2] = [merge_summaries(cold[0], cold[1])]
+
+def strength(record):
+    """How memorable a per-turn record is: trust swing first, then intensity"""
+    return abs(record.get("trust_change", 0)), record.get("intensity", 0)
+
+def summarize_records(records):
+    """A cold summary of consecutive per-turn records"""
+    sentiments = {}
+    for record in records:
+        if record.get("sentiment"):
+            sentiments[record["sentiment"]] = sentiments.get(record["sentiment"], 0) + 1
+    return {
+        "from_turn": records[0].get("turn"),
+        "to_turn": records[-1].get("turn"),
+        "net_trust": sum(record.get("trust_change", 0) for record in records),
+        "sentiments": sentiments,
+        "key_moment": max(records, key=strength)
+    }
+
+def merge_summaries(older, newer):
+    """One cold summary spanning two adjacent ones"""
+    sentiments = dict(older["sentiments"])
+    for sentiment, count in newer["sentiments"].items():
+        sentiments[sentiment] = sentiments.get(sentiment, 0) + count
+    return {
+        "from_turn": older["from_turn"],
+        "to_turn": newer["to_turn"],
+        "net_trust": older["net_trust"] + newer["net_trust"],
+        "sentiments": sentiments,
+        "key_moment": max(older["key_moment"], newer["key_moment"], key=strength)
+    }
@@ -1,22 +1,57 @@
 """
 Game State Management for The Evolving Kingdom
-Handles JSON persistence and world state tracking
+Handles persistence (through a pluggable store) and world state tracking
 """
 
-import json
-import os
+import functools
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from config import FACTIONS, INITIAL_FACTION_TRUST
+from config import FACTIONS, INITIAL_FACTION_TRUST, SAVE_FLUSH_INTERVAL
+from storage import create_store
+from faction_memory import empty_tiers, demote_hot
+from models import Faction, MemoryEntry, TurnRecord, adopt_state
+
+# The mutators _record() logs; replaying a saved log calls these and nothing else
+REPLAYABLE_OPS = frozenset({
+    "add_turn_record", "add_chronicle", "update_reign_summary", "update_faction_personality",
+    "update_faction_trust", "add_faction_memory", "add_story_beat", "add_kingdom_classification"
+})
+
+def synchronized(method):
+    """Run a GameState method under the state's lock, so a timed flush never writes half a change"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class GameState:
     """Manages the persistent game state with JSON serialization"""
     
-    def __init__(self, filename="game_state.json"):
+    def __init__(self, filename="game_state.json", flush_interval=None, store=None):
         self.filename = filename
         self.state = None
+        
+        # Every mutator records an event; the store decides how to persist them
+        self.store = store if store is not None else create_store(filename)
+        self._pending_events = []
+        self._replaying = False
+        
+        # Write coalescing: mutators mark the state dirty and writes are deferred
+        # inside batch() blocks or until flush_interval seconds have passed, when a timer writes them
+        self.flush_interval = SAVE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._dirty = False
+        self._batch_depth = 0
+        self._last_flush = 0.0
+        self._flush_timer = None
+        self._lock = threading.RLock()  # Held by mutators and writes; the flush timer writes from its own thread
+        self._trust_total = 0  # Sum of every faction's trust, kept up to date by update_faction_trust
     
-    def initialize_new_game(self, player_name):
-        """Create a fresh game state"""
+    @synchronized
+    def initialize_new_game(self, player_name, factions=None):
+        """Create a fresh game state (factions defaults to the FACTIONS roster in config.py)"""
         self.state = {
             "player_name": player_name,
             "current_turn": 1,
@@ -35,54 +70,144 @@ class GameState:
         }
         
         # Initialize all factions
-        for faction_id, faction_info in FACTIONS.items():
-            self.state["factions"][faction_id] = {
-                "id": faction_id,
-                "name": faction_info["name"],
-                "base_personality": faction_info["base_personality"],
-                "current_personality": faction_info["base_personality"],
-                "trust_score": INITIAL_FACTION_TRUST,
-                "memory": [],  # Will store LLM-generated responses
-                "personality_evolution_log": []  # Track how personality changes
-            }
+        for faction_id, faction_info in (factions or FACTIONS).items():
+            self.state["factions"][faction_id] = Faction(
+                id=faction_id,
+                name=faction_info["name"],
+                base_personality=faction_info["base_personality"],
+                current_personality=faction_info["base_personality"],
+                trust_score=INITIAL_FACTION_TRUST,
+                memory=[],  # Will store LLM-generated responses (the hot tier)
+                personality_evolution_log=[],  # Track how personality changes
+                **empty_tiers()  # Older memory, compressed and summarized
+            )
+        self._count_trust()
         
-        self.save()
+        self._cancel_flush_timer()
+        self.store.reset(self.state)
+        self._pending_events = []
+        self._dirty = False
+        self._last_flush = time.monotonic()
         return self.state
     
+    @synchronized
     def load(self):
-        """Load game state from JSON"""
-        if os.path.exists(self.filename):
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                self.state = json.load(f)
-            return True
-        return False
+        """Load game state from the store, replaying any logged events"""
+        state, events = self.store.load()
+        if state is None:
+            return False
+        
+        self.state = adopt_state(state)
+        self._count_trust()
+        self._replaying = True
+        try:
+            for event in events:
+                if event.get("op") not in REPLAYABLE_OPS:
+                    raise ValueError(f"Saved event log has an unknown operation: {event.get('op')!r}")
+                getattr(self, event["op"])(*event["args"])
+        finally:
+            self._replaying = False
+        self._pending_events = []
+        self._dirty = False
+        return True
     
+    @synchronized
     def save(self):
-        """Save game state to JSON"""
-        with open(self.filename, 'w', encoding='utf-8') as f:
-            json.dump(self.state, f, indent=2, ensure_ascii=False)
+        """Persist pending changes through the store"""
+        self._cancel_flush_timer()
+        self.store.commit(self.state, self._pending_events)
+        self._pending_events = []
+        self._dirty = False
+        self._last_flush = time.monotonic()
+    
+    @synchronized
+    def flush(self):
+        """Write pending changes to disk, if any"""
+        if self._dirty:
+            self.save()
+    
+    @contextmanager
+    def batch(self):
+        """
+        Collect all mutations made inside the block and write them once on exit
+        Blocks may be nested; only the outermost one writes
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush()
+    
+    def _record(self, op, *args):
+        """Log a mutation as a replayable event (the mutator's name and arguments)"""
+        if self._replaying:
+            return
+        self._pending_events.append({"op": op, "args": list(args)})
+        self._mark_dirty()
     
+    def _count_trust(self):
+        """Recompute the running trust total from scratch (after the factions were replaced)"""
+        self._trust_total = sum(faction.trust_score for faction in self.state["factions"].values())
+    
+    def _mark_dirty(self):
+        """Record a mutation; write now unless batched, else once the flush interval is up"""
+        self._dirty = True
+        if self._batch_depth:
+            return  # The batch writes on exit
+        waited = time.monotonic() - self._last_flush
+        if waited >= self.flush_interval:
+            self.save()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_interval - waited, self._flush_due)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    @synchronized
+    def _flush_due(self):
+        """The flush timer fired: write what is dirty, unless a batch will"""
+        self._flush_timer = None
+        if not self._batch_depth:
+            self.flush()
+    
+    def _cancel_flush_timer(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+    
+    @synchronized
     def add_turn_record(self, turn_data):
         """
         Add a turn's data to history
         This is what the LLM will read to generate future responses
         """
-        self.state["turn_history"].append(turn_data)
+        self.state["turn_history"].append(TurnRecord.from_dict(turn_data))
         self.state["current_turn"] += 1
-        self.save()
+        self._record("add_turn_record", turn_data)
     
-    def add_chronicle(self, turn_range, chronicle_text):
+    @synchronized
+    def add_chronicle(self, turn_range, chronicle_text, timestamp=None):
         """
         Add a chronicle summary (LLM-generated)
         Future LLM calls will read this instead of raw turn data
         """
+        if timestamp is None:
+            timestamp = datetime.now().isoformat()
         self.state["kingdom_chronicles"].append({
             "turns": f"{turn_range[0]}-{turn_range[1]}",
             "chronicle": chronicle_text,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": timestamp
         })
-        self.save()
+        self._record("add_chronicle", list(turn_range), chronicle_text, timestamp)
+    
+    @synchronized
+    def update_reign_summary(self, summary, through_turn):
+        """Replace the rolling summary of the reign so far (LLM-generated with each chronicle)"""
+        self.state["reign_summary"] = {"through_turn": through_turn, "summary": summary}
+        self._record("update_reign_summary", summary, through_turn)
     
+    @synchronized
     def update_faction_personality(self, faction_id, new_personality, reason):
         """
         Update a faction's personality (LLM transformation)
@@ -98,37 +223,44 @@ class GameState:
             "new": new_personality,
             "reason": reason
         })
-        self.save()
+        self._record("update_faction_personality", faction_id, new_personality, reason)
     
+    @synchronized
     def update_faction_trust(self, faction_id, delta, reason):
         """Update trust score based on sentiment analysis"""
         faction = self.state["factions"][faction_id]
-        faction["trust_score"] = max(0, min(100, faction["trust_score"] + delta))
+        old_trust = faction.trust_score
+        faction.trust_score = max(0, min(100, old_trust + delta))
+        self._trust_total += faction.trust_score - old_trust
         
         # Record in memory
-        faction["memory"].append({
-            "turn": self.state["current_turn"],
-            "trust_change": delta,
-            "reason": reason,
-            "new_trust": faction["trust_score"]
-        })
-        self.save()
+        faction.memory.append(MemoryEntry(
+            turn=self.state["current_turn"],
+            trust_change=delta,
+            reason=reason,
+            new_trust=faction.trust_score
+        ))
+        demote_hot(faction)
+        self._record("update_faction_trust", faction_id, delta, reason)
     
+    @synchronized
     def add_faction_memory(self, faction_id, decision, response, sentiment_data):
         """
         Add a memory entry for a faction
         Stores the LLM's own output for future reference
         """
         faction = self.state["factions"][faction_id]
-        faction["memory"].append({
-            "turn": self.state["current_turn"],
-            "decision": decision,
-            "response": response,
-            "sentiment": sentiment_data["sentiment"],
-            "intensity": sentiment_data["intensity"]
-        })
-        self.save()
+        faction.memory.append(MemoryEntry(
+            turn=self.state["current_turn"],
+            decision=decision,
+            response=response,
+            sentiment=sentiment_data["sentiment"],
+            intensity=sentiment_data["intensity"]
+        ))
+        demote_hot(faction)
+        self._record("add_faction_memory", faction_id, decision, response, sentiment_data)
     
+    @synchronized
     def add_story_beat(self, beat_text, trigger):
         """Add a narrative story beat"""
         self.state["story_beats"].append({
@@ -136,8 +268,9 @@ class GameState:
             "beat": beat_text,
             "trigger": trigger
         })
-        self.save()
+        self._record("add_story_beat", beat_text, trigger)
     
+    @synchronized
     def add_kingdom_classification(self, classification):
         """Add kingdom state classification"""
         self.state["kingdom_state_history"].append({
@@ -145,7 +278,7 @@ class GameState:
             "state": classification["state"],
             "reason": classification["reason"]
         })
-        self.save()
+        self._record("add_kingdom_classification", classification)
     
     def get_faction_data(self, faction_id):
         """Get current faction data"""
@@ -156,9 +289,8 @@ class GameState:
         return self.state["factions"]
     
     def get_average_trust(self):
-        """Calculate average trust across all factions"""
-        total = sum(f["trust_score"] for f in self.state["factions"].values())
-        return total / len(self.state["factions"])
+        """Average trust across all factions (from the running total)"""
+        return self._trust_total / len(self.state["factions"])
     
     def get_latest_chronicle(self):
         """Get most recent chronicle or None"""
@@ -166,6 +298,10 @@ class GameState:
             return self.state["kingdom_chronicles"][-1]["chronicle"]
         return None
     
+    def get_reign_summary(self):
+        """Get the rolling summary of the reign so far or None"""
+        return (self.state.get("reign_summary") or {}).get("summary")
+    
     def get_recent_turns(self, count=2):
         """Get recent turn history"""
         return self.state["turn_history"][-count:] if self.state["turn_history"] else []
@@ -181,9 +317,9 @@ class GameState:
             "average_trust": self.get_average_trust(),
             "faction_summary": {
                 fid: {
-                    "name": f["name"],
-                    "personality": f["current_personality"],
-                    "trust": f["trust_score"]
+                    "name": f.name,
+                    "personality": f.current_personality,
+                    "trust": f.trust_score
                 }
                 for fid, f in self.state["factions"].items()
             }
@@ -0,0 +1,223 @@
+"""
+Headless Runner for The Evolving Kingdom
+Plays whole reigns without a terminal, choosing decisions with a policy,
+across a process pool; each finished game is written as one JSONL line.
+Or serves many players' reigns over HTTP (see server.py), or converts saves
+between JSON and binary snapshots (see snapshot.py)
+
+    python -m kingdom simulate --games 100 --workers 8 --policy random
+    python -m kingdom serve --port 8080
+    python -m kingdom convert game_state.json archive.ksnap --to binary
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+from config import TOTAL_TURNS, LLM_BACKEND, SERVER_HOST, SERVER_PORT
+from game_state import GameState
+from storage import create_store, read_document, write_atomic
+from snapshot import encode_snapshot
+from openai_client import KingdomAI
+from llm_backends import create_backend
+from engine import KingdomEngine, decision_options
+from telemetry import span_context
+from server import KingdomServer, shared_ai
+
+# ==================== POLICIES ====================
+# A policy picks one of a turn's options: (options, rng, game_state) -> decision
+POLICIES = {
+    "random": lambda options, rng, game_state: rng.choice(options),
+    "first": lambda options, rng, game_state: options[0],
+    "last": lambda options, rng, game_state: options[-1]
+}
+
+def run_reign(game, policy, seed, turns=TOTAL_TURNS, state_dir=None, review=False,
+              backend=None, latency_scale=None):
+    """
+    Play one reign from start to finish and return its result record
+    Runs in a worker process, so it builds its own client and game state
+    With the mock backend the game's seed also seeds the LLM, so the whole reign repeats exactly
+    """
+    load_dotenv()
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    choose = POLICIES[policy]
+    
+    if state_dir:
+        game_state = GameState(os.path.join(state_dir, f"game_{game:05d}.json"))
+    else:
+        game_state = GameState(store=create_store(None, backend="memory"))
+    if (backend or LLM_BACKEND) == "mock":
+        llm = create_backend("mock", seed=seed, latency_scale=latency_scale)
+    else:
+        llm = create_backend(backend)
+    # Nobody reads between simulated turns, so there is no time to hide post-turn work in
+    engine = KingdomEngine(game_state, KingdomAI(backend=llm), total_turns=turns, background_post_turn=False)
+    
+    game_state.initialize_new_game(f"Simulated Monarch {game}")
+    decisions = []
+    try:
+        with span_context(game=game):
+            for turn in range(1, turns + 1):
+                decision = choose(decision_options(turn), rng, game_state)
+                engine.play_turn(turn, decision)
+                decisions.append(decision)
+            final_review = engine.final_review() if review else None
+    finally:
+        engine.close(wait=False)
+        game_state.flush()
+        if engine.tracer:
+            engine.tracer.close()
+    
+    state = game_state.state
+    history = state["kingdom_state_history"]
+    result = {
+        "game": game,
+        "policy": policy,
+        "seed": seed,
+        "backend": llm.name,
+        "turns": turns,
+        "decisions": decisions,
+        "final_trust": {fid: f["trust_score"] for fid, f in state["factions"].items()},
+        "average_trust": round(game_state.get_average_trust(), 2),
+        "kingdom_state": history[-1]["state"] if history else None,
+        "personality_changes": {
+            fid: len(f["personality_evolution_log"]) for fid, f in state["factions"].items()
+        },
+        "story_beats": [b["trigger"] for b in state["story_beats"]],
+        "seconds": round(time.perf_counter() - started, 3),
+        "telemetry": engine.telemetry_summary(game)
+    }
+    if review:
+        result["review"] = final_review
+    return result
+
+# ==================== SIMULATE ====================
+def simulate(args):
+    """Run args.games reigns across args.workers processes, writing JSONL as they finish"""
+    if args.state_dir:
+        os.makedirs(args.state_dir, exist_ok=True)
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    base_seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    
+    started = time.perf_counter()
+    finished = failed = 0
+    trust_total = 0.0
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = {
+                pool.submit(
+                    run_reign, game, args.policy, base_seed + game, args.turns, args.state_dir, args.review,
+                    args.backend, args.latency_scale
+                ): game
+                for game in range(args.games)
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                    trust_total += result["average_trust"]
+                    finished += 1
+                except Exception as e:
+                    # One broken reign should not sink the whole batch
+                    game = futures[future]
+                    result = {"game": game, "policy": args.policy, "seed": base_seed + game, "error": str(e)}
+                    failed += 1
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    
+    elapsed = time.perf_counter() - started
+    mean_trust = trust_total / finished if finished else 0.0
+    print(
+        f"{finished} game(s) finished, {failed} failed in {elapsed:.1f}s "
+        f"(mean average trust {mean_trust:.1f}, base seed {base_seed})",
+        file=sys.stderr
+    )
+    return 1 if failed else 0
+
+# ==================== SERVE ====================
+def serve(args):
+    """Host reigns over HTTP until interrupted"""
+    load_dotenv()
+    if args.state_dir:
+        os.makedirs(args.state_dir, exist_ok=True)
+    mock_options = {"latency_scale": args.latency_scale} if (args.backend or LLM_BACKEND) == "mock" else {}
+    server = KingdomServer(
+        shared_ai(args.backend, args.max_inflight, **mock_options),
+        total_turns=args.turns, state_dir=args.state_dir, db_path=args.db
+    )
+    listening = lambda address: print(f"Serving reigns on http://{address[0]}:{address[1]}", file=sys.stderr)
+    try:
+        asyncio.run(server.serve(args.host, args.port, ready=listening))
+    except KeyboardInterrupt:
+        print("Server stopped; every reign was saved", file=sys.stderr)
+    return 0
+
+# ==================== CONVERT ====================
+def convert(args):
+    """Rewrite a saved state (or event-log snapshot) in the other format"""
+    document = read_document(args.source)
+    if args.to == "binary":
+        data = encode_snapshot(document, args.compression)
+    else:
+        data = json.dumps(document, indent=2, ensure_ascii=False).encode("utf-8")
+    write_atomic(args.destination, data)
+    print(
+        f"{args.source} ({os.path.getsize(args.source)} bytes) -> {args.destination} ({len(data)} bytes, {args.to})",
+        file=sys.stderr
+    )
+    return 0
+
+def build_parser():
+    """Command line interface"""
+    parser = argparse.ArgumentParser(prog="python -m kingdom", description="The Evolving Kingdom without a terminal")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    
+    sim = commands.add_parser("simulate", help="play many automated reigns and report each as JSONL")
+    sim.add_argument("--games", type=int, default=1, help="number of reigns to play")
+    sim.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    sim.add_argument("--policy", choices=sorted(POLICIES), default="random", help="how decisions are chosen")
+    sim.add_argument("--turns", type=int, default=TOTAL_TURNS, help="turns per reign")
+    sim.add_argument("--seed", type=int, help="base seed; game N uses seed + N")
+    sim.add_argument("--output", help="JSONL file to write (default: stdout)")
+    sim.add_argument("--state-dir", help="also save each game's state here (default: not saved)")
+    sim.add_argument("--review", action="store_true", help="generate the epic review for every game")
+    sim.add_argument("--backend", choices=["openai", "mock"], help=f"LLM backend (default: {LLM_BACKEND})")
+    sim.add_argument("--latency-scale", type=float, help="multiplier on mock latencies (0 = answer instantly)")
+    sim.set_defaults(handler=simulate)
+    
+    srv = commands.add_parser("serve", help="host many players' reigns over a JSON HTTP API")
+    srv.add_argument("--host", default=SERVER_HOST, help="address to listen on")
+    srv.add_argument("--port", type=int, default=SERVER_PORT, help="port to listen on")
+    srv.add_argument("--turns", type=int, default=TOTAL_TURNS, help="turns per reign")
+    srv.add_argument("--state-dir", help="save each reign as a file here (default: kept in memory)")
+    srv.add_argument("--db", help="save every reign in this SQLite database instead")
+    srv.add_argument("--max-inflight", type=int, help="LLM requests in flight at once, shared by all reigns")
+    srv.add_argument("--backend", choices=["openai", "mock"], help=f"LLM backend (default: {LLM_BACKEND})")
+    srv.add_argument("--latency-scale", type=float, help="multiplier on mock latencies (0 = answer instantly)")
+    srv.set_defaults(handler=serve)
+    
+    conv = commands.add_parser("convert", help="rewrite a save as JSON or as a binary snapshot (either format is read)")
+    conv.add_argument("source", help="saved state or event-log snapshot to read")
+    conv.add_argument("destination", help="file to write")
+    conv.add_argument("--to", choices=["json", "binary"], required=True, help="format to write")
+    conv.add_argument("--compression", type=int, help="zlib level for binary snapshots (0 = uncompressed)")
+    conv.set_defaults(handler=convert)
+    return parser
+
+def main(argv=None):
+    """Entry point"""
+    args = build_parser().parse_args(argv)
+    sys.exit(args.handler(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+"""
+LLM Backends for The Evolving Kingdom
+KingdomAI builds the prompts and parses the answers; a backend only turns a
+(system prompt, user prompt) pair into text. The mock backend answers every
+task offline, reproducibly, with synthetic latency
+"""
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import asyncio
+import threading
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient, BadRequestError
+from config import (
+    OPENAI_MODEL, LLM_BACKEND, HTTP_POOL_CONNECTIONS, HTTP_POOL_KEEPALIVE, JSON_MODE,
+    MOCK_SEED, MOCK_LATENCY, MOCK_LATENCY_SCALE, MOCK_ERROR_RATE, MOCK_FIRST_CHUNK_SHARE, MOCK_MALFORMED_RATE
+)
+from sentiment import LexiconSentimentAnalyzer
+from context_builder import estimate_tokens
+from structured_output import JSON_TASKS
+
+def request_options(timeout):
+    """Per-request SDK options (an explicit timeout=None would mean no timeout at all)"""
+    return {"timeout": timeout} if timeout is not None else {}
+
+def stream_options():
+    """Ask a streamed completion to end with its token usage"""
+    return {"stream": True, "stream_options": {"include_usage": True}}
+
+def chunk_delta(chunk):
+    """Text carried by one streamed completion chunk ("" for role and usage chunks)"""
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+def json_options(task, enabled=True):
+    """Ask for a JSON object on tasks that answer in JSON"""
+    if enabled and task in JSON_TASKS:
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+def json_mode_refused(error):
+    """Whether an API error is the model turning down JSON mode"""
+    return isinstance(error, BadRequestError) and "response_format" in str(error)
+
+def usage_of(response):
+    """Token usage reported with an OpenAI completion, or None"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+
+class OpenAIBackend:
+    """Chat completions from the OpenAI API"""
+    
+    name = "openai"
+    
+    def __init__(self, api_key=None, model=None):
+        if api_key is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+        # Retries are resilience.py's job; the SDK's own would multiply them
+        self.client = OpenAI(api_key=api_key, max_retries=0)
+        self.model = model or OPENAI_MODEL
+        self.json_mode = JSON_MODE  # Turned off for good once the model refuses it
+    
+    def complete(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        """Return (completion text, token usage); API errors propagate to the caller"""
+        options = json_options(task, self.json_mode)
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=temperature,
+                **options,
+                **request_options(timeout)
+            )
+        except BadRequestError as e:
+            if not options or not json_mode_refused(e):
+                raise
+            self.json_mode = False
+            return self.complete(system_prompt, user_prompt, temperature, task, timeout)
+        return response.choices[0].message.content, usage_of(response)
+    
+    def stream(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        """
+        Yield (text delta, None) pairs as the completion arrives, then ("", token usage)
+        timeout bounds each read, so it is the longest silence tolerated, not the total time
+        """
+        usage = None
+        for chunk in self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=temperature,
+            **stream_options(),
+            **request_options(timeout)
+        ):
+            delta = chunk_delta(chunk)
+            if delta:
+                yield delta, None
+            usage = usage_of(chunk) or usage
+        yield "", usage
+
+class AsyncOpenAIBackend:
+    """Async chat completions over one pooled HTTP session"""
+    
+    name = "openai"
+    
+    def __init__(self, api_key=None, model=None):
+        if api_key is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+        self.http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_CONNECTIONS,
+                max_keepalive_connections=HTTP_POOL_KEEPALIVE
+            )
+        )
+        self.client = AsyncOpenAI(api_key=api_key, http_client=self.http_client, max_retries=0)
+        self.model = model or OPENAI_MODEL
+        self.json_mode = JSON_MODE
+    
+    async def complete(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        """Return (completion text, token usage); API errors propagate to the caller"""
+        options = json_options(task, self.json_mode)
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=temperature,
+                **options,
+                **request_options(timeout)
+            )
+        except BadRequestError as e:
+            if not options or not json_mode_refused(e):
+                raise
+            self.json_mode = False
+            return await self.complete(system_prompt, user_prompt, temperature, task, timeout)
+        return response.choices[0].message.content, usage_of(response)
+    
+    async def stream(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        """Async stream(): (text delta, None) pairs, then ("", token usage)"""
+        usage = None
+        chunks = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=temperature,
+            **stream_options(),
+            **request_options(timeout)
+        )
+        async for chunk in chunks:
+            delta = chunk_delta(chunk)
+            if delta:
+                yield delta, None
+            usage = usage_of(chunk) or usage
+        yield "", usage
+    
+    async def aclose(self):
+        """Close the pooled HTTP session"""
+        await self.client.close()
+
+# ==================== MOCK BACKEND ====================
+class MockBackendError(Exception):
+    """A synthetic request failure injected by the mock backend"""
+
+def sample_latency(rng, spec):
+    """
+    Draw one latency in seconds from a (distribution, a, b) spec:
+    ("fixed", seconds, _), ("uniform", low, high), ("normal", mean, stddev)
+    or ("lognormal", median, sigma)
+    """
+    distribution, a, b = spec
+    if distribution == "fixed":
+        return a
+    if distribution == "uniform":
+        return rng.uniform(a, b)
+    if distribution == "normal":
+        return max(0.0, rng.gauss(a, b))
+    if distribution == "lognormal":
+        return a * rng.lognormvariate(0.0, b)
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+def _field(prompt, label, default=""):
+    """Value of a 'Label: value' line in a prompt"""
+    match = re.search(r"^" + re.escape(label) + r": (.*)$", prompt, re.MULTILINE)
+    return match.group(1).strip() if match else default
+
+def _malformed(rng, content):
+    """A JSON answer with one of the defects live models produce"""
+    defect = rng.choice(["prose", "fence", "comma", "quotes", "cut"])
+    if defect == "prose":
+        return f"Certainly! Here is the analysis:\n{content}\nI hope this helps."
+    if defect == "fence":
+        return f"```json\n{content}\n```"
+    if defect == "comma":
+        return content[:-1] + ", }"
+    if defect == "quotes":
+        return content.replace('"', "'")
+    return content[:int(len(content) * rng.uniform(0.3, 0.9))]
+
+def _number(text, default):
+    match = re.search(r"-?\d+(?:\.\d+)?", text or "")
+    return float(match.group(0)) if match else default
+
+POSITIVE_REPLIES = [
+    "{name} rejoice at this wise decree! To {decision} shows true wisdom, and we are grateful to the crown.",
+    "Hail the monarch! {name} welcome the choice to {decision}; such generosity will bring prosperity to all.",
+    "At last, a just ruler. {name} praise the decision to {decision} and pledge our loyalty anew."
+]
+NEGATIVE_REPLIES = [
+    "This is folly! {name} are outraged that the crown would {decision}. Such betrayal will not be forgotten.",
+    "{name} condemn the decision to {decision}. It is a cruel burden, and resentment grows in every hall.",
+    "Shame upon the throne! To {decision} is reckless greed, and {name} will remember this injustice."
+]
+NEUTRAL_REPLIES = [
+    "{name} take note of the decree to {decision}. We shall watch and wait to see what comes of it.",
+    "So the crown chooses to {decision}. {name} will consider what this means for our house."
+]
+TRAITS = {
+    "warm": ["now openly loyal to the crown", "emboldened and hopeful", "generous toward the throne"],
+    "cold": ["now wary and resentful", "bitter and guarded", "quietly plotting for leverage"],
+    "mixed": ["watchful and calculating", "cautiously pragmatic", "reserved but attentive"]
+}
+
+class MockBackend:
+    """
+    Offline stand-in for the OpenAI API
+    Answers are well-formed for all eight tasks and depend only on the seed and
+    the request, so runs repeat exactly whatever order requests arrive in
+    Latency per task is drawn from MOCK_LATENCY and multiplied by latency_scale
+    Latency and injected failures are drawn afresh for each repeat of a request
+    that has not yet succeeded, so retries and hedged duplicates behave like the
+    transient faults of a live API; malformed_rate spoils that share of JSON answers
+    """
+    
+    name = "mock"
+    
+    def __init__(self, seed=None, latency=None, latency_scale=None, error_rate=None, malformed_rate=None):
+        self.seed = MOCK_SEED if seed is None else seed
+        self.latency = dict(MOCK_LATENCY, **(latency or {}))
+        self.latency_scale = MOCK_LATENCY_SCALE if latency_scale is None else latency_scale
+        self.error_rate = MOCK_ERROR_RATE if error_rate is None else error_rate
+        self.malformed_rate = MOCK_MALFORMED_RATE if malformed_rate is None else malformed_rate
+        self.model = f"mock-{self.seed}"  # Keeps mock answers apart from real ones in the response cache
+        self.sentiment_analyzer = LexiconSentimentAnalyzer()
+        self.lock = threading.Lock()
+        self.repeats = {}  # (task, request digest) -> times sent since it last succeeded
+    
+    def complete(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        """Return (synthetic completion, estimated usage) after a synthetic delay"""
+        delay, content = self._plan(system_prompt, user_prompt, temperature, task)
+        if delay:
+            time.sleep(delay)
+        if content is None:
+            raise MockBackendError(f"Synthetic failure for {task}")
+        return content, self._usage(system_prompt, user_prompt, content)
+    
+    def stream(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        """Yield the synthetic completion word by word, spreading its delay, then ("", usage)"""
+        delay, content = self._plan(system_prompt, user_prompt, temperature, task)
+        first_delay, chunks = self._stream_plan(delay, content)
+        if first_delay:
+            time.sleep(first_delay)
+        if content is None:
+            raise MockBackendError(f"Synthetic failure for {task}")
+        for chunk, chunk_delay in chunks:
+            yield chunk, None
+            if chunk_delay:
+                time.sleep(chunk_delay)
+        yield "", self._usage(system_prompt, user_prompt, content)
+    
+    def _stream_plan(self, delay, content):
+        """(delay before the first chunk, [(chunk, delay after it)]) for a streamed request"""
+        if content is None:
+            return delay * MOCK_FIRST_CHUNK_SHARE, []
+        words = re.findall(r"\s*\S+\s*", content) or [content]
+        per_word = delay * (1 - MOCK_FIRST_CHUNK_SHARE) / len(words)
+        return delay * MOCK_FIRST_CHUNK_SHARE, [(word, per_word) for word in words]
+    
+    def _usage(self, system_prompt, user_prompt, content):
+        """Token usage as the live API would report it, estimated"""
+        return {
+            "prompt_tokens": estimate_tokens(system_prompt) + estimate_tokens(user_prompt),
+            "completion_tokens": estimate_tokens(content)
+        }
+    
+    def _plan(self, system_prompt, user_prompt, temperature, task):
+        """(delay, content or None for an injected failure) for a request"""
+        digest = hashlib.sha256(f"{system_prompt}\0{user_prompt}\0{temperature}".encode("utf-8")).hexdigest()
+        key = (task, digest)
+        with self.lock:
+            repeat = self.repeats.get(key, 0)
+            self.repeats[key] = repeat + 1
+        fault = random.Random(f"{self.seed}:{task}:{digest}:{repeat}")
+        spec = self.latency.get(task, self.latency["default"])
+        delay = sample_latency(fault, spec) * self.latency_scale
+        if fault.random() < self.error_rate:
+            return delay, None
+        with self.lock:
+            self.repeats.pop(key, None)
+        
+        rng = random.Random(f"{self.seed}:{task}:{digest}")
+        respond = getattr(self, "_" + task, None) if task else None
+        if respond is None:
+            respond = self._generate_story_beat
+        content = respond(rng, system_prompt, user_prompt)
+        if task in JSON_TASKS and rng.random() < self.malformed_rate:
+            content = _malformed(rng, content)
+        return delay, content
+    
+    # ==================== TASK ANSWERS ====================
+    def _faction_reply(self, rng, name, decision, trust):
+        """A faction's words, more likely warm the more it trusts the crown"""
+        weights = [0.2 + 0.6 * trust / 100, 0.2 + 0.6 * (1 - trust / 100), 0.2]
+        replies = rng.choices([POSITIVE_REPLIES, NEGATIVE_REPLIES, NEUTRAL_REPLIES], weights)[0]
+        decision = decision[:1].lower() + decision[1:] if decision else "act"
+        return rng.choice(replies).format(name=name, decision=decision)
+    
+    def _generate_faction_response(self, rng, system_prompt, user_prompt):
+        return self._faction_reply(
+            rng,
+            _field(user_prompt, "Faction", "The faction"),
+            _field(user_prompt, "The Monarch's Decision"),
+            _number(_field(user_prompt, "Trust Score"), 50)
+        )
+    
+    def _generate_all_faction_responses(self, rng, system_prompt, user_prompt):
+        include_sentiment = '"sentiment"' in system_prompt
+        decision = _field(user_prompt, "The Monarch's Decision")
+        answers = {}
+        for block in user_prompt.split("Faction id: ")[1:]:
+            faction_id = block.split("\n", 1)[0].strip()
+            reply = self._faction_reply(
+                rng,
+                _field(block, "Faction", faction_id),
+                decision,
+                _number(_field(block, "Trust Score"), 50)
+            )
+            answers[faction_id] = {"response": reply}
+            if include_sentiment:
+                result, _ = self.sentiment_analyzer.analyze(reply)
+                answers[faction_id].update(sentiment=result["sentiment"], intensity=result["intensity"])
+        return json.dumps(answers)
+    
+    def _analyze_sentiment(self, rng, system_prompt, user_prompt):
+        quoted = user_prompt[user_prompt.find('"') + 1:user_prompt.rfind('"')]
+        result, confidence = self.sentiment_analyzer.analyze(quoted)
+        result["reasoning"] = f"Mock analysis (lexicon confidence {confidence:.2f})"
+        return json.dumps(result)
+    
+    def _create_chronicle(self, rng, system_prompt, user_prompt):
+        match = re.search(r"Summarize turns (\S+)", user_prompt)
+        turns = match.group(1) if match else "recent turns"
+        decisions = re.findall(r'"decision":"((?:[^"\\]|\\.)*)"', user_prompt)
+        deeds = "; then ".join(d.lower() for d in decisions) or "governed in silence"
+        mood = rng.choice([
+            "The great houses muttered in their halls, some in praise and some in anger.",
+            "Across the realm, bells rang and tongues wagged in equal measure.",
+            "The people watched the throne closely, weighing every word."
+        ])
+        return f"In turns {turns} of the reign, the crown chose to {deeds}. {mood} History will judge what followed."
+    
+    def _continue_chronicle(self, rng, system_prompt, user_prompt):
+        match = re.search(r"with turns (\S+?):", user_prompt)
+        summary = _field(user_prompt, "Reign So Far")
+        if summary == "The reign has just begun.":
+            summary = ""
+        entry = self._create_chronicle(rng, system_prompt, f"Summarize turns {match.group(1) if match else 'recent'} " + user_prompt)
+        deeds = re.search(r"the crown chose to (.*?)\. ", entry)
+        summary = " ".join(filter(None, [summary, f"Then the crown chose to {deeds.group(1)}." if deeds else ""]))
+        return json.dumps({"chronicle": entry, "reign_summary": summary})
+    
+    def _evolve_personality(self, rng, system_prompt, user_prompt):
+        base = _field(user_prompt, "Original Personality", "steadfast")
+        current = _field(user_prompt, "Current Personality", base)
+        trust = _number(_field(user_prompt, "Trust Score"), 50)
+        if rng.random() < 0.3:
+            return json.dumps({"new_personality": current, "key_change": "No change"})
+        mood = "warm" if trust >= 60 else "cold" if trust <= 40 else "mixed"
+        trait = rng.choice(TRAITS[mood])
+        return json.dumps({
+            "new_personality": f"{base}, {trait}",
+            "key_change": f"Recent decrees left their trust in the crown at {trust:.0f}/100"
+        })
+    
+    def _predict_faction_reactions(self, rng, system_prompt, user_prompt):
+        options = re.findall(r'"((?:[^"\\]|\\.)*)"', user_prompt.split("Current Faction States:")[0])
+        factions = ["merchants", "nobles", "clergy", "commoners"]
+        lines = []
+        for number, option in enumerate(options, 1):
+            pleased, angered = rng.sample(factions, 2)
+            lines.append(f"{number}. {option}: the {pleased} would likely welcome it, while the {angered} may resent it.")
+        return "\n".join(lines) or "The advisor has no counsel to offer."
+    
+    def _classify_kingdom_state(self, rng, system_prompt, user_prompt):
+        trust = _number(_field(user_prompt, "Average Trust"), 50)
+        if trust >= 70:
+            state = "prosperity"
+        elif trust >= 50:
+            state = "stability"
+        elif trust >= 30:
+            state = "decline"
+        else:
+            state = "rebellion"
+        return json.dumps({"state": state, "reason": f"Average trust stands at {trust:.1f}"})
+    
+    def _generate_epic_review(self, rng, system_prompt, user_prompt):
+        match = re.search(r'"player_name":"((?:[^"\\]|\\.)*)"', user_prompt)
+        player = match.group(1) if match else "the Monarch"
+        style = rng.choice(["a cautious steward", "a bold reformer", "a divisive visionary"])
+        return (
+            f"# 👑 The Reign of {player}\n\n"
+            f"## Leadership\n**{player}** ruled as {style}.\n\n"
+            "## Turning Points\nEach decree reshaped the great houses, and their words are recorded above.\n\n"
+            "## Alternative Timeline\nHad the crown chosen differently, the realm might tell another tale."
+        )
+    
+    def _generate_story_beat(self, rng, system_prompt, user_prompt):
+        if _field(user_prompt, "Trigger") == "rebellion_risk":
+            return rng.choice([
+                "Torches gather at the city gates as whispers of revolt spread through the streets.",
+                "A noble's banner is torn down in the square, and no guard moves to stop it."
+            ])
+        return rng.choice([
+            "Crowds fill the square to cheer the monarch, and even old rivals raise their cups.",
+            "Bells ring across the realm as the great houses toast a golden age."
+        ])
+
+class AsyncMockBackend(MockBackend):
+    """MockBackend for AsyncKingdomAI; waits without blocking the event loop"""
+    
+    async def complete(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        """Return (synthetic completion, estimated usage) after a synthetic delay"""
+        delay, content = self._plan(system_prompt, user_prompt, temperature, task)
+        if delay:
+            await asyncio.sleep(delay)
+        if content is None:
+            raise MockBackendError(f"Synthetic failure for {task}")
+        return content, self._usage(system_prompt, user_prompt, content)
+    
+    async def stream(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        """Async stream() without blocking the event loop"""
+        delay, content = self._plan(system_prompt, user_prompt, temperature, task)
+        first_delay, chunks = self._stream_plan(delay, content)
+        if first_delay:
+            await asyncio.sleep(first_delay)
+        if content is None:
+            raise MockBackendError(f"Synthetic failure for {task}")
+        for chunk, chunk_delay in chunks:
+            yield chunk, None
+            if chunk_delay:
+                await asyncio.sleep(chunk_delay)
+        yield "", self._usage(system_prompt, user_prompt, content)
+    
+    async def aclose(self):
+        """Nothing to close"""
+
+def create_backend(name=None, api_key=None, **mock_options):
+    """Build the configured backend for KingdomAI; mock_options go to MockBackend"""
+    name = name or LLM_BACKEND
+    if name == "openai":
+        return OpenAIBackend(api_key)
+    if name == "mock":
+        return MockBackend(**mock_options)
+    raise ValueError(f"Unknown LLM backend: {name}")
+
+def create_async_backend(name=None, api_key=None, **mock_options):
+    """Build the configured backend for AsyncKingdomAI; mock_options go to AsyncMockBackend"""
+    name = name or LLM_BACKEND
+    if name == "openai":
+        return AsyncOpenAIBackend(api_key)
+    if name == "mock":
+        return AsyncMockBackend(**mock_options)
+    raise ValueError(f"Unknown LLM backend: {name}")
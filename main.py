@@ -5,19 +5,35 @@ A diplomacy simulator where faction personalities evolve based on AI-generated r
 
 import os
 import sys
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from config import TOTAL_TURNS, FACTIONS, DECISION_CATEGORIES, COLORS
+from config import TOTAL_TURNS, FACTIONS, COLORS, MAX_PARALLEL_FACTIONS, USE_ASYNC_CLIENT
 from game_state import GameState
-from openai_client import KingdomAI
+from openai_client import KingdomAI, AsyncKingdomAI
+from engine import KingdomEngine, TurnObserver, decision_options
 
-class EvolvinKingdom:
-    """Main game controller"""
+class EvolvinKingdom(TurnObserver):
+    """Main game controller; renders the turns KingdomEngine plays"""
     
     def __init__(self):
         load_dotenv()
         self.game_state = GameState()
-        self.ai = KingdomAI()
         self.colors = COLORS
+        self.pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_FACTIONS)
+        
+        if USE_ASYNC_CLIENT:
+            # The async client lives on its own event loop thread; the game loop waits on it
+            self.ai = AsyncKingdomAI()
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        else:
+            self.ai = KingdomAI()
+            self.loop = None
+        
+        self.engine = KingdomEngine(self.game_state, self.ai, pool=self.pool, loop=self.loop)
+        self.streaming_faction = None  # Faction whose response is being printed as it streams
     
     def print_colored(self, text, color="reset", bold=False):
         """Print colored text to terminal"""
@@ -67,58 +83,7 @@ class EvolvinKingdom:
     
     def generate_decision_options(self, turn):
         """Generate decision options for this turn"""
-        # Create varied decision categories
-        category = DECISION_CATEGORIES[(turn - 1) % len(DECISION_CATEGORIES)]
-        
-        # Predefined interesting decisions
-        decisions = {
-            1: [
-                "Raise taxes to fund a grand festival",
-                "Lower taxes to win the people's favor",
-                "Keep taxes the same but audit the wealthy"
-            ],
-            2: [
-                "Conscript commoners for border defense",
-                "Hire expensive mercenaries instead",
-                "Negotiate a peace treaty with neighbors"
-            ],
-            3: [
-                "Build a grand cathedral",
-                "Build markets and trade roads",
-                "Build fortifications and walls"
-            ],
-            4: [
-                "Execute a corrupt noble as an example",
-                "Exile the noble but seize their lands",
-                "Pardon the noble for a large fine"
-            ],
-            5: [
-                "Host a diplomatic summit with rival kingdoms",
-                "Declare neutrality and isolate the kingdom",
-                "Form a military alliance with a powerful neighbor"
-            ],
-            6: [
-                "Fund new irrigation projects for farms",
-                "Invest in merchant shipping ventures",
-                "Build a royal academy of learning"
-            ],
-            7: [
-                "Declare a week-long tournament and feast",
-                "Commission epic poetry about your reign",
-                "Ban public celebrations to save resources"
-            ],
-            8: [
-                "A plague outbreak - quarantine the city",
-                "A plague outbreak - pray and trust in faith",
-                "A plague outbreak - evacuate to the countryside"
-            ]
-        }
-        
-        return decisions.get(turn, [
-            "Make a conservative, safe decision",
-            "Make a bold, risky decision",
-            "Delegate the decision to advisors"
-        ])
+        return decision_options(turn)
     
     def get_player_decision(self, turn, options):
         """Get player's decision"""
@@ -147,7 +112,7 @@ class EvolvinKingdom:
                     }
                     for fid, f in self.game_state.get_all_factions().items()
                 }
-                prediction = self.ai.predict_faction_reactions(options, faction_states)
+                prediction = self.engine.wait_for(self.ai.predict_faction_reactions(options, faction_states))
                 self.print_colored(prediction, "info")
                 print()
         
@@ -161,160 +126,107 @@ class EvolvinKingdom:
             except ValueError:
                 print("Please enter a number.")
     
-    def process_turn(self, turn, decision):
+    def process_turn(self, turn, decision, speculation=None):
         """
         Process a turn - this is where the magic happens!
-        The LLM generates responses, analyzes them, and updates state
+        The engine runs the turn and calls back into the hooks below to render it
+        The chronicle and evolutions follow in the background while the player reads
         """
+        # With stale reads the last turn's chronicle and evolutions may still be pending; they
+        # (and their pause) are shown now, not under this turn's header while the factions stream
+        self.engine.finish_post_turn()
         self.print_header("🗣️  FACTION RESPONSES")
-        
-        turn_data = {
-            "turn": turn,
-            "decision": decision,
-            "responses": {}
-        }
-        
-        game_context = self.game_state.get_game_context()
-        
-        # STEP 1: Generate faction responses (LLM Task: Generation)
-        for faction_id, faction_info in FACTIONS.items():
-            faction_data = self.game_state.get_faction_data(faction_id)
-            
-            print(f"\n{faction_info['color']}{faction_info['icon']} {faction_data['name']} speaks:{self.colors['reset']}")
-            print("Thinking...", end="", flush=True)
-            
-            # LLM generates response based on current personality and memory
-            response = self.ai.generate_faction_response(
-                faction_data,
-                decision,
-                game_context
-            )
-            
+        self.engine.play_turn(turn, decision, observer=self, speculation=speculation)
+        input("\nPress Enter to continue...")
+        self.engine.finish_post_turn(wait=False)
+    
+    # ==================== TURN RENDERING ====================
+    def faction_started(self, faction_id, faction_data):
+        """Announce a faction while its response is awaited"""
+        faction_info = FACTIONS[faction_id]
+        print(f"\n{faction_info['color']}{faction_info['icon']} {faction_data['name']} speaks:{self.colors['reset']}")
+        print("Thinking...", end="", flush=True)
+    
+    def faction_streamed(self, faction_id, faction_data, chunk):
+        """Print a faction's response as it arrives"""
+        if self.streaming_faction != faction_id:
+            self.streaming_faction = faction_id
+            print("\r" + " " * 20 + "\r" + '"', end="")  # Replace "Thinking..." with the opening quote
+        print(chunk, end="", flush=True)
+    
+    def faction_responded(self, faction_id, faction_data, response, sentiment, trust_delta):
+        """Show a faction's response, sentiment and trust change"""
+        if self.streaming_faction == faction_id:
+            self.streaming_faction = None
+            print('"')  # The response itself is already on screen
+        else:
             print("\r" + " " * 20 + "\r", end="")  # Clear "Thinking..."
             print(f'"{response}"')
-            
-            # STEP 2: Analyze sentiment (LLM Task: Sentiment Analysis)
-            sentiment = self.ai.analyze_sentiment(response)
-            
-            # Show sentiment indicator
-            sentiment_icons = {"positive": "😊", "negative": "😠", "neutral": "😐"}
-            sentiment_colors = {"positive": "success", "negative": "fail", "neutral": "warning"}
-            icon = sentiment_icons.get(sentiment["sentiment"], "😐")
-            
-            self.print_colored(
-                f"{icon} Sentiment: {sentiment['sentiment']} (intensity: {sentiment['intensity']:.2f})",
-                sentiment_colors.get(sentiment["sentiment"], "reset")
-            )
-            
-            # STEP 3: Update trust based on sentiment
-            trust_delta = 0
-            if sentiment["sentiment"] == "positive":
-                trust_delta = int(sentiment["intensity"] * 15)
-            elif sentiment["sentiment"] == "negative":
-                trust_delta = -int(sentiment["intensity"] * 15)
-            
-            if trust_delta != 0:
-                self.game_state.update_faction_trust(faction_id, trust_delta, decision)
-                change_text = f"+{trust_delta}" if trust_delta > 0 else str(trust_delta)
-                self.print_colored(f"Trust changed: {change_text}", "info")
-            
-            # Store response in game state (for LLM to read later)
-            self.game_state.add_faction_memory(faction_id, decision, response, sentiment)
-            
-            turn_data["responses"][faction_id] = {
-                "response": response,
-                "sentiment": sentiment,
-                "trust_change": trust_delta
-            }
         
-        # STEP 4: Save turn data
-        self.game_state.add_turn_record(turn_data)
+        # Show sentiment indicator
+        sentiment_icons = {"positive": "😊", "negative": "😠", "neutral": "😐"}
+        sentiment_colors = {"positive": "success", "negative": "fail", "neutral": "warning"}
+        icon = sentiment_icons.get(sentiment["sentiment"], "😐")
         
-        # STEP 5: Every 2 turns, create chronicle and evolve personalities
-        if turn % 2 == 0 and turn < TOTAL_TURNS:
-            self.create_chronicle(turn)
-            self.evolve_personalities(turn)
+        self.print_colored(
+            f"{icon} Sentiment: {sentiment['sentiment']} (intensity: {sentiment['intensity']:.2f})",
+            sentiment_colors.get(sentiment["sentiment"], "reset")
+        )
         
-        # STEP 6: Classify kingdom state
-        if turn % 2 == 0:
-            context = self.game_state.get_game_context()
-            classification = self.ai.classify_kingdom_state(context)
-            self.game_state.add_kingdom_classification(classification)
-            
-            print("\n" + "-" * 70)
-            self.print_colored(f"📜 Kingdom State: {classification['state'].upper()}", "header", bold=True)
-            self.print_colored(f"   {classification['reason']}", "info")
-            print("-" * 70)
-        
-        # STEP 7: Generate story beats for dramatic moments
-        avg_trust = self.game_state.get_average_trust()
-        if avg_trust > 80 and turn > 3:
-            beat = self.ai.generate_story_beat(game_context, "high_trust")
-            self.game_state.add_story_beat(beat, "high_trust")
-            print(f"\n✨ {beat}")
-        elif avg_trust < 30:
-            beat = self.ai.generate_story_beat(game_context, "rebellion_risk")
-            self.game_state.add_story_beat(beat, "rebellion_risk")
-            self.print_colored(f"\n⚠️  {beat}", "fail", bold=True)
-        
-        input("\nPress Enter to continue...")
+        if trust_delta != 0:
+            change_text = f"+{trust_delta}" if trust_delta > 0 else str(trust_delta)
+            self.print_colored(f"Trust changed: {change_text}", "info")
     
-    def create_chronicle(self, turn):
-        """
-        Create a chronicle summarizing recent turns
-        This is LLM Task: Summarization (digesting its own outputs)
-        """
+    def chronicle_started(self, turn_range):
+        """Announce the chronicler"""
         print("\n" + "~" * 70)
         self.print_colored("📖 The Royal Chronicler writes...", "info", bold=True)
-        
-        turn_range = (turn - 1, turn)
-        recent_turns = self.game_state.get_recent_turns(2)
-        
-        chronicle = self.ai.create_chronicle(recent_turns, turn_range)
-        self.game_state.add_chronicle(turn_range, chronicle)
-        
+    
+    def chronicle_written(self, turn_range, chronicle):
+        """Show the new chronicle"""
         print(f'\n"{chronicle}"')
         print("~" * 70 + "\n")
     
-    def evolve_personalities(self, turn):
-        """
-        Evolve faction personalities based on accumulated experiences
-        This is LLM Task: Transformation (digesting its own outputs!)
-        """
+    def personalities_evolving(self):
+        """Announce personality evolution"""
         self.print_colored("\n⚡ FACTION PERSONALITIES EVOLVING...\n", "warning", bold=True)
-        
-        for faction_id, faction_info in FACTIONS.items():
-            faction_data = self.game_state.get_faction_data(faction_id)
-            recent_memory = faction_data["memory"][-4:]  # Last 4 interactions
-            
-            if len(recent_memory) >= 2:  # Need some history to evolve
-                evolution = self.ai.evolve_personality(faction_data, recent_memory)
-                
-                if evolution["new_personality"] != faction_data["current_personality"]:
-                    self.game_state.update_faction_personality(
-                        faction_id,
-                        evolution["new_personality"],
-                        evolution["key_change"]
-                    )
-                    
-                    print(f"{faction_info['icon']} {faction_data['name']}:")
-                    self.print_colored(f"   Was: {faction_data['current_personality']}", "warning")
-                    self.print_colored(f"   Now: {evolution['new_personality']}", "success")
-                    print(f"   Why: {evolution['key_change']}\n")
-        
+    
+    def personality_evolved(self, faction_id, faction_data, old_personality, evolution):
+        """Show how a faction's personality changed"""
+        print(f"{FACTIONS[faction_id]['icon']} {faction_data['name']}:")
+        self.print_colored(f"   Was: {old_personality}", "warning")
+        self.print_colored(f"   Now: {evolution['new_personality']}", "success")
+        print(f"   Why: {evolution['key_change']}\n")
+    
+    def personalities_evolved(self):
+        """Pause after personality evolution"""
         input("Press Enter to continue...")
     
+    def kingdom_classified(self, classification):
+        """Show the kingdom's state"""
+        print("\n" + "-" * 70)
+        self.print_colored(f"📜 Kingdom State: {classification['state'].upper()}", "header", bold=True)
+        self.print_colored(f"   {classification['reason']}", "info")
+        print("-" * 70)
+    
+    def story_beat_added(self, trigger, beat):
+        """Show a dramatic story beat"""
+        if trigger == "rebellion_risk":
+            self.print_colored(f"\n⚠️  {beat}", "fail", bold=True)
+        else:
+            print(f"\n✨ {beat}")
+    
     def generate_final_review(self):
         """
         Generate the epic final review
         This is where the LLM digests ALL of its previous outputs!
         """
+        self.engine.finish_post_turn()  # The last turn's classification and story beat come first
         self.print_header("📜 THE EPIC KINGDOM HISTORY 📜")
         print("The Master Chronicler compiles the complete history of your reign...\n")
         print("This may take a moment...\n")
         
-        full_state = self.game_state.get_full_state_for_review()
-        review = self.ai.generate_epic_review(full_state)
+        review = self.engine.final_review()
         
         print(review)
         print("\n" + "=" * 70)
@@ -323,7 +235,7 @@ class EvolvinKingdom:
         
         # Save review to file
         with open("kingdom_history.md", "w", encoding="utf-8") as f:
-            f.write(f"# Kingdom History: {full_state['player_name']}\n\n")
+            f.write(f"# Kingdom History: {self.game_state.state['player_name']}\n\n")
             f.write(review)
         
         self.print_colored("📄 Full history saved to kingdom_history.md", "success")
@@ -341,18 +253,24 @@ class EvolvinKingdom:
         
         # Main game loop
         for turn in range(1, TOTAL_TURNS + 1):
+            # The last turn's chronicle and evolutions are shown (and committed) before the factions
+            # and the advisor are, unless stale reads let the next decision start without them
+            self.engine.finish_post_turn(wait=not self.engine.stale_reads)
             self.display_factions()
             
             options = self.generate_decision_options(turn)
+            # With SPECULATIVE_GENERATION on, the factions start answering every option while we wait
+            speculation = self.engine.speculate(turn, options)
             decision = self.get_player_decision(turn, options)
             
-            self.process_turn(turn, decision)
+            self.process_turn(turn, decision, speculation)
         
         # Game over - generate final review
         self.generate_final_review()
 
 def main():
     """Entry point"""
+    game = None
     try:
         game = EvolvinKingdom()
         game.play()
@@ -363,6 +281,15 @@ def main():
         print(f"\n\nError: {e}")
         print("The kingdom has encountered an unexpected crisis!")
         sys.exit(1)
+    finally:
+        # Make sure deferred writes reach disk however the game ends
+        if game is not None and game.game_state.state is not None:
+            game.game_state.flush()
+        if game is not None:
+            game.engine.close(wait=False)
+            game.pool.shutdown(wait=False)
+        if game is not None and game.engine.tracer:
+            game.engine.tracer.close()
 
 if __name__ == "__main__":
     main()
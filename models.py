@@ -0,0 +1,143 @@
+"""
+Core Game Models for The Evolving Kingdom
+Compact records for the hot parts of the game state: factions, their raw memory
+entries and the turn history. Each keeps its fields in __slots__ instead of a
+per-object dict, yet reads and writes like the dict it replaces, so code written
+against the JSON schema keeps working; saves are written in that same schema
+"""
+
+from collections.abc import MutableMapping
+
+class Record(MutableMapping):
+    """
+    Dict-style access over __slots__ fields
+    A field that was never set is absent, like a missing key; keys outside FIELDS
+    go to an overflow dict, so nothing read from a save is lost
+    """
+    
+    __slots__ = ("_extra",)
+    FIELDS = ()
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+    
+    def __init__(self, data=None, **fields):
+        for source in (data or {}, fields):
+            for key, value in source.items():
+                self[key] = value
+    
+    @classmethod
+    def from_dict(cls, data):
+        """A record of data (data itself if it already is one)"""
+        return data if isinstance(data, cls) else cls(data)
+    
+    def to_dict(self):
+        """The record as the plain dict of the save format (nested records stay records)"""
+        return {key: self[key] for key in self}
+    
+    def __getitem__(self, key):
+        try:
+            if key in self._field_set:
+                return getattr(self, key)
+            return self._extra[key]
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            setattr(self, key, value)
+            return
+        try:
+            self._extra[key] = value
+        except AttributeError:
+            self._extra = {key: value}
+    
+    def __delitem__(self, key):
+        try:
+            if key in self._field_set:
+                delattr(self, key)
+            else:
+                del self._extra[key]
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def __contains__(self, key):
+        if key in self._field_set:
+            return hasattr(self, key)
+        return key in getattr(self, "_extra", ())
+    
+    def __iter__(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        yield from getattr(self, "_extra", ())
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+    
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class MemoryEntry(Record):
+    """
+    One raw entry of a faction's hot memory
+    Trust entries carry turn, trust_change, reason and new_trust; response entries
+    carry turn, decision, response, sentiment and intensity
+    """
+    
+    FIELDS = ("turn", "decision", "response", "sentiment", "intensity", "trust_change", "reason", "new_trust")
+    __slots__ = FIELDS
+
+class TurnRecord(Record):
+    """One turn of the history: the decision and every faction's response to it"""
+    
+    FIELDS = ("turn", "decision", "responses")
+    __slots__ = FIELDS
+
+class Faction(Record):
+    """A faction's live state; memory holds MemoryEntry records, the other tiers stay plain"""
+    
+    FIELDS = (
+        "id", "name", "base_personality", "current_personality", "trust_score",
+        "memory", "personality_evolution_log", "memory_warm", "memory_cold", "memory_trimmed"
+    )
+    __slots__ = FIELDS
+    
+    def __init__(self, data=None, **fields):
+        super().__init__(data, **fields)
+        if "memory" in self:
+            self.memory = [MemoryEntry.from_dict(entry) for entry in self.memory]
+
+def adopt_state(state):
+    """Convert a state read from a save (plain dicts) to the models, in place; returns it"""
+    factions = state.get("factions", {})
+    for faction_id, faction in factions.items():
+        factions[faction_id] = Faction.from_dict(faction)
+    if "turn_history" in state:
+        state["turn_history"] = [TurnRecord.from_dict(record) for record in state["turn_history"]]
+    return state
+
+def plain_state(state):
+    """A copy of state with the models as plain dicts, for serialisers without a default hook"""
+    plain = dict(state)
+    if "factions" in plain:
+        plain["factions"] = {faction_id: _plain_faction(faction) for faction_id, faction in plain["factions"].items()}
+    if "turn_history" in plain:
+        plain["turn_history"] = [_plain(record) for record in plain["turn_history"]]
+    return plain
+
+def _plain(record):
+    return record.to_dict() if isinstance(record, Record) else record
+
+def _plain_faction(faction):
+    faction = faction.to_dict() if isinstance(faction, Record) else dict(faction)
+    if "memory" in faction:
+        faction["memory"] = [_plain(entry) for entry in faction["memory"]]
+    return faction
+
+def to_json(obj):
+    """json.dumps default= hook: the models as the plain dicts of the save format"""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
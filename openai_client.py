@@ -3,46 +3,92 @@ OpenAI GPT Client Module for The Evolving Kingdom
 Handles all LLM tasks with clear separation of concerns
 """
 
-import os
-import json
-from openai import OpenAI
-from config import OPENAI_MODEL, OPENAI_TEMPERATURE
-
-class KingdomAI:
-    """Handles all AI interactions for the game"""
-    
-    def __init__(self, api_key=None):
-        if api_key is None:
-            api_key = os.getenv("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=api_key)
-        self.model = OPENAI_MODEL
-        self.temperature = OPENAI_TEMPERATURE
+import time
+import asyncio
+from config import (
+    OPENAI_TEMPERATURE, CACHED_TASKS, MAX_INFLIGHT_REQUESTS,
+    SENTIMENT_BACKEND, SENTIMENT_HYBRID_THRESHOLD, PROMPT_TOKEN_BUDGETS, SPECULATION_REPLY_TOKENS,
+    CHRONICLE_KEY_QUOTES, REIGN_SUMMARY_CHARS, STRUCTURED_OUTPUT_REASKS
+)
+from llm_backends import create_backend, create_async_backend, MockBackend
+from resilience import Resilience, LLMUnavailable
+from structured_output import StructuredOutputError, load_json, parse_structured, reask_prompt
+from scheduler import Admission, default_scheduler, reply_tokens
+from response_cache import default_cache
+from telemetry import default_tracer
+from faction_memory import memory_entries
+from sentiment import LexiconSentimentAnalyzer
+from context_builder import (
+    estimate_tokens, compact_json, truncate_text, clamp_prompt,
+    rank_memory, merge_memory_by_turn, compress_memory_entry, compress_turns, build_review_context,
+    chronicle_delta, keep_latest
+)
+
+class KingdomPrompts:
+    """
+    Prompt construction and output parsing for the eight LLM tasks
+    Shared by the sync and async clients so both send identical requests
+    """
     
-    def _call_gpt(self, system_prompt, user_prompt, temperature=None):
-        """Internal method to call GPT with error handling"""
-        if temperature is None:
-            temperature = self.temperature
-        
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=temperature
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"Error calling OpenAI API: {e}")
+    def _cache_key(self, system_prompt, user_prompt, temperature, task):
+        """Cache key for a request, or None if this task is not cached"""
+        if not self.cache or task not in self.cached_tasks:
             return None
+        return self.cache.make_key(self.model, temperature, system_prompt, user_prompt)
     
-    # ==================== LLM TASK 1: GENERATION ====================
-    def generate_faction_response(self, faction_data, decision, game_context):
+    def _trace(self, task, started, outcome, usage=None, error=None, attempts=1, first_chunk_at=None, queued=None):
+        """Emit the telemetry span of a task call that began at perf_counter() time started"""
+        if self.tracer:
+            first_chunk = None if first_chunk_at is None else first_chunk_at - started
+            self.tracer.call(task, time.perf_counter() - started, outcome, usage, error, attempts, first_chunk, queued)
+    
+    def _admission(self, system_prompt, user_prompt, task):
+        """The scheduler's admission for a call, charged its prompt and expected reply until settled"""
+        tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + reply_tokens(task)
+        return Admission(self.scheduler or None, task, tokens)
+    
+    def _fall_back(self, system_prompt, user_prompt, temperature, task, started, error):
+        """Answer from the local fallback when the LLM is unavailable, so no task ever gets None"""
+        print(f"{self.backend.name} API unavailable for {task} ({error}); using a local answer")
+        self._trace(task, started, "fallback", error=str(error), attempts=error.attempts)
+        content, _ = self.fallback.complete(system_prompt, user_prompt, temperature, task)
+        return content
+    
+    def _check_structured(self, task, response, reasks):
         """
-        Generate a faction's response to a player decision
-        Uses current personality and memory of past events
+        (object, None) for an answer that fits the task's schema once repaired, else (None, error)
+        Usable answers are traced here; the caller traces "failed" when it stops asking
         """
+        try:
+            data, repaired = parse_structured(response, task)
+        except StructuredOutputError as e:
+            return None, e
+        self._trace_parse(task, "reasked" if reasks else "repaired" if repaired else "ok", reasks)
+        return data, None
+    
+    def _fits_schema(self, task):
+        """Whether an answer to task may be cached: only answers that parse are kept"""
+        def fits(response):
+            try:
+                parse_structured(response, task)
+            except StructuredOutputError:
+                return False
+            return True
+        return fits
+    
+    def _trace_parse(self, task, outcome, reasks=0, error=None):
+        if self.tracer:
+            self.tracer.parse(task, outcome, reasks, error)
+    
+    def _fit_prompt(self, system_prompt, user_prompt, task):
+        """Enforce the task's token budget on the user prompt (the hard ceiling for every request)"""
+        budget = PROMPT_TOKEN_BUDGETS.get(task)
+        if budget is None:
+            return user_prompt
+        return clamp_prompt(system_prompt, user_prompt, budget)
+    
+    # ==================== LLM TASK 1: GENERATION ====================
+    def _faction_response_prompts(self, faction_data, decision, game_context):
         system_prompt = """You are a faction in a medieval kingdom. Generate a response to the monarch's decision.
 Your response should:
 1. Be 2-3 sentences
@@ -54,69 +100,168 @@ Keep it dramatic and memorable!"""
         user_prompt = f"""Faction: {faction_data['name']}
 Current Personality: {faction_data['current_personality']}
 Trust Score: {faction_data['trust_score']}/100
-Recent Memory: {json.dumps(faction_data['memory'][-3:] if faction_data['memory'] else [])}
+Recent Memory: {compact_json(rank_memory(memory_entries(faction_data), 3))}
 
 The Monarch's Decision: {decision}
 
 Game Context:
 Turn: {game_context['turn']}
-Previous Chronicle: {game_context.get('latest_chronicle', 'This is the beginning of the reign.')}
+Previous Chronicle: {truncate_text(game_context.get('latest_chronicle'), 800) or 'This is the beginning of the reign.'}
 
 Generate this faction's response:"""
         
-        return self._call_gpt(system_prompt, user_prompt)
+        return system_prompt, user_prompt
     
-    # ==================== LLM TASK 2: SENTIMENT ANALYSIS ====================
-    def analyze_sentiment(self, faction_response):
+    def faction_responses_cost(self, factions, decision, game_context, batched=False):
+        """Estimated tokens (prompts plus replies) to generate every faction's response to a decision"""
+        if batched:
+            prompts = [self._all_faction_responses_prompts(factions, decision, game_context, True) + ("generate_all_faction_responses",)]
+        else:
+            prompts = [
+                self._faction_response_prompts(faction_data, decision, game_context) + ("generate_faction_response",)
+                for faction_data in factions.values()
+            ]
+        prompt_tokens = sum(
+            estimate_tokens(system_prompt) + estimate_tokens(self._fit_prompt(system_prompt, user_prompt, task))
+            for system_prompt, user_prompt, task in prompts
+        )
+        return prompt_tokens + SPECULATION_REPLY_TOKENS * len(factions)
+    
+    # ==================== LLM TASK 1 (BATCHED): ALL FACTIONS IN ONE REQUEST ====================
+    def _all_faction_responses_prompts(self, factions, decision, game_context, include_sentiment):
+        sentiment_fields = ', "sentiment": "positive" or "negative" or "neutral", "intensity": 0.0 to 1.0' if include_sentiment else ''
+        system_prompt = f"""You voice every faction of a medieval kingdom. Generate each faction's response to the monarch's decision.
+Each response should:
+1. Be 2-3 sentences in that faction's own voice
+2. Reflect its current personality and past experiences
+3. Show emotion appropriate to the situation
+4. Reference past events if they're relevant
+Keep them dramatic, memorable and distinct from one another!
+Return ONLY a JSON object with one entry per faction id:
+{{"<faction id>": {{"response": "the faction's words"{sentiment_fields}}}}}"""
+        
+        faction_blocks = "\n\n".join(
+            f"""Faction id: {faction_id}
+Faction: {faction_data['name']}
+Current Personality: {faction_data['current_personality']}
+Trust Score: {faction_data['trust_score']}/100
+Recent Memory: {compact_json(rank_memory(memory_entries(faction_data), 3))}"""
+            for faction_id, faction_data in factions.items()
+        )
+        
+        user_prompt = f"""{faction_blocks}
+
+The Monarch's Decision: {decision}
+
+Game Context:
+Turn: {game_context['turn']}
+Previous Chronicle: {truncate_text(game_context.get('latest_chronicle'), 800) or 'This is the beginning of the reign.'}
+
+Generate every faction's response (JSON only, faction ids: {', '.join(factions)}):"""
+        
+        return system_prompt, user_prompt
+    
+    def _parse_all_faction_responses(self, response, faction_ids, include_sentiment):
         """
-        Analyze the sentiment of a faction's response
-        Returns: positive, negative, or neutral with confidence score
+        Pull each faction's response (and sentiment) out of a batched completion
+        Returns {faction_id: (response or None, sentiment or None)}; None marks what needs a fallback call
         """
+        try:
+            parsed, _ = load_json(response)
+        except StructuredOutputError:
+            parsed = {}
+        
+        results = {}
+        for faction_id in faction_ids:
+            entry = parsed.get(faction_id)
+            if isinstance(entry, str):
+                entry = {"response": entry}
+            if not isinstance(entry, dict) or not isinstance(entry.get("response"), str) or not entry["response"].strip():
+                results[faction_id] = (None, None)
+                continue
+            
+            sentiment = None
+            if include_sentiment:
+                try:
+                    intensity = float(entry.get("intensity"))
+                    if entry.get("sentiment") in ("positive", "negative", "neutral") and 0.0 <= intensity <= 1.0:
+                        sentiment = {"sentiment": entry["sentiment"], "intensity": intensity, "reasoning": "Batched analysis"}
+                except (TypeError, ValueError):
+                    pass
+            results[faction_id] = (entry["response"].strip(), sentiment)
+        return results
+    
+    # ==================== LLM TASK 2: SENTIMENT ANALYSIS ====================
+    def _sentiment_prompts(self, faction_response):
         system_prompt = """You are a sentiment analyzer. Analyze the sentiment of faction responses.
 Return ONLY a JSON object with this exact format:
 {"sentiment": "positive" or "negative" or "neutral", "intensity": 0.0 to 1.0, "reasoning": "brief explanation"}"""
         
         user_prompt = f"""Analyze the sentiment of this faction response:
 
-"{faction_response}"
+"{truncate_text(faction_response, 2000)}"
 
 Return JSON only:"""
         
-        response = self._call_gpt(system_prompt, user_prompt, temperature=0.3)
-        try:
-            # Extract JSON from response (in case GPT adds extra text)
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                return json.loads(response[json_start:json_end])
-            return {"sentiment": "neutral", "intensity": 0.5, "reasoning": "Parse error"}
-        except:
-            return {"sentiment": "neutral", "intensity": 0.5, "reasoning": "Parse error"}
+        return system_prompt, user_prompt
     
-    # ==================== LLM TASK 3: SUMMARIZATION ====================
-    def create_chronicle(self, turns_data, turn_range):
+    def _local_sentiment(self, faction_response):
         """
-        Create a historical chronicle summarizing recent events
-        This summary will be fed back into future responses
+        Analyze sentiment locally according to SENTIMENT_BACKEND
+        Returns None when the LLM should decide (llm mode, or low confidence in hybrid mode)
         """
+        if self.sentiment_backend == "llm":
+            return None
+        result, confidence = self.sentiment_analyzer.analyze(faction_response)
+        if self.sentiment_backend == "local" or confidence >= SENTIMENT_HYBRID_THRESHOLD:
+            return result
+        return None
+    
+    def _sentiment_or_default(self, sentiment):
+        return sentiment or {"sentiment": "neutral", "intensity": 0.5, "reasoning": "Parse error"}
+    
+    # ==================== LLM TASK 3: SUMMARIZATION ====================
+    def _chronicle_prompts(self, turns_data, turn_range):
         system_prompt = """You are the Royal Chronicler. Summarize the kingdom's recent history.
 Write in a dramatic, historical narrative style (3-4 sentences).
 Capture the key events and their emotional impact on the realm."""
         
         user_prompt = f"""Summarize turns {turn_range[0]}-{turn_range[1]} of the kingdom's history:
 
-{json.dumps(turns_data, indent=2)}
+{compact_json(compress_turns(turns_data))}
 
 Write a dramatic chronicle entry:"""
         
-        return self._call_gpt(system_prompt, user_prompt)
+        return system_prompt, user_prompt
     
-    # ==================== LLM TASK 4: TRANSFORMATION/PERSONALITY EVOLUTION ====================
-    def evolve_personality(self, faction_data, recent_events):
+    def _continued_chronicle_prompts(self, previous_chronicle, reign_summary, turns_data, turn_range):
+        system_prompt = f"""You are the Royal Chronicler keeping the history of a reign.
+Continue from your previous entry and your summary of the reign so far.
+Return ONLY a JSON object with this format:
+{{"chronicle": "a dramatic, historical 3-4 sentence entry about the new turns", "reign_summary": "the whole reign so far, updated with the new turns, in at most {REIGN_SUMMARY_CHARS // 200} sentences"}}"""
+        
+        user_prompt = f"""Reign So Far: {reign_summary or 'The reign has just begun.'}
+Previous Chronicle: {truncate_text(previous_chronicle, 800) or 'None yet.'}
+
+Continue the chronicle with turns {turn_range[0]}-{turn_range[1]}:
+{compact_json(chronicle_delta(turns_data, CHRONICLE_KEY_QUOTES))}
+
+Return JSON only:"""
+        
+        return system_prompt, user_prompt
+    
+    def _continued_chronicle_or_default(self, data, response, reign_summary):
         """
-        Transform a faction's personality based on accumulated experiences
-        This is where the LLM "digests" its previous outputs!
+        {"chronicle", "reign_summary"} from a continued chronicle
+        Without usable JSON the whole answer is the chronicle and is appended to the summary
         """
+        data = data or {}
+        chronicle = data.get("chronicle") or response.strip()
+        summary = data.get("reign_summary") or " ".join(filter(None, [reign_summary, chronicle]))
+        return {"chronicle": chronicle, "reign_summary": keep_latest(summary, REIGN_SUMMARY_CHARS)}
+    
+    # ==================== LLM TASK 4: TRANSFORMATION/PERSONALITY EVOLUTION ====================
+    def _personality_prompts(self, faction_data, recent_events):
         system_prompt = """You are a personality evolution engine. Based on a faction's experiences, describe how their personality has evolved.
 Return ONLY a JSON object with this format:
 {"new_personality": "brief personality description", "key_change": "what changed and why"}
@@ -129,45 +274,32 @@ Current Personality: {faction_data['current_personality']}
 Trust Score: {faction_data['trust_score']}/100
 
 Recent Events and Their Reactions:
-{json.dumps(recent_events, indent=2)}
+{compact_json([compress_memory_entry(e) for e in merge_memory_by_turn(recent_events)])}
 
 How has this faction's personality evolved? Return JSON only:"""
         
-        response = self._call_gpt(system_prompt, user_prompt, temperature=0.6)
-        try:
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                return json.loads(response[json_start:json_end])
-            return {"new_personality": faction_data['current_personality'], "key_change": "No change"}
-        except:
-            return {"new_personality": faction_data['current_personality'], "key_change": "Parse error"}
+        return system_prompt, user_prompt
+    
+    def _personality_or_default(self, evolution, faction_data):
+        return evolution or {"new_personality": faction_data['current_personality'], "key_change": "Parse error"}
     
     # ==================== LLM TASK 5: PREDICTION ====================
-    def predict_faction_reactions(self, decision_options, faction_states):
-        """
-        Predict how factions might react to potential decisions
-        Helps player make informed choices
-        """
+    def _prediction_prompts(self, decision_options, faction_states):
         system_prompt = """You are a royal advisor. Predict how factions will likely react to each decision option.
 Be brief but insightful. Consider each faction's current state."""
         
         user_prompt = f"""Decision Options:
-{json.dumps(decision_options, indent=2)}
+{compact_json(decision_options)}
 
 Current Faction States:
-{json.dumps(faction_states, indent=2)}
+{compact_json(faction_states)}
 
 Provide a brief prediction for each option (1-2 sentences each):"""
         
-        return self._call_gpt(system_prompt, user_prompt, temperature=0.5)
+        return system_prompt, user_prompt
     
     # ==================== LLM TASK 6: CLASSIFICATION ====================
-    def classify_kingdom_state(self, game_state):
-        """
-        Classify the overall kingdom state based on faction relationships
-        Returns: prosperity, rebellion, stability, or decline
-        """
+    def _classification_prompts(self, game_state):
         system_prompt = """You are a kingdom analyst. Classify the kingdom's overall state.
 Return ONLY a JSON object:
 {"state": "prosperity" or "rebellion" or "stability" or "decline", "reason": "brief explanation"}"""
@@ -175,27 +307,18 @@ Return ONLY a JSON object:
         user_prompt = f"""Analyze this kingdom state:
 
 Average Trust: {game_state['average_trust']:.1f}/100
-Faction States: {json.dumps(game_state['faction_summary'], indent=2)}
-Recent Chronicle: {game_state.get('latest_chronicle', 'Beginning of reign')}
+Faction States: {compact_json(game_state['faction_summary'])}
+Recent Chronicle: {truncate_text(game_state.get('latest_chronicle'), 800) or 'Beginning of reign'}
 
 Classify the kingdom state (JSON only):"""
         
-        response = self._call_gpt(system_prompt, user_prompt, temperature=0.3)
-        try:
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                return json.loads(response[json_start:json_end])
-            return {"state": "stability", "reason": "Parse error"}
-        except:
-            return {"state": "stability", "reason": "Parse error"}
+        return system_prompt, user_prompt
+    
+    def _classification_or_default(self, classification):
+        return classification or {"state": "stability", "reason": "Parse error"}
     
     # ==================== LLM TASK 7: REVIEW GENERATION ====================
-    def generate_epic_review(self, full_game_state):
-        """
-        Generate the final 'Epic Kingdom History' review
-        This reads ALL previous LLM outputs and creates a comprehensive narrative
-        """
+    def _review_prompts(self, full_game_state):
         system_prompt = """You are the Master Chronicler writing the definitive history of a monarch's reign.
 Create an engaging, dramatic review that:
 1. Shows how faction personalities evolved over time
@@ -207,26 +330,461 @@ Create an engaging, dramatic review that:
 
 Use markdown formatting with headers, bold text, and emojis. Make it enjoyable to read!"""
         
+        # Leave room for the system prompt and the instructions around the context
+        context_budget = PROMPT_TOKEN_BUDGETS["generate_epic_review"] - estimate_tokens(system_prompt) - 50
+        
         user_prompt = f"""Create the Epic Kingdom History for this reign:
 
-{json.dumps(full_game_state, indent=2)}
+{build_review_context(full_game_state, context_budget)}
 
 Write a comprehensive, dramatic review:"""
         
-        return self._call_gpt(system_prompt, user_prompt, temperature=0.8)
+        return system_prompt, user_prompt
     
     # ==================== LLM TASK 8: NARRATIVE GENERATION ====================
-    def generate_story_beat(self, game_context, trigger_type):
-        """
-        Generate narrative story beats based on relationship trajectories
-        Creates dramatic moments when relationships cross thresholds
-        """
+    def _story_beat_prompts(self, game_context, trigger_type):
         system_prompt = """You are a narrative generator. Create a dramatic story moment based on the kingdom's state.
 Write 2-3 vivid sentences that capture the moment. Make it memorable!"""
         
         user_prompt = f"""Trigger: {trigger_type}
-Game Context: {json.dumps(game_context, indent=2)}
+Game Context: {compact_json(dict(game_context, latest_chronicle=truncate_text(game_context.get('latest_chronicle'), 800)))}
 
 Generate a dramatic story beat:"""
         
-        return self._call_gpt(system_prompt, user_prompt)
+        return system_prompt, user_prompt
+
+class KingdomAI(KingdomPrompts):
+    """
+    Handles all AI interactions for the game
+    Requests go to a backend from llm_backends (the OpenAI API unless LLM_BACKEND or backend says otherwise)
+    """
+    
+    def __init__(self, api_key=None, cache=None, backend=None, tracer=None, resilience=None, scheduler=None):
+        self.backend = backend if backend is not None else create_backend(api_key=api_key)
+        self.resilience = resilience if resilience is not None else Resilience()
+        self.scheduler = scheduler if scheduler is not None else default_scheduler()  # Pass False to disable
+        self.fallback = MockBackend(latency_scale=0, error_rate=0)  # Well-formed local answers for every task
+        self.model = self.backend.model
+        self.temperature = OPENAI_TEMPERATURE
+        self.cache = cache if cache is not None else default_cache()
+        self.cached_tasks = set(CACHED_TASKS)
+        self.sentiment_backend = SENTIMENT_BACKEND
+        self.sentiment_analyzer = LexiconSentimentAnalyzer()
+        self.tracer = tracer if tracer is not None else default_tracer()  # Pass False to disable
+        self.structured_reasks = STRUCTURED_OUTPUT_REASKS
+    
+    def _call_gpt(self, system_prompt, user_prompt, temperature=None, task=None, cacheable=None):
+        """
+        Internal method to call GPT with error handling
+        cacheable(answer), when given, decides whether a cached task's answer is stored
+        """
+        if temperature is None:
+            temperature = self.temperature
+        user_prompt = self._fit_prompt(system_prompt, user_prompt, task)
+        started = time.perf_counter()
+        
+        cache_key = self._cache_key(system_prompt, user_prompt, temperature, task)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._trace(task, started, "cache_hit")
+                return cached
+        
+        with self._admission(system_prompt, user_prompt, task) as admission:
+            try:
+                content, usage, attempts = self.resilience.call(self.backend, system_prompt, user_prompt, temperature, task)
+            except LLMUnavailable as e:
+                admission.settle(None, e.attempts)
+                return self._fall_back(system_prompt, user_prompt, temperature, task, started, e)
+            admission.settle(usage, attempts)
+        self._trace(task, started, "ok", usage, attempts=attempts, queued=admission.waited)
+        
+        if cache_key is not None and (cacheable is None or cacheable(content)):
+            self.cache.put(cache_key, content)
+        return content
+    
+    def _call_structured(self, system_prompt, user_prompt, temperature, task):
+        """
+        _call_gpt for a task that answers in JSON (see structured_output.py)
+        An answer that cannot be repaired is asked for again, at most structured_reasks times
+        Returns (object matching the task's schema or None, last answer)
+        """
+        prompt = user_prompt
+        for reasks in range(self.structured_reasks + 1):
+            response = self._call_gpt(system_prompt, prompt, temperature, task, cacheable=self._fits_schema(task))
+            data, error = self._check_structured(task, response, reasks)
+            if data is not None:
+                return data, response
+            prompt = reask_prompt(user_prompt, error)
+        self._trace_parse(task, "failed", reasks, str(error))
+        return None, response
+    
+    def _stream_gpt(self, system_prompt, user_prompt, temperature=None, task=None):
+        """
+        Like _call_gpt, but yields the completion in chunks as they arrive
+        When the API is unavailable the local fallback is yielded as one chunk; a stream
+        that breaks after its first chunk ends with the text that did arrive
+        """
+        if temperature is None:
+            temperature = self.temperature
+        user_prompt = self._fit_prompt(system_prompt, user_prompt, task)
+        started = time.perf_counter()
+        
+        cache_key = self._cache_key(system_prompt, user_prompt, temperature, task)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._trace(task, started, "cache_hit")
+                yield cached
+                return
+        
+        chunks = []
+        usage = None
+        attempts = 0
+        first_chunk_at = None
+        with self._admission(system_prompt, user_prompt, task) as admission:
+            try:
+                for delta, usage, attempts in self.resilience.stream(self.backend, system_prompt, user_prompt, temperature, task):
+                    if first_chunk_at is None:
+                        first_chunk_at = time.perf_counter()
+                    if delta:
+                        chunks.append(delta)
+                        yield delta
+            except LLMUnavailable as e:
+                admission.settle(None, e.attempts)
+                yield self._fall_back(system_prompt, user_prompt, temperature, task, started, e)
+                return
+            except Exception as e:
+                admission.settle(usage, attempts)
+                print(f"\n{self.backend.name} stream for {task} broke off ({type(e).__name__}: {e})")
+                self._trace(task, started, "partial", error=f"{type(e).__name__}: {e}", attempts=attempts,
+                            first_chunk_at=first_chunk_at, queued=admission.waited)
+                return
+            admission.settle(usage, attempts)
+        self._trace(task, started, "ok", usage, attempts=attempts, first_chunk_at=first_chunk_at, queued=admission.waited)
+        
+        if cache_key is not None:
+            self.cache.put(cache_key, "".join(chunks))
+    
+    # ==================== LLM TASK 1: GENERATION ====================
+    def generate_faction_response(self, faction_data, decision, game_context):
+        """
+        Generate a faction's response to a player decision
+        Uses current personality and memory of past events
+        """
+        system_prompt, user_prompt = self._faction_response_prompts(faction_data, decision, game_context)
+        return self._call_gpt(system_prompt, user_prompt, task="generate_faction_response")
+    
+    def stream_faction_response(self, faction_data, decision, game_context):
+        """
+        Generate a faction's response, yielding its text as it arrives
+        Joined, the chunks are the response generate_faction_response would return
+        """
+        system_prompt, user_prompt = self._faction_response_prompts(faction_data, decision, game_context)
+        yield from self._stream_gpt(system_prompt, user_prompt, task="generate_faction_response")
+    
+    def generate_all_faction_responses(self, factions, decision, game_context, include_sentiment=False):
+        """
+        Generate every faction's response in a single request
+        factions maps faction_id -> faction data; returns {faction_id: (response, sentiment)}
+        Factions missing from the batched output fall back to their own calls
+        """
+        system_prompt, user_prompt = self._all_faction_responses_prompts(factions, decision, game_context, include_sentiment)
+        response = self._call_gpt(system_prompt, user_prompt, task="generate_all_faction_responses")
+        parsed = self._parse_all_faction_responses(response, list(factions), include_sentiment)
+        
+        results = {}
+        for faction_id, faction_data in factions.items():
+            faction_response, sentiment = parsed[faction_id]
+            if faction_response is None:
+                faction_response = self.generate_faction_response(faction_data, decision, game_context)
+            if sentiment is None:
+                sentiment = self.analyze_sentiment(faction_response)
+            results[faction_id] = (faction_response, sentiment)
+        return results
+    
+    # ==================== LLM TASK 2: SENTIMENT ANALYSIS ====================
+    def analyze_sentiment(self, faction_response):
+        """
+        Analyze the sentiment of a faction's response
+        Returns: positive, negative, or neutral with confidence score
+        """
+        started = time.perf_counter()
+        local = self._local_sentiment(faction_response)
+        if local is not None:
+            self._trace("analyze_sentiment", started, "local")
+            return local
+        
+        system_prompt, user_prompt = self._sentiment_prompts(faction_response)
+        sentiment, _ = self._call_structured(system_prompt, user_prompt, 0.3, "analyze_sentiment")
+        return self._sentiment_or_default(sentiment)
+    
+    # ==================== LLM TASK 3: SUMMARIZATION ====================
+    def create_chronicle(self, turns_data, turn_range):
+        """
+        Create a historical chronicle summarizing recent events
+        This summary will be fed back into future responses
+        """
+        system_prompt, user_prompt = self._chronicle_prompts(turns_data, turn_range)
+        return self._call_gpt(system_prompt, user_prompt, task="create_chronicle")
+    
+    def continue_chronicle(self, previous_chronicle, reign_summary, turns_data, turn_range):
+        """
+        Write the next chronicle from the previous one plus a compact delta of recent turns,
+        and update the rolling reign summary; the input stays the same size every time
+        Returns {"chronicle": ..., "reign_summary": ...}
+        """
+        system_prompt, user_prompt = self._continued_chronicle_prompts(previous_chronicle, reign_summary, turns_data, turn_range)
+        data, response = self._call_structured(system_prompt, user_prompt, None, "continue_chronicle")
+        return self._continued_chronicle_or_default(data, response, reign_summary)
+    
+    # ==================== LLM TASK 4: TRANSFORMATION/PERSONALITY EVOLUTION ====================
+    def evolve_personality(self, faction_data, recent_events):
+        """
+        Transform a faction's personality based on accumulated experiences
+        This is where the LLM "digests" its previous outputs!
+        """
+        system_prompt, user_prompt = self._personality_prompts(faction_data, recent_events)
+        evolution, _ = self._call_structured(system_prompt, user_prompt, 0.6, "evolve_personality")
+        return self._personality_or_default(evolution, faction_data)
+    
+    # ==================== LLM TASK 5: PREDICTION ====================
+    def predict_faction_reactions(self, decision_options, faction_states):
+        """
+        Predict how factions might react to potential decisions
+        Helps player make informed choices
+        """
+        system_prompt, user_prompt = self._prediction_prompts(decision_options, faction_states)
+        return self._call_gpt(system_prompt, user_prompt, temperature=0.5, task="predict_faction_reactions")
+    
+    # ==================== LLM TASK 6: CLASSIFICATION ====================
+    def classify_kingdom_state(self, game_state):
+        """
+        Classify the overall kingdom state based on faction relationships
+        Returns: prosperity, rebellion, stability, or decline
+        """
+        system_prompt, user_prompt = self._classification_prompts(game_state)
+        classification, _ = self._call_structured(system_prompt, user_prompt, 0.3, "classify_kingdom_state")
+        return self._classification_or_default(classification)
+    
+    # ==================== LLM TASK 7: REVIEW GENERATION ====================
+    def generate_epic_review(self, full_game_state):
+        """
+        Generate the final 'Epic Kingdom History' review
+        This reads ALL previous LLM outputs and creates a comprehensive narrative
+        """
+        system_prompt, user_prompt = self._review_prompts(full_game_state)
+        return self._call_gpt(system_prompt, user_prompt, temperature=0.8, task="generate_epic_review")
+    
+    # ==================== LLM TASK 8: NARRATIVE GENERATION ====================
+    def generate_story_beat(self, game_context, trigger_type):
+        """
+        Generate narrative story beats based on relationship trajectories
+        Creates dramatic moments when relationships cross thresholds
+        """
+        system_prompt, user_prompt = self._story_beat_prompts(game_context, trigger_type)
+        return self._call_gpt(system_prompt, user_prompt, task="generate_story_beat")
+
+class AsyncKingdomAI(KingdomPrompts):
+    """
+    Async counterpart of KingdomAI for hosting many kingdoms on one event loop
+    One instance holds no game state, so it can be shared by every kingdom:
+    all calls go through a single pooled HTTP session and at most
+    MAX_INFLIGHT_REQUESTS requests are in flight at once
+    """
+    
+    def __init__(self, api_key=None, max_inflight=None, cache=None, backend=None, tracer=None, resilience=None,
+                 limiter=None, scheduler=None):
+        if max_inflight is None:
+            max_inflight = MAX_INFLIGHT_REQUESTS
+        self.backend = backend if backend is not None else create_async_backend(api_key=api_key)
+        self.resilience = resilience if resilience is not None else Resilience()
+        self.fallback = MockBackend(latency_scale=0, error_rate=0)
+        self.model = self.backend.model
+        self.temperature = OPENAI_TEMPERATURE
+        # Any async context manager can bound in-flight requests; the scheduler decides which call goes next
+        self.inflight = limiter if limiter is not None else asyncio.Semaphore(max_inflight)
+        self.scheduler = scheduler if scheduler is not None else default_scheduler()  # Pass False to disable
+        self.cache = cache if cache is not None else default_cache()
+        self.cached_tasks = set(CACHED_TASKS)
+        self.sentiment_backend = SENTIMENT_BACKEND
+        self.sentiment_analyzer = LexiconSentimentAnalyzer()
+        self.tracer = tracer if tracer is not None else default_tracer()  # Pass False to disable
+        self.structured_reasks = STRUCTURED_OUTPUT_REASKS
+    
+    async def aclose(self):
+        """Close the backend's pooled HTTP session"""
+        await self.backend.aclose()
+    
+    async def _call_gpt(self, system_prompt, user_prompt, temperature=None, task=None, cacheable=None):
+        """Internal method to call GPT with error handling (cacheable as in KingdomAI)"""
+        if temperature is None:
+            temperature = self.temperature
+        user_prompt = self._fit_prompt(system_prompt, user_prompt, task)
+        started = time.perf_counter()
+        
+        cache_key = self._cache_key(system_prompt, user_prompt, temperature, task)
+        if cache_key is not None:
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                self._trace(task, started, "cache_hit")
+                return cached
+        
+        async with self._admission(system_prompt, user_prompt, task) as admission:
+            try:
+                # Each request holds an in-flight slot; backoff between retries does not
+                content, usage, attempts = await self.resilience.acall(
+                    self.backend, system_prompt, user_prompt, temperature, task, limiter=self.inflight
+                )
+            except LLMUnavailable as e:
+                admission.settle(None, e.attempts)
+                return self._fall_back(system_prompt, user_prompt, temperature, task, started, e)
+            admission.settle(usage, attempts)
+        self._trace(task, started, "ok", usage, attempts=attempts, queued=admission.waited)
+        
+        if cache_key is not None and (cacheable is None or cacheable(content)):
+            await self.cache.aput(cache_key, content)
+        return content
+    
+    async def _call_structured(self, system_prompt, user_prompt, temperature, task):
+        """Async _call_structured: re-asks a task whose JSON answer cannot be repaired"""
+        prompt = user_prompt
+        for reasks in range(self.structured_reasks + 1):
+            response = await self._call_gpt(system_prompt, prompt, temperature, task, cacheable=self._fits_schema(task))
+            data, error = self._check_structured(task, response, reasks)
+            if data is not None:
+                return data, response
+            prompt = reask_prompt(user_prompt, error)
+        self._trace_parse(task, "failed", reasks, str(error))
+        return None, response
+    
+    async def _stream_gpt(self, system_prompt, user_prompt, temperature=None, task=None):
+        """Async _stream_gpt; the stream holds an in-flight slot until it ends"""
+        if temperature is None:
+            temperature = self.temperature
+        user_prompt = self._fit_prompt(system_prompt, user_prompt, task)
+        started = time.perf_counter()
+        
+        cache_key = self._cache_key(system_prompt, user_prompt, temperature, task)
+        if cache_key is not None:
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                self._trace(task, started, "cache_hit")
+                yield cached
+                return
+        
+        chunks = []
+        usage = None
+        attempts = 0
+        first_chunk_at = None
+        async with self._admission(system_prompt, user_prompt, task) as admission:
+            try:
+                async for delta, usage, attempts in self.resilience.astream(
+                    self.backend, system_prompt, user_prompt, temperature, task, limiter=self.inflight
+                ):
+                    if first_chunk_at is None:
+                        first_chunk_at = time.perf_counter()
+                    if delta:
+                        chunks.append(delta)
+                        yield delta
+            except LLMUnavailable as e:
+                admission.settle(None, e.attempts)
+                yield self._fall_back(system_prompt, user_prompt, temperature, task, started, e)
+                return
+            except Exception as e:
+                admission.settle(usage, attempts)
+                print(f"\n{self.backend.name} stream for {task} broke off ({type(e).__name__}: {e})")
+                self._trace(task, started, "partial", error=f"{type(e).__name__}: {e}", attempts=attempts,
+                            first_chunk_at=first_chunk_at, queued=admission.waited)
+                return
+            admission.settle(usage, attempts)
+        self._trace(task, started, "ok", usage, attempts=attempts, first_chunk_at=first_chunk_at, queued=admission.waited)
+        
+        if cache_key is not None:
+            await self.cache.aput(cache_key, "".join(chunks))
+    
+    # ==================== LLM TASK 1: GENERATION ====================
+    async def generate_faction_response(self, faction_data, decision, game_context):
+        """Generate a faction's response to a player decision"""
+        system_prompt, user_prompt = self._faction_response_prompts(faction_data, decision, game_context)
+        return await self._call_gpt(system_prompt, user_prompt, task="generate_faction_response")
+    
+    async def stream_faction_response(self, faction_data, decision, game_context):
+        """Generate a faction's response, yielding its text as it arrives"""
+        system_prompt, user_prompt = self._faction_response_prompts(faction_data, decision, game_context)
+        async for chunk in self._stream_gpt(system_prompt, user_prompt, task="generate_faction_response"):
+            yield chunk
+    
+    async def generate_all_faction_responses(self, factions, decision, game_context, include_sentiment=False):
+        """Generate every faction's response in a single request, falling back per faction"""
+        system_prompt, user_prompt = self._all_faction_responses_prompts(factions, decision, game_context, include_sentiment)
+        response = await self._call_gpt(system_prompt, user_prompt, task="generate_all_faction_responses")
+        parsed = self._parse_all_faction_responses(response, list(factions), include_sentiment)
+        
+        async def complete(faction_id, faction_data):
+            faction_response, sentiment = parsed[faction_id]
+            if faction_response is None:
+                faction_response = await self.generate_faction_response(faction_data, decision, game_context)
+            if sentiment is None:
+                sentiment = await self.analyze_sentiment(faction_response)
+            return faction_id, (faction_response, sentiment)
+        
+        # Fallback calls for several factions run concurrently
+        return dict(await asyncio.gather(*(complete(fid, data) for fid, data in factions.items())))
+    
+    # ==================== LLM TASK 2: SENTIMENT ANALYSIS ====================
+    async def analyze_sentiment(self, faction_response):
+        """Analyze the sentiment of a faction's response"""
+        started = time.perf_counter()
+        local = self._local_sentiment(faction_response)
+        if local is not None:
+            self._trace("analyze_sentiment", started, "local")
+            return local
+        
+        system_prompt, user_prompt = self._sentiment_prompts(faction_response)
+        sentiment, _ = await self._call_structured(system_prompt, user_prompt, 0.3, "analyze_sentiment")
+        return self._sentiment_or_default(sentiment)
+    
+    # ==================== LLM TASK 3: SUMMARIZATION ====================
+    async def create_chronicle(self, turns_data, turn_range):
+        """Create a historical chronicle summarizing recent events"""
+        system_prompt, user_prompt = self._chronicle_prompts(turns_data, turn_range)
+        return await self._call_gpt(system_prompt, user_prompt, task="create_chronicle")
+    
+    async def continue_chronicle(self, previous_chronicle, reign_summary, turns_data, turn_range):
+        """Write the next chronicle incrementally and update the reign summary"""
+        system_prompt, user_prompt = self._continued_chronicle_prompts(previous_chronicle, reign_summary, turns_data, turn_range)
+        data, response = await self._call_structured(system_prompt, user_prompt, None, "continue_chronicle")
+        return self._continued_chronicle_or_default(data, response, reign_summary)
+    
+    # ==================== LLM TASK 4: TRANSFORMATION/PERSONALITY EVOLUTION ====================
+    async def evolve_personality(self, faction_data, recent_events):
+        """Transform a faction's personality based on accumulated experiences"""
+        system_prompt, user_prompt = self._personality_prompts(faction_data, recent_events)
+        evolution, _ = await self._call_structured(system_prompt, user_prompt, 0.6, "evolve_personality")
+        return self._personality_or_default(evolution, faction_data)
+    
+    # ==================== LLM TASK 5: PREDICTION ====================
+    async def predict_faction_reactions(self, decision_options, faction_states):
+        """Predict how factions might react to potential decisions"""
+        system_prompt, user_prompt = self._prediction_prompts(decision_options, faction_states)
+        return await self._call_gpt(system_prompt, user_prompt, temperature=0.5, task="predict_faction_reactions")
+    
+    # ==================== LLM TASK 6: CLASSIFICATION ====================
+    async def classify_kingdom_state(self, game_state):
+        """Classify the overall kingdom state based on faction relationships"""
+        system_prompt, user_prompt = self._classification_prompts(game_state)
+        classification, _ = await self._call_structured(system_prompt, user_prompt, 0.3, "classify_kingdom_state")
+        return self._classification_or_default(classification)
+    
+    # ==================== LLM TASK 7: REVIEW GENERATION ====================
+    async def generate_epic_review(self, full_game_state):
+        """Generate the final 'Epic Kingdom History' review"""
+        system_prompt, user_prompt = self._review_prompts(full_game_state)
+        return await self._call_gpt(system_prompt, user_prompt, temperature=0.8, task="generate_epic_review")
+    
+    # ==================== LLM TASK 8: NARRATIVE GENERATION ====================
+    async def generate_story_beat(self, game_context, trigger_type):
+        """Generate narrative story beats based on relationship trajectories"""
+        system_prompt, user_prompt = self._story_beat_prompts(game_context, trigger_type)
+        return await self._call_gpt(system_prompt, user_prompt, task="generate_story_beat")
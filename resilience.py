@@ -0,0 +1,399 @@
+"""
+Resilience for The Evolving Kingdom
+Keeps every LLM call bounded: per-task timeouts, retries with exponential
+backoff and jitter (honouring rate-limit hints), hedged duplicate requests
+for latency-critical tasks, and a circuit breaker that stops calling an API
+that keeps failing so KingdomAI can answer from its local fallback
+"""
+
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import (
+    LLM_TIMEOUTS, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_RATE_LIMIT_MAX_WAIT,
+    HEDGED_TASKS, HEDGE_AFTER, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS, LLM_ATTEMPT_WORKERS
+)
+
+NON_RETRYABLE_STATUS = {400, 401, 403, 404, 422}  # The same request would fail the same way again
+HEDGE_WINDOW = 50  # Recent latencies per task used to pick the hedge delay
+HEDGE_MIN_SAMPLES = 20  # Below this many, HEDGE_AFTER is used
+
+class LLMUnavailable(Exception):
+    """A call failed every attempt, or the circuit is open"""
+    
+    def __init__(self, message, attempts=0):
+        super().__init__(message)
+        self.attempts = attempts
+
+class EmptyCompletion(Exception):
+    """The API answered without any content"""
+
+class AttemptTimeout(Exception):
+    """No request of an attempt answered within the task's timeout"""
+
+def status_of(error):
+    """HTTP status of an API error, if it has one"""
+    return getattr(error, "status_code", None)
+
+def retry_after(error):
+    """Seconds a rate-limited response asked us to wait, if it said"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+async def first_chunk(chunks):
+    """The first (delta, usage) pair of an async stream, or ("", None) if it ends at once"""
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return "", None
+
+class CircuitBreaker:
+    """
+    Opens after threshold consecutive failed attempts; while open, calls fail fast
+    After reset_seconds a single trial call is let through (half-open) and its outcome
+    closes the circuit again or keeps it open for another period
+    """
+    
+    def __init__(self, threshold=None, reset_seconds=None):
+        self.threshold = CIRCUIT_FAILURE_THRESHOLD if threshold is None else threshold
+        self.reset_seconds = CIRCUIT_RESET_SECONDS if reset_seconds is None else reset_seconds
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+    
+    @property
+    def state(self):
+        """Current state: closed, open or half_open"""
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return "open"
+            return "half_open"
+    
+    def allow(self):
+        """Whether a request may be sent now"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+    
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+    
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+    
+    def release(self):
+        """An allowed call ended without an outcome (cancelled or abandoned); another trial may go"""
+        with self.lock:
+            self.trial_in_flight = False
+
+class Resilience:
+    """
+    Runs backend requests under the resilience policy
+    call() and acall() return (content, usage, attempts) or raise LLMUnavailable
+    """
+    
+    def __init__(self, timeouts=None, max_retries=None, backoff_base=None, backoff_max=None,
+                 hedged_tasks=None, hedge_after=None, breaker=None):
+        self.timeouts = dict(LLM_TIMEOUTS, **(timeouts or {}))
+        self.max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = LLM_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = LLM_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.hedged_tasks = set(HEDGED_TASKS if hedged_tasks is None else hedged_tasks)
+        self.hedge_after = HEDGE_AFTER if hedge_after is None else hedge_after
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.latencies = {}  # task -> recent successful latencies, for the hedge delay
+        self.lock = threading.Lock()
+        self._executor = None
+    
+    # ==================== POLICY ====================
+    def timeout_for(self, task):
+        return self.timeouts.get(task, self.timeouts["default"])
+    
+    def backoff(self, retry, error):
+        """Seconds to wait before retry number retry + 1 ("full jitter" exponential backoff)"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+        hint = retry_after(error)
+        if hint is not None:
+            delay = max(delay, min(hint, LLM_RATE_LIMIT_MAX_WAIT))
+        elif status_of(error) == 429:
+            # Rate limited without a hint: do not come back early
+            delay = max(delay, min(self.backoff_max, self.backoff_base * 2 ** retry))
+        return delay
+    
+    def should_retry(self, error, retry):
+        return retry < self.max_retries and status_of(error) not in NON_RETRYABLE_STATUS
+    
+    def hedge_delay(self, task):
+        """
+        Seconds to wait for the first request before sending a duplicate, or None not to hedge
+        Once enough calls have been seen this is the task's recent 95th percentile latency
+        """
+        if task not in self.hedged_tasks:
+            return None
+        with self.lock:
+            recent = sorted(self.latencies.get(task, ()))
+        if len(recent) < HEDGE_MIN_SAMPLES:
+            return self.hedge_after
+        return recent[int(0.95 * (len(recent) - 1))]
+    
+    def observe(self, task, latency):
+        with self.lock:
+            self.latencies.setdefault(task, deque(maxlen=HEDGE_WINDOW)).append(latency)
+    
+    # ==================== SYNC ====================
+    @property
+    def executor(self):
+        """Threads running requests, so a stuck request can be abandoned at its timeout"""
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=LLM_ATTEMPT_WORKERS)
+            return self._executor
+    
+    def call(self, backend, system_prompt, user_prompt, temperature, task):
+        """Send a request with timeouts, retries, hedging and the circuit breaker"""
+        attempts = 0
+        for retry in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise LLMUnavailable("circuit open after repeated failures", attempts)
+            try:
+                content, usage, sent = self._attempt(backend, system_prompt, user_prompt, temperature, task)
+            except Exception as e:
+                attempts += getattr(e, "requests_sent", 1)
+                self.breaker.record_failure()
+                if not self.should_retry(e, retry):
+                    raise LLMUnavailable(f"{type(e).__name__}: {e}", attempts) from e
+                time.sleep(self.backoff(retry, e))
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return content, usage, attempts + sent
+        raise LLMUnavailable("no attempts allowed", attempts)
+    
+    def _attempt(self, backend, system_prompt, user_prompt, temperature, task):
+        """One attempt: a request, plus a hedged duplicate if the first one is slow"""
+        timeout = self.timeout_for(task)
+        hedge = self.hedge_delay(task)
+        started = time.monotonic()
+        deadline = started + timeout
+        
+        def request():
+            content, usage = backend.complete(system_prompt, user_prompt, temperature, task, timeout=timeout)
+            if content is None:
+                raise EmptyCompletion(f"{task} returned no content")
+            return content, usage
+        
+        pending = {self.executor.submit(request)}
+        sent = 1
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            hedging = hedge is not None and sent == 1
+            done, pending = wait(pending, timeout=min(remaining, hedge) if hedging else remaining,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    content, usage = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self.observe(task, time.monotonic() - started)
+                return content, usage, sent
+            if hedging and not done:
+                pending.add(self.executor.submit(request))
+                sent += 1
+        
+        # Requests still running are abandoned; the backend's own timeout ends them
+        error = error or AttemptTimeout(f"{task} timed out after {timeout:g}s")
+        error.requests_sent = sent
+        raise error
+    
+    def stream(self, backend, system_prompt, user_prompt, temperature, task):
+        """
+        Stream a request as (text delta, usage, attempts) triples; usage comes with the last one
+        Retries and the circuit breaker cover the wait for the first chunk (bounded by the
+        backend's read timeout); after that a failure is raised as is, since text already
+        shown cannot be taken back. Streams are never hedged
+        """
+        attempts = 0
+        for retry in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise LLMUnavailable("circuit open after repeated failures", attempts)
+            attempts += 1
+            chunks = None
+            try:
+                chunks = backend.stream(system_prompt, user_prompt, temperature, task, timeout=self.timeout_for(task))
+                delta, usage = next(chunks, ("", None))
+                if not delta:
+                    raise EmptyCompletion(f"{task} streamed no content")
+            except Exception as e:
+                if chunks is not None:
+                    chunks.close()
+                self.breaker.record_failure()
+                if not self.should_retry(e, retry):
+                    raise LLMUnavailable(f"{type(e).__name__}: {e}", attempts) from e
+                time.sleep(self.backoff(retry, e))
+                continue
+            except BaseException:
+                self.breaker.release()
+                if chunks is not None:
+                    chunks.close()
+                raise
+            
+            try:
+                yield delta, usage, attempts
+                for delta, usage in chunks:
+                    yield delta, usage, attempts
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                # Abandoned by the reader (GeneratorExit) or interrupted: free the trial, end the request
+                self.breaker.release()
+                chunks.close()
+                raise
+            self.breaker.record_success()
+            return
+        raise LLMUnavailable("no attempts allowed", attempts)
+    
+    # ==================== ASYNC ====================
+    async def acall(self, backend, system_prompt, user_prompt, temperature, task, limiter=None):
+        """Async call(); limiter (a semaphore) is held by each request, not during backoff"""
+        attempts = 0
+        for retry in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise LLMUnavailable("circuit open after repeated failures", attempts)
+            try:
+                content, usage, sent = await self._aattempt(backend, system_prompt, user_prompt, temperature, task, limiter)
+            except Exception as e:
+                attempts += getattr(e, "requests_sent", 1)
+                self.breaker.record_failure()
+                if not self.should_retry(e, retry):
+                    raise LLMUnavailable(f"{type(e).__name__}: {e}", attempts) from e
+                await asyncio.sleep(self.backoff(retry, e))
+                continue
+            except BaseException:
+                self.breaker.release()  # Cancelled: no outcome, but a half-open trial must not stay taken
+                raise
+            self.breaker.record_success()
+            return content, usage, attempts + sent
+        raise LLMUnavailable("no attempts allowed", attempts)
+    
+    async def _aattempt(self, backend, system_prompt, user_prompt, temperature, task, limiter):
+        timeout = self.timeout_for(task)
+        hedge = self.hedge_delay(task)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + timeout
+        
+        async def request():
+            if limiter is None:
+                content, usage = await backend.complete(system_prompt, user_prompt, temperature, task, timeout=timeout)
+            else:
+                async with limiter:
+                    content, usage = await backend.complete(system_prompt, user_prompt, temperature, task, timeout=timeout)
+            if content is None:
+                raise EmptyCompletion(f"{task} returned no content")
+            return content, usage
+        
+        pending = {asyncio.ensure_future(request())}
+        sent = 1
+        error = None
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                hedging = hedge is not None and sent == 1
+                done, pending = await asyncio.wait(pending, timeout=min(remaining, hedge) if hedging else remaining,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        content, usage = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    self.observe(task, loop.time() - started)
+                    return content, usage, sent
+                if hedging and not done:
+                    pending.add(asyncio.ensure_future(request()))
+                    sent += 1
+        finally:
+            for future in pending:
+                future.cancel()
+        
+        error = error or AttemptTimeout(f"{task} timed out after {timeout:g}s")
+        error.requests_sent = sent
+        raise error
+    
+    async def astream(self, backend, system_prompt, user_prompt, temperature, task, limiter=None):
+        """Async stream(); limiter is held for the whole stream, including its first-chunk timeout"""
+        attempts = 0
+        timeout = self.timeout_for(task)
+        for retry in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise LLMUnavailable("circuit open after repeated failures", attempts)
+            attempts += 1
+            async with limiter if limiter is not None else nullcontext():
+                chunks = None
+                try:
+                    chunks = backend.stream(system_prompt, user_prompt, temperature, task, timeout=timeout)
+                    delta, usage = await asyncio.wait_for(first_chunk(chunks), timeout)
+                    if not delta:
+                        raise EmptyCompletion(f"{task} streamed no content")
+                except Exception as e:
+                    if chunks is not None:
+                        await chunks.aclose()
+                    error = e
+                except BaseException:
+                    self.breaker.release()
+                    if chunks is not None:
+                        await chunks.aclose()
+                    raise
+                else:
+                    error = None
+                    try:
+                        yield delta, usage, attempts
+                        async for delta, usage in chunks:
+                            yield delta, usage, attempts
+                    except Exception:
+                        self.breaker.record_failure()
+                        raise
+                    except BaseException:
+                        # Cancelled, or abandoned by the reader (GeneratorExit): free the trial, end the request
+                        self.breaker.release()
+                        await chunks.aclose()
+                        raise
+                    self.breaker.record_success()
+                    return
+            self.breaker.record_failure()
+            if not self.should_retry(error, retry):
+                raise LLMUnavailable(f"{type(error).__name__}: {error}", attempts) from error
+            await asyncio.sleep(self.backoff(retry, error))
+        raise LLMUnavailable("no attempts allowed", attempts)
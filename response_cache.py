@@ -0,0 +1,183 @@
+"""
+Response Cache for The Evolving Kingdom
+Content-addressed cache of LLM responses: an in-memory LRU tier in front of
+an on-disk tier with TTL and size-based eviction
+The async client uses aget/aput, which keep the disk tier off the event loop
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MEMORY_ENTRIES, RESPONSE_CACHE_DIR,
+    RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES
+)
+from storage import write_atomic
+
+class ResponseCache:
+    """Two-tier cache keyed on (model, temperature, system prompt, user prompt)"""
+    
+    def __init__(self, max_entries=RESPONSE_CACHE_MEMORY_ENTRIES, directory=RESPONSE_CACHE_DIR,
+                 ttl=RESPONSE_CACHE_TTL, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()  # key -> (created, response)
+        self.lock = threading.Lock()  # Guards the memory tier and the counters; held only briefly
+        self.disk_lock = threading.Lock()  # Guards the disk tier
+        self.hits = 0
+        self.misses = 0
+        self._disk_bytes = None  # Computed lazily on the first disk write
+    
+    @staticmethod
+    def make_key(model, temperature, system_prompt, user_prompt):
+        """Content address of a request"""
+        payload = json.dumps([model, temperature, system_prompt, user_prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """Return the cached response, or None on a miss or expired entry"""
+        response = self._get_memory(key)
+        if response is None:
+            response = self._get_disk(key)
+        return response
+    
+    def put(self, key, response):
+        """Store a response in both tiers"""
+        entry = (time.time(), response)
+        self._remember(key, entry)
+        self._put_disk(key, entry)
+    
+    async def aget(self, key):
+        """get() for the event loop: a disk lookup runs in a worker thread"""
+        response = self._get_memory(key)
+        if response is None:
+            response = await asyncio.to_thread(self._get_disk, key) if self.directory else self._get_disk(key)
+        return response
+    
+    async def aput(self, key, response):
+        """put() for the event loop: the disk write runs in a worker thread"""
+        entry = (time.time(), response)
+        self._remember(key, entry)
+        if self.directory:
+            await asyncio.to_thread(self._put_disk, key, entry)
+    
+    def clear(self):
+        """Drop every cached response"""
+        with self.lock:
+            self.memory.clear()
+        with self.disk_lock:
+            for path, _, _ in self._disk_files():
+                os.remove(path)
+            self._disk_bytes = 0
+    
+    # ==================== MEMORY TIER ====================
+    def _get_memory(self, key):
+        """The response from the memory tier (counted as a hit), or None"""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.memory.pop(key, None)
+            return None
+    
+    def _remember(self, key, entry):
+        with self.lock:
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+    
+    # ==================== DISK TIER ====================
+    def _get_disk(self, key):
+        """The response from the disk tier, promoted to memory; counts the hit or miss"""
+        with self.disk_lock:
+            entry = self._read_disk(key, time.time())
+        if entry is not None:
+            self._remember(key, entry)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+    
+    def _put_disk(self, key, entry):
+        with self.disk_lock:
+            self._write_disk(key, entry)
+    
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+    
+    def _read_disk(self, key, now):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                created, response = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - created >= self.ttl:
+            self._remove(path)
+            return None
+        return created, response
+    
+    def _write_disk(self, key, entry):
+        if not self.directory:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+        if os.path.exists(path):
+            self._remove(path)
+        write_atomic(path, json.dumps(list(entry), ensure_ascii=False))
+        self._disk_bytes += os.path.getsize(path)
+        if self._disk_bytes > self.max_bytes:
+            self._evict()
+    
+    def _evict(self):
+        """Drop expired files, then the oldest ones until the tier fits in max_bytes"""
+        now = time.time()
+        files = sorted(self._disk_files(), key=lambda item: item[2])
+        for path, size, mtime in files:
+            if self._disk_bytes <= self.max_bytes and now - mtime < self.ttl:
+                break
+            self._remove(path)
+    
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        if self._disk_bytes is not None:
+            self._disk_bytes -= size
+    
+    def _disk_files(self):
+        """(path, size, mtime) of every file in the disk tier"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+def default_cache():
+    """Cache built from config.py, or None when caching is disabled"""
+    return ResponseCache() if RESPONSE_CACHE_ENABLED else None
@@ -0,0 +1,274 @@
+"""
+LLM Request Scheduling for The Evolving Kingdom
+Decides which waiting LLM call is sent next when calls have to wait: calls the
+player is waiting on go first, background work is deferred until the client is
+idle, every task has a deadline after which it goes ahead regardless, and the
+account's request and token rate limits are accounted locally in token buckets
+Games sharing one client take turns within a priority class
+"""
+
+import time
+import asyncio
+import threading
+from config import (
+    SCHEDULER_ENABLED, SCHEDULER_MAX_ACTIVE, SCHEDULER_INTERACTIVE_RESERVE, SCHEDULER_BACKGROUND_HEADROOM,
+    LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, TASK_PRIORITIES, TASK_DEADLINES, TASK_REPLY_TOKENS
+)
+from telemetry import current_context
+
+INTERACTIVE, NORMAL, BACKGROUND = 0, 1, 2
+SERVED_GAMES_KEPT = 1000  # Games remembered for taking turns before those with nothing queued are forgotten
+
+class TokenBucket:
+    """A per-minute budget refilled continuously; settling a call may leave it in debt"""
+    
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+    
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_for(self, amount, floor, now):
+        """Seconds until amount can be taken leaving at least floor (0 = now)"""
+        self.refill(now)
+        amount = min(amount, self.capacity - floor)  # A call larger than the budget waits for a full bucket
+        missing = amount + floor - self.level
+        return max(0.0, missing / self.rate)
+    
+    def take(self, amount):
+        self.level -= amount
+
+class Ticket:
+    """A call waiting for, or holding, admission"""
+    
+    def __init__(self, task, priority, deadline, tokens, game, seq, wake):
+        self.task = task
+        self.priority = priority
+        self.deadline = deadline  # time.monotonic() by which it should have been admitted
+        self.tokens = tokens  # Estimated, until settled with the real usage
+        self.game = game
+        self.seq = seq
+        self.wake = wake  # Called (under the scheduler's lock) once admitted
+        self.enqueued = time.monotonic()
+        self.admitted = None
+
+class RequestScheduler:
+    """
+    Admits LLM calls in priority order; thread-safe, and usable from an event loop
+    A call holds its admission through its retries; extra requests and the
+    real token usage are charged to the rate buckets when it is settled
+    """
+    
+    def __init__(self, max_active=None, requests_per_minute=None, tokens_per_minute=None,
+                 priorities=None, deadlines=None, reserve=None, headroom=None):
+        self.max_active = max_active or SCHEDULER_MAX_ACTIVE
+        rpm = LLM_REQUESTS_PER_MINUTE if requests_per_minute is None else requests_per_minute
+        tpm = LLM_TOKENS_PER_MINUTE if tokens_per_minute is None else tokens_per_minute
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.priorities = dict(TASK_PRIORITIES, **(priorities or {}))
+        self.deadlines = dict(TASK_DEADLINES, **(deadlines or {}))
+        # Slots and rate budget background calls leave free for calls someone is waiting on
+        self.reserve = min(SCHEDULER_INTERACTIVE_RESERVE if reserve is None else reserve, self.max_active - 1)
+        self.headroom = SCHEDULER_BACKGROUND_HEADROOM if headroom is None else headroom
+        self.lock = threading.Lock()
+        self.waiting = []
+        self.active = 0
+        self.seq = 0
+        self.served = 0
+        self.last_served = {}  # game -> when it last had a call admitted (in admissions), for taking turns
+        self.stats_by_class = {}  # priority -> {"admitted", "wait_seconds", "max_wait_seconds"}
+    
+    def priority_of(self, task):
+        """A task's class; speculative calls (for options the player may not choose) are background"""
+        if current_context().get("speculative"):
+            return BACKGROUND
+        return self.priorities.get(task, self.priorities["default"])
+    
+    def admit(self, task, tokens):
+        """An Admission for a call of task estimated at tokens; enter it (with or async with) to wait"""
+        return Admission(self, task, tokens)
+    
+    # ==================== WAITING ====================
+    def acquire(self, task, tokens):
+        """Block until the call is admitted; returns its ticket"""
+        admitted = threading.Event()
+        ticket = self._enqueue(task, tokens, admitted.set)
+        while True:
+            retry_in = self._dispatch()
+            if admitted.wait(retry_in):
+                return ticket
+    
+    async def aacquire(self, task, tokens):
+        """Wait on the event loop until the call is admitted; returns its ticket"""
+        loop = asyncio.get_running_loop()
+        admitted = asyncio.Event()
+        ticket = self._enqueue(task, tokens, lambda: loop.call_soon_threadsafe(admitted.set))
+        try:
+            while not admitted.is_set():
+                retry_in = self._dispatch()
+                try:
+                    await asyncio.wait_for(admitted.wait(), retry_in)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            self._abandon(ticket)
+            raise
+        return ticket
+    
+    def release(self, ticket):
+        """A call has finished; its slot goes to the next waiting call"""
+        with self.lock:
+            self.active -= 1
+        self._dispatch()
+    
+    def settle(self, ticket, usage, requests=1):
+        """Charge the rate buckets for what a call really used (requests counts retries and hedges)"""
+        with self.lock:
+            if self.requests and requests != 1:
+                self.requests.take(requests - 1)  # Retries and hedges, or a refund if nothing was sent
+            if self.tokens and usage:
+                used = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+                self.tokens.take(used - ticket.tokens)
+                ticket.tokens = used
+    
+    def stats(self):
+        """Calls admitted per priority class, how long they waited, and what is queued now"""
+        with self.lock:
+            classes = {priority: dict(stats) for priority, stats in self.stats_by_class.items()}
+            queued = len(self.waiting)
+            active = self.active
+        for stats in classes.values():
+            stats["mean_wait_seconds"] = round(stats["wait_seconds"] / stats["admitted"], 6) if stats["admitted"] else 0.0
+        return {"active": active, "queued": queued, "classes": classes}
+    
+    # ==================== ADMISSION ====================
+    def _enqueue(self, task, tokens, wake):
+        priority = self.priority_of(task)
+        deadline = time.monotonic() + self.deadlines.get(task, self.deadlines["default"])
+        with self.lock:
+            self.seq += 1
+            ticket = Ticket(task, priority, deadline, tokens, current_context().get("game"), self.seq, wake)
+            self.waiting.append(ticket)
+        return ticket
+    
+    def _abandon(self, ticket):
+        """A waiting call was cancelled; give back its admission if it had just been granted"""
+        with self.lock:
+            if ticket.admitted is None:
+                self.waiting.remove(ticket)
+                return
+        self.release(ticket)
+    
+    def _class_of(self, ticket, now):
+        # Past its deadline, a call goes ahead of everything still within theirs
+        return INTERACTIVE if now >= ticket.deadline else ticket.priority
+    
+    def _dispatch(self):
+        """
+        Admit waiting calls while there is capacity, best first
+        Returns seconds until a rate bucket or a deadline could change that, or None
+        """
+        with self.lock:
+            while self.waiting:
+                now = time.monotonic()
+                ticket = min(self.waiting, key=lambda t: (
+                    self._class_of(t, now), self.last_served.get(t.game, 0), t.deadline, t.seq
+                ))
+                wait = self._blocked_for(ticket, now)
+                if wait != 0:
+                    return wait
+                self._grant(ticket, now)
+            return None
+    
+    def _blocked_for(self, ticket, now):
+        """0 if ticket can be admitted now, else seconds worth waiting before trying again (None = until a release)"""
+        background = self._class_of(ticket, now) == BACKGROUND
+        limit = self.max_active - self.reserve if background else self.max_active
+        if self.active >= limit:
+            # A release will dispatch again; a deadline passing may lift the background limit
+            return max(0.0, ticket.deadline - now) if background else None
+        
+        share = self.headroom if background else 0.0
+        waits = []
+        if self.requests:
+            waits.append(self.requests.wait_for(1, self.requests.capacity * share, now))
+        if self.tokens:
+            waits.append(self.tokens.wait_for(ticket.tokens, self.tokens.capacity * share, now))
+        wait = max(waits, default=0.0)
+        if background:
+            wait = min(wait, max(0.0, ticket.deadline - now))
+        return wait
+    
+    def _grant(self, ticket, now):
+        self.waiting.remove(ticket)
+        self.active += 1
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(ticket.tokens)
+        self.served += 1
+        self.last_served[ticket.game] = self.served
+        if len(self.last_served) > SERVED_GAMES_KEPT:
+            queued = {waiting.game for waiting in self.waiting}
+            self.last_served = {game: served for game, served in self.last_served.items() if game in queued}
+        ticket.admitted = now
+        
+        stats = self.stats_by_class.setdefault(ticket.priority, {"admitted": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0})
+        waited = now - ticket.enqueued
+        stats["admitted"] += 1
+        stats["wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        ticket.wake()
+
+class Admission:
+    """
+    A call's passage through the scheduler: entering waits for admission, leaving frees
+    the slot; settle() reports what the call used. Without a scheduler it does nothing
+    """
+    
+    def __init__(self, scheduler, task, tokens):
+        self.scheduler = scheduler
+        self.task = task
+        self.tokens = tokens
+        self.ticket = None
+    
+    @property
+    def waited(self):
+        """Seconds the call waited for admission"""
+        if self.ticket is None:
+            return 0.0
+        return self.ticket.admitted - self.ticket.enqueued
+    
+    def __enter__(self):
+        if self.scheduler:
+            self.ticket = self.scheduler.acquire(self.task, self.tokens)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if self.ticket is not None:
+            self.scheduler.release(self.ticket)
+    
+    async def __aenter__(self):
+        if self.scheduler:
+            self.ticket = await self.scheduler.aacquire(self.task, self.tokens)
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self.__exit__(exc_type, exc, tb)
+    
+    def settle(self, usage, requests=1):
+        if self.ticket is not None:
+            self.scheduler.settle(self.ticket, usage, requests)
+
+def reply_tokens(task):
+    """Tokens a task's answer is expected to take, charged until the real usage is known"""
+    return TASK_REPLY_TOKENS.get(task, TASK_REPLY_TOKENS["default"])
+
+def default_scheduler():
+    """RequestScheduler built from config.py, or None when scheduling is disabled"""
+    return RequestScheduler() if SCHEDULER_ENABLED else None
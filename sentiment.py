@@ -0,0 +1,160 @@
+"""
+Local Sentiment Analysis for The Evolving Kingdom
+A lexicon-based analyzer tuned to the courtly, medieval register of faction
+responses; returns the same {"sentiment", "intensity", "reasoning"} shape as
+KingdomAI.analyze_sentiment without a network round trip
+"""
+
+import math
+import re
+
+# Word weights: how strongly a word pulls a response positive (+) or negative (-)
+LEXICON = {
+    # Praise, loyalty and gratitude
+    "rejoice": 2.5, "celebrate": 2.0, "praise": 2.0, "hail": 2.0, "glory": 2.0, "glorious": 2.5,
+    "bless": 2.0, "blessed": 2.0, "blessing": 2.0, "grateful": 2.5, "gratitude": 2.5, "thank": 2.0,
+    "loyal": 2.0, "loyalty": 2.0, "devoted": 1.5, "faithful": 1.5, "honor": 1.5, "honour": 1.5,
+    "honored": 2.0, "noble": 1.0, "wise": 2.0, "wisdom": 2.0, "just": 1.0, "justice": 1.0,
+    "generous": 2.0, "generosity": 2.0, "benevolent": 2.0, "merciful": 1.5, "mercy": 1.0,
+    "splendid": 2.0, "magnificent": 2.0, "grand": 1.0, "triumph": 2.0, "victory": 2.0,
+    "prosper": 2.0, "prosperity": 2.0, "prosperous": 2.0, "profit": 1.5, "profitable": 2.0,
+    "flourish": 2.0, "thrive": 2.0, "bounty": 1.5, "plenty": 1.0, "fortune": 1.0,
+    "welcome": 1.5, "approve": 2.0, "support": 1.5, "favor": 1.5, "favour": 1.5, "delight": 2.5,
+    "delighted": 2.5, "joy": 2.5, "joyous": 2.5, "glad": 2.0, "pleased": 2.0, "happy": 2.0,
+    "hope": 1.0, "hopeful": 1.5, "trust": 1.5, "peace": 1.5, "peaceful": 1.5, "safe": 1.0,
+    "protect": 1.0, "relief": 1.5, "admire": 2.0, "applaud": 2.0, "cheer": 2.0, "good": 1.0,
+    "great": 1.5, "fair": 1.0, "kind": 1.5, "kindness": 1.5, "strength": 0.5, "unite": 1.5,
+    "united": 1.5, "harmony": 2.0, "divine": 1.0, "heaven": 1.0, "righteous": 1.5, "virtue": 1.5,
+    # Anger, fear and grievance
+    "outrage": -2.5, "outraged": -2.5, "betray": -3.0, "betrayal": -3.0, "betrayed": -3.0,
+    "treachery": -3.0, "treason": -2.5, "tyranny": -3.0, "tyrant": -3.0, "folly": -2.0,
+    "foolish": -2.0, "fool": -2.0, "curse": -2.5, "cursed": -2.5, "ruin": -2.5, "ruined": -2.5,
+    "ruinous": -2.5, "despair": -2.5, "anger": -2.0, "angry": -2.0, "fury": -2.5, "furious": -2.5,
+    "wrath": -2.5, "rage": -2.5, "disgrace": -2.5, "disgraceful": -2.5, "insult": -2.5,
+    "shame": -2.0, "shameful": -2.5, "rebel": -2.0, "rebellion": -2.5, "revolt": -2.5,
+    "starve": -2.5, "starving": -2.5, "hunger": -1.5, "suffer": -2.0, "suffering": -2.0,
+    "doom": -2.5, "doomed": -2.5, "woe": -2.0, "grievance": -2.0, "oppress": -2.5,
+    "oppression": -2.5, "burden": -1.5, "heresy": -2.5, "heretic": -2.5, "blasphemy": -2.5,
+    "sin": -1.5, "sinful": -2.0, "scorn": -2.0, "resent": -2.0, "resentment": -2.0,
+    "bitter": -2.0, "bitterness": -2.0, "fear": -1.5, "dread": -2.0, "warn": -1.0,
+    "warning": -1.0, "threat": -1.5, "threaten": -1.5, "danger": -1.5, "dangerous": -1.5,
+    "reckless": -2.0, "greed": -2.0, "greedy": -2.0, "corrupt": -2.0, "corruption": -2.0,
+    "cruel": -2.5, "cruelty": -2.5, "unjust": -2.5, "injustice": -2.5, "condemn": -2.5,
+    "oppose": -2.0, "protest": -1.5, "refuse": -1.5, "reject": -2.0, "deny": -1.0,
+    "loss": -1.5, "lose": -1.5, "poverty": -2.0, "misery": -2.5, "plague": -1.5,
+    "death": -1.5, "blood": -1.0, "tax": -1.0, "taxes": -1.0, "levy": -1.0, "exile": -1.0,
+    "abandon": -2.0, "abandoned": -2.0, "neglect": -2.0, "forsake": -2.0, "forsaken": -2.5,
+    "dismay": -2.0, "distrust": -2.0, "suspicion": -1.5, "regret": -1.5, "bad": -1.5,
+    "terrible": -2.5, "wicked": -2.5, "evil": -2.5, "vile": -2.5, "weak": -1.0,
+}
+
+NEGATORS = {"not", "no", "never", "nor", "neither", "hardly", "scarcely", "without", "cannot", "nothing"}
+INTENSIFIERS = {
+    "most": 1.5, "very": 1.5, "deeply": 1.6, "utterly": 1.8, "truly": 1.4, "greatly": 1.5,
+    "sorely": 1.6, "gravely": 1.6, "ever": 1.2, "so": 1.3, "such": 1.3, "exceedingly": 1.8
+}
+DAMPENERS = {"somewhat": 0.6, "perhaps": 0.7, "slightly": 0.5, "mildly": 0.5, "rather": 0.8, "cautiously": 0.7}
+CONTRASTS = {"but", "yet", "however", "though", "although"}
+
+NEGATION_WINDOW = 3  # Words after a negator whose polarity is flipped
+NEUTRAL_BAND = 0.75  # Net scores closer to zero than this read as neutral
+
+TOKEN_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?|[!?.;]")
+
+class LexiconSentimentAnalyzer:
+    """Scores text against the lexicon with negation, intensifier and contrast handling"""
+    
+    def __init__(self, lexicon=None):
+        self.lexicon = lexicon if lexicon is not None else LEXICON
+    
+    def _lookup(self, word):
+        """Lexicon weight of a word, trying simple suffix stripping"""
+        if word in self.lexicon:
+            return self.lexicon[word]
+        for suffix in ("s", "es", "ed", "d", "ing", "ly"):
+            if word.endswith(suffix) and word[:-len(suffix)] in self.lexicon:
+                return self.lexicon[word[:-len(suffix)]]
+        return None
+    
+    def score(self, text):
+        """
+        Score a text
+        Returns the net polarity, summed positive and negative evidence and the number of cue words
+        """
+        tokens = TOKEN_PATTERN.findall((text or "").lower())
+        positive = negative = 0.0
+        hits = 0
+        negate_left = 0
+        modifier = 1.0
+        clause_weight = 1.0
+        exclamations = 0
+        
+        for token in tokens:
+            if token == "!":
+                exclamations += 1
+            if token in ("!", "?", ".", ";"):
+                negate_left = 0
+                modifier = 1.0
+                continue
+            if token in CONTRASTS:
+                # What follows "but" usually carries the speaker's real position
+                positive *= 0.5
+                negative *= 0.5
+                clause_weight = 1.5
+                continue
+            if token in NEGATORS or token.endswith("n't"):
+                negate_left = NEGATION_WINDOW
+                continue
+            if token in INTENSIFIERS:
+                modifier *= INTENSIFIERS[token]
+                continue
+            if token in DAMPENERS:
+                modifier *= DAMPENERS[token]
+                continue
+            
+            weight = self._lookup(token)
+            if weight is not None:
+                value = weight * modifier * clause_weight
+                if negate_left:
+                    value = -value * 0.8  # "not wise" is milder than "foolish"
+                if value > 0:
+                    positive += value
+                else:
+                    negative -= value
+                hits += 1
+                modifier = 1.0
+            
+            if negate_left:
+                negate_left -= 1
+        
+        net = positive - negative
+        if exclamations:
+            net *= 1 + min(exclamations, 3) * 0.1
+        return net, positive, negative, hits
+    
+    def analyze(self, text):
+        """
+        Analyze a faction response
+        Returns (result dict in the KingdomAI.analyze_sentiment shape, confidence 0.0-1.0)
+        """
+        net, positive, negative, hits = self.score(text)
+        
+        if abs(net) < NEUTRAL_BAND:
+            sentiment = "neutral"
+        elif net > 0:
+            sentiment = "positive"
+        else:
+            sentiment = "negative"
+        intensity = round(min(1.0, 0.3 + 0.7 * (1 - math.exp(-abs(net) / 4))), 2)
+        
+        # Confident when there is plenty of evidence and it mostly points one way
+        evidence = 1 - math.exp(-hits / 2)
+        agreement = abs(positive - negative) / (positive + negative) if positive + negative else 0.0
+        confidence = round(evidence * agreement if sentiment != "neutral" else evidence * (1 - agreement) * 0.5, 2)
+        
+        result = {
+            "sentiment": sentiment,
+            "intensity": intensity,
+            "reasoning": f"Lexicon: {hits} cue word(s), net polarity {net:+.1f}"
+        }
+        return result, confidence
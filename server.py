@@ -0,0 +1,460 @@
+"""
+Game Server for The Evolving Kingdom
+Hosts many reigns at once behind a small JSON-over-HTTP API. Every session has
+its own game state and KingdomEngine; all of them share one AsyncKingdomAI on
+the server's event loop, whose request scheduler serves the sessions in turn
+(scheduler.RequestScheduler)
+
+    python -m kingdom serve --port 8080 --backend mock
+
+    POST   /games                 {"player_name": "..."}            start a reign
+    GET    /games/<id>                                              factions and the turn's options
+    POST   /games/<id>/turns      {"choice": 1} or {"decision": "..."}
+    POST   /games/<id>/review                                       the epic review, once the reign is over
+    DELETE /games/<id>                                              end the session
+
+With a store (--state-dir or --db) a reign is saved and dropped from memory once
+its review is served or it has been idle for SERVER_IDLE_SECONDS; asking for it
+again reopens it from the store
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    TOTAL_TURNS, MAX_INFLIGHT_REQUESTS, SERVER_HOST, SERVER_PORT, SERVER_MAX_SESSIONS,
+    SERVER_TURN_WORKERS, SERVER_MAX_BODY, SERVER_IDLE_SECONDS, SERVER_SWEEP_SECONDS
+)
+from game_state import GameState
+from storage import create_store
+from sqlite_store import SQLiteGameStateStore
+from openai_client import AsyncKingdomAI
+from llm_backends import create_async_backend
+from engine import KingdomEngine, TurnObserver, decision_options
+from scheduler import RequestScheduler
+from telemetry import span_context
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+GAME_PATH = re.compile(r"^/games/([0-9a-f]{12})(/turns|/review)?/?$")
+
+class HTTPError(Exception):
+    """A request the server answers with an error status"""
+    
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class TurnLog(TurnObserver):
+    """Collects what happened during a turn besides the faction responses, for the turn's reply"""
+    
+    def __init__(self):
+        self.events = {}
+    
+    def chronicle_written(self, turn_range, chronicle):
+        self.events["chronicle"] = chronicle
+    
+    def personality_evolved(self, faction_id, faction_data, old_personality, evolution):
+        self.events.setdefault("evolutions", {})[faction_id] = {
+            "from": old_personality,
+            "to": evolution["new_personality"],
+            "reason": evolution["key_change"]
+        }
+    
+    def kingdom_classified(self, classification):
+        self.events["kingdom_state"] = classification
+    
+    def story_beat_added(self, trigger, beat):
+        self.events["story_beat"] = {"trigger": trigger, "beat": beat}
+
+class Session:
+    """One player's reign: its own game state and engine, sharing the server's AI"""
+    
+    def __init__(self, game_id, game_state, engine, total_turns):
+        self.id = game_id
+        self.game_state = game_state
+        self.engine = engine
+        self.total_turns = total_turns
+        self.work = None  # Future of the turn, review or save running in a worker
+        self.closed = False
+        self.last_used = time.monotonic()
+        self.review = None
+    
+    @property
+    def busy(self):
+        """A turn or the review is being generated, or the session is being saved"""
+        return self.work is not None and not self.work.done()
+    
+    @property
+    def turn(self):
+        return self.game_state.state["current_turn"]
+    
+    @property
+    def finished(self):
+        return self.turn > self.total_turns
+    
+    def status(self):
+        """What a player needs to see before deciding"""
+        state = self.game_state.state
+        return {
+            "game": self.id,
+            "player_name": state["player_name"],
+            "turn": self.turn,
+            "total_turns": self.total_turns,
+            "finished": self.finished,
+            "average_trust": round(self.game_state.get_average_trust(), 2),
+            "factions": {
+                fid: {
+                    "name": f["name"],
+                    "personality": f["current_personality"],
+                    "trust": f["trust_score"]
+                }
+                for fid, f in state["factions"].items()
+            },
+            "latest_chronicle": self.game_state.get_latest_chronicle(),
+            "options": [] if self.finished else decision_options(self.turn)
+        }
+    
+    def choose(self, body):
+        """The decision a turn request picks: {"choice": n} (1-based) or {"decision": one of the options}"""
+        options = decision_options(self.turn)
+        if "choice" in body:
+            choice = body["choice"]
+            if isinstance(choice, int) and not isinstance(choice, bool) and 1 <= choice <= len(options):
+                return options[choice - 1]
+            raise HTTPError(400, f"choice must be 1-{len(options)}")
+        if body.get("decision") in options:
+            return body["decision"]
+        raise HTTPError(400, "give a choice (1-based) or one of the options as decision")
+    
+    def play_turn(self, decision):
+        """Play a turn; runs in a worker thread, waiting on the event loop for LLM calls"""
+        log = TurnLog()
+        turn = self.turn
+        with span_context(game=self.id):
+            turn_data = self.engine.play_turn(turn, decision, log)
+        return dict(turn_data, **log.events)
+    
+    def final_review(self):
+        """Generate the epic review; runs in a worker thread"""
+        with span_context(game=self.id):
+            self.review = self.engine.final_review()
+        return self.review
+    
+    def close(self):
+        self.engine.close()
+        self.game_state.flush()
+        if hasattr(self.game_state, "close"):
+            self.game_state.close()
+
+class KingdomServer:
+    """
+    Sessions keyed by game id, and the HTTP front end that drives them
+    Turns run in worker threads (the engine is synchronous); their LLM calls
+    run on the server's event loop through the one shared AsyncKingdomAI
+    """
+    
+    def __init__(self, ai, total_turns=TOTAL_TURNS, state_dir=None, db_path=None, storage=None,
+                 max_sessions=None, turn_workers=None, idle_seconds=None):
+        self.ai = ai
+        self.total_turns = total_turns
+        self.state_dir = state_dir  # One state file per game (in the STORAGE_BACKEND format)
+        self.db_path = db_path  # Or every game in one SQLite database
+        self.storage = storage
+        self.max_sessions = SERVER_MAX_SESSIONS if max_sessions is None else max_sessions
+        self.idle_seconds = SERVER_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self.workers = ThreadPoolExecutor(max_workers=turn_workers or SERVER_TURN_WORKERS)
+        self.sessions = {}
+        self.opening = {}  # game_id -> future of a session being started or reopened from the store
+        self.closing = {}  # game_id -> future of a dropped session's save
+        self.stopping = False  # Shutting down: requests are refused
+        self.loop = None
+    
+    @property
+    def stored(self):
+        """Sessions are saved, so they can be dropped from memory and reopened"""
+        return bool(self.db_path or self.state_dir)
+    
+    # ==================== SESSIONS ====================
+    def _game_state(self, game_id):
+        """A game state for game_id in the configured store (nothing is saved without one)"""
+        if self.db_path:
+            return SQLiteGameStateStore(self.db_path, game_id)
+        if self.state_dir:
+            path = os.path.join(self.state_dir, f"{game_id}.json")
+            return GameState(path, store=create_store(path, self.storage))
+        return GameState(store=create_store(None, "memory"))
+    
+    def _session(self, game_id, game_state):
+        engine = KingdomEngine(game_state, self.ai, total_turns=self.total_turns, pool=self.workers,
+                               loop=self.loop, streaming=False, background_post_turn=False)
+        return Session(game_id, game_state, engine, self.total_turns)
+    
+    def _new_session(self, game_id, player_name):
+        """Start a reign in the store; runs in a worker thread"""
+        game_state = self._game_state(game_id)
+        game_state.initialize_new_game(player_name)
+        return self._session(game_id, game_state)
+    
+    def _saved_session(self, game_id):
+        """Reopen a saved reign, or None if there is none; runs in a worker thread"""
+        game_state = self._game_state(game_id)
+        if game_state.load():
+            return self._session(game_id, game_state)
+        if hasattr(game_state, "close"):
+            game_state.close()
+        return None
+    
+    async def _check_capacity(self):
+        if len(self.sessions) + len(self.opening) >= self.max_sessions:
+            await self.drop_idle()
+        if len(self.sessions) + len(self.opening) >= self.max_sessions:
+            raise HTTPError(503, "too many reigns in progress; try again later")
+    
+    async def _open(self, game_id, fn, *args):
+        """Build a session in a worker thread and register it (unless fn found no game)"""
+        self.opening[game_id] = opening = self.workers.submit(fn, game_id, *args)
+        try:
+            session = await asyncio.wrap_future(opening)
+        finally:
+            del self.opening[game_id]
+        if session is not None:
+            self.sessions[game_id] = session
+        return session
+    
+    async def create_session(self, player_name):
+        """Start a new reign (its store is written in a worker thread)"""
+        await self._check_capacity()
+        return await self._open(uuid.uuid4().hex[:12], self._new_session, player_name)
+    
+    async def get_session(self, game_id):
+        """A live session, or one reopened from the store (in a worker thread) after a restart or a drop"""
+        session = self.sessions.get(game_id)
+        if session is not None:
+            session.last_used = time.monotonic()
+            return session
+        if game_id in self.closing:
+            # Being dropped: its save has to land before it is read back
+            await asyncio.wait([asyncio.wrap_future(self.closing[game_id])])
+            return await self.get_session(game_id)
+        if game_id in self.opening:
+            # Another request is already reopening it; share its result
+            session = await asyncio.wrap_future(self.opening[game_id])
+        elif self.stored:
+            await self._check_capacity()
+            if game_id in self.sessions or game_id in self.opening or game_id in self.closing:
+                return await self.get_session(game_id)  # Another request got to it while room was made
+            session = await self._open(game_id, self._saved_session)
+        if session is None:
+            raise HTTPError(404, f"no game {game_id}")
+        return session
+    
+    def _drop(self, session):
+        """
+        Forget a session and save it in a worker thread; returns the save's future
+        Requests still holding the session find it busy, then closed
+        """
+        del self.sessions[session.id]
+        session.closed = True
+        session.work = closing = self.workers.submit(session.close)
+        self.closing[session.id] = closing
+        
+        def saved(future):
+            if self.closing.get(session.id) is future:
+                del self.closing[session.id]
+        closing.add_done_callback(lambda future: self.loop.call_soon_threadsafe(saved, future))
+        return asyncio.wrap_future(closing)
+    
+    async def close_session(self, game_id):
+        """Save and forget a session"""
+        session = self.sessions.get(game_id)
+        if session is None:
+            raise HTTPError(404, f"no game {game_id}")
+        if session.busy:
+            raise HTTPError(409, "this reign is busy with a turn")
+        await self._drop(session)
+    
+    async def drop_idle(self):
+        """Save and forget the stored sessions nobody has asked for in idle_seconds; returns how many"""
+        if not self.stored:
+            return 0  # Dropping would lose them
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [session for session in self.sessions.values() if not session.busy and session.last_used < cutoff]
+        saves = [self._drop(session) for session in idle]
+        if saves:
+            await asyncio.wait(saves)
+        return len(idle)
+    
+    async def sweep(self):
+        """Drop idle sessions every SERVER_SWEEP_SECONDS, for as long as the server runs"""
+        while True:
+            await asyncio.sleep(SERVER_SWEEP_SECONDS)
+            await self.drop_idle()
+    
+    async def run(self, session, fn, *args):
+        """Run a session's turn or review in a worker thread; one at a time per session"""
+        if session.busy:
+            raise HTTPError(409, "this reign is already busy with a turn")
+        if session.closed:
+            raise HTTPError(409, "this reign was just saved and closed; ask again")
+        session.work = self.workers.submit(fn, *args)
+        return await asyncio.wrap_future(session.work)
+    
+    # ==================== API ====================
+    async def dispatch(self, method, path, body):
+        """Route one request; returns (status, JSON-serializable reply)"""
+        if self.stopping:
+            raise HTTPError(503, "the server is shutting down")
+        if path.rstrip("/") == "/games":
+            if method != "POST":
+                raise HTTPError(405, "use POST to start a reign")
+            name = str(body.get("player_name") or "").strip()[:80] or "Anonymous Monarch"
+            session = await self.create_session(name)
+            return 201, session.status()
+        
+        match = GAME_PATH.match(path)
+        if match is None:
+            raise HTTPError(404, f"no such resource {path}")
+        game_id, action = match.groups()
+        session = await self.get_session(game_id)
+        
+        if action is None:
+            if method == "GET":
+                return 200, session.status()
+            if method == "DELETE":
+                await self.close_session(game_id)
+                return 200, {"game": game_id, "closed": True}
+            raise HTTPError(405, "use GET or DELETE")
+        
+        if method != "POST":
+            raise HTTPError(405, "use POST")
+        if action == "/turns":
+            if session.finished:
+                raise HTTPError(409, "the reign is over; ask for the review")
+            turn = await self.run(session, session.play_turn, session.choose(body))
+            return 200, {"turn": turn, "status": session.status()}
+        
+        if not session.finished:
+            raise HTTPError(409, f"the reign is still in turn {session.turn}")
+        review = session.review if session.review is not None else await self.run(session, session.final_review)
+        if self.stored and not session.closed:
+            await self._drop(session)  # The reign is over; the store keeps it
+        return 200, {"game": game_id, "review": review}
+    
+    # ==================== HTTP ====================
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection (HTTP/1.1 keep-alive)"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    status, reply = await self.dispatch(method, path, body)
+                except HTTPError as e:
+                    status, reply, headers = e.status, {"error": str(e)}, {}
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                except Exception as e:
+                    status, reply, headers = 500, {"error": f"{type(e).__name__}: {e}"}, {}
+                # After a malformed request the rest of the stream cannot be trusted
+                keep_alive = headers.get("connection", "").lower() != "close" and status not in (400, 413)
+                await write_response(writer, status, reply, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    async def serve(self, host=None, port=None, ready=None):
+        """Serve until cancelled, then save every session; ready(address) is called once listening"""
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle, host or SERVER_HOST, port or SERVER_PORT)
+        if ready:
+            ready(server.sockets[0].getsockname())
+        sweeper = asyncio.ensure_future(self.sweep())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+            await self.shutdown()
+            if self.ai.tracer:
+                self.ai.tracer.close()
+            await self.ai.aclose()
+    
+    async def shutdown(self):
+        """
+        Save every session in the workers once its turn in flight is done (the turn's LLM
+        calls still need this loop), then stop the workers
+        """
+        self.stopping = True
+        while self.opening or any(session.busy for session in self.sessions.values()):
+            running = list(self.opening.values()) + [session.work for session in self.sessions.values() if session.busy]
+            await asyncio.wait([asyncio.wrap_future(future) for future in running])
+            await asyncio.sleep(0)  # Let their requests register the sessions they opened
+        saves = [asyncio.wrap_future(future) for future in self.closing.values()]
+        saves += [self._drop(session) for session in list(self.sessions.values())]
+        if saves:
+            await asyncio.wait(saves)
+        self.workers.shutdown(wait=True)
+
+async def read_request(reader):
+    """(method, path, headers, JSON body) of the next request, or None when the client is done"""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, path, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+    
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "bad Content-Length")
+    if length > SERVER_MAX_BODY:
+        raise HTTPError(413, "request body too large")
+    body = {}
+    if length:
+        try:
+            body = json.loads(await reader.readexactly(length))
+        except ValueError:
+            raise HTTPError(400, "the body must be JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "the body must be a JSON object")
+    return method.upper(), path.split("?", 1)[0], headers, body
+
+async def write_response(writer, status, reply, keep_alive=True):
+    """Send a JSON reply"""
+    payload = json.dumps(reply, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + payload)
+    await writer.drain()
+
+def shared_ai(backend=None, max_inflight=None, **mock_options):
+    """The AsyncKingdomAI every session shares, scheduling their calls fairly"""
+    max_inflight = max_inflight or MAX_INFLIGHT_REQUESTS
+    return AsyncKingdomAI(
+        backend=create_async_backend(backend, **mock_options), max_inflight=max_inflight,
+        scheduler=RequestScheduler(max_active=max_inflight)
+    )
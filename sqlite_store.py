@@ -0,0 +1,340 @@
+"""
+SQLite Storage for The Evolving Kingdom
+Hosts many games in one database with indexed tables per kind of record
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+from game_state import GameState
+from models import to_json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    player_name TEXT NOT NULL,
+    current_turn INTEGER NOT NULL,
+    game_started TEXT,
+    updated_at TEXT NOT NULL,
+    meta TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS factions (
+    game_id TEXT NOT NULL,
+    faction_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    base_personality TEXT NOT NULL,
+    current_personality TEXT NOT NULL,
+    trust_score INTEGER NOT NULL,
+    extra TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (game_id, faction_id)
+);
+CREATE TABLE IF NOT EXISTS memories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    game_id TEXT NOT NULL,
+    faction_id TEXT NOT NULL,
+    turn INTEGER,
+    trust_change INTEGER,
+    sentiment TEXT,
+    intensity REAL,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_memories_game ON memories (game_id, faction_id, id);
+CREATE TABLE IF NOT EXISTS personality_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    game_id TEXT NOT NULL,
+    faction_id TEXT NOT NULL,
+    turn INTEGER,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_personality_log_game ON personality_log (game_id, faction_id, id);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    game_id TEXT NOT NULL,
+    turn INTEGER,
+    decision TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_turns_game ON turns (game_id, id);
+CREATE TABLE IF NOT EXISTS chronicles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    game_id TEXT NOT NULL,
+    turns TEXT,
+    chronicle TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chronicles_game ON chronicles (game_id, id);
+CREATE TABLE IF NOT EXISTS story_beats (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    game_id TEXT NOT NULL,
+    turn INTEGER,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_story_beats_game ON story_beats (game_id, id);
+CREATE TABLE IF NOT EXISTS classifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    game_id TEXT NOT NULL,
+    turn INTEGER,
+    state TEXT,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_classifications_game ON classifications (game_id, id);
+"""
+
+# Top-level state keys that live in their own tables; everything else goes to games.meta
+TABLE_KEYS = {
+    "player_name", "current_turn", "game_started", "factions",
+    "turn_history", "kingdom_chronicles", "story_beats", "kingdom_state_history"
+}
+FACTION_COLUMNS = {"id", "name", "base_personality", "current_personality", "trust_score", "memory", "personality_evolution_log"}
+GAME_TABLES = ("games", "factions", "memories", "personality_log", "turns", "chronicles", "story_beats", "classifications")
+
+def connect(db_path):
+    """Open a connection in WAL mode (readers never block the writer)"""
+    conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+class SQLiteStore:
+    """
+    Storage backend keeping one game of a shared database
+    Records are append-only, so a commit inserts only what was added since
+    the last one, inside a single per-game transaction
+    """
+    
+    def __init__(self, db_path, game_id, conn=None):
+        self.db_path = db_path
+        self.game_id = game_id
+        self.conn = conn if conn is not None else connect(db_path)
+        self._persisted = {}  # List name -> number of entries already in the database
+    
+    def load(self):
+        """Rebuild the game's state from its tables"""
+        game = self.conn.execute("SELECT * FROM games WHERE game_id = ?", (self.game_id,)).fetchone()
+        if game is None:
+            return None, []
+        
+        state = {
+            "player_name": game["player_name"],
+            "current_turn": game["current_turn"],
+            "game_started": game["game_started"],
+            "factions": {}
+        }
+        state.update(json.loads(game["meta"]))
+        
+        for row in self.conn.execute(
+            "SELECT * FROM factions WHERE game_id = ? ORDER BY position", (self.game_id,)
+        ):
+            extra = json.loads(row["extra"])
+            faction = {
+                "id": row["faction_id"],
+                "name": row["name"],
+                "base_personality": row["base_personality"],
+                "current_personality": row["current_personality"],
+                "trust_score": row["trust_score"],
+                # The table keeps every entry; those moved to the warm tier are not hot memory
+                "memory": self._entries("memories", row["faction_id"], skip=extra.get("memory_trimmed", 0)),
+                "personality_evolution_log": self._entries("personality_log", row["faction_id"])
+            }
+            faction.update(extra)
+            state["factions"][row["faction_id"]] = faction
+        
+        state["turn_history"] = [json.loads(r["record"]) for r in self.conn.execute(
+            "SELECT record FROM turns WHERE game_id = ? ORDER BY id", (self.game_id,)
+        )]
+        state["kingdom_chronicles"] = [
+            {"turns": r["turns"], "chronicle": r["chronicle"], "timestamp": r["timestamp"]}
+            for r in self.conn.execute(
+                "SELECT turns, chronicle, timestamp FROM chronicles WHERE game_id = ? ORDER BY id", (self.game_id,)
+            )
+        ]
+        state["story_beats"] = [json.loads(r["entry"]) for r in self.conn.execute(
+            "SELECT entry FROM story_beats WHERE game_id = ? ORDER BY id", (self.game_id,)
+        )]
+        state["kingdom_state_history"] = [json.loads(r["entry"]) for r in self.conn.execute(
+            "SELECT entry FROM classifications WHERE game_id = ? ORDER BY id", (self.game_id,)
+        )]
+        
+        self._mark_persisted(state)
+        return state, []
+    
+    def _entries(self, table, faction_id, skip=0):
+        return [json.loads(r["entry"]) for r in self.conn.execute(
+            f"SELECT entry FROM {table} WHERE game_id = ? AND faction_id = ? ORDER BY id LIMIT -1 OFFSET ?",
+            (self.game_id, faction_id, skip)
+        )]
+    
+    def reset(self, state):
+        """Start a new game, replacing any earlier game with the same id"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in GAME_TABLES:
+                self.conn.execute(f"DELETE FROM {table} WHERE game_id = ?", (self.game_id,))
+            self._persisted = {}
+            self._write(state)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+    
+    def commit(self, state, events):
+        """Write everything changed since the last commit in one transaction"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._write(state)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+    
+    def close(self):
+        self.conn.close()
+    
+    def _write(self, state):
+        meta = {k: v for k, v in state.items() if k not in TABLE_KEYS}
+        self.conn.execute(
+            """INSERT INTO games (game_id, player_name, current_turn, game_started, updated_at, meta)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (game_id) DO UPDATE SET
+                   player_name = excluded.player_name,
+                   current_turn = excluded.current_turn,
+                   updated_at = excluded.updated_at,
+                   meta = excluded.meta""",
+            (self.game_id, state["player_name"], state["current_turn"], state.get("game_started"),
+             datetime.now().isoformat(), json.dumps(meta, ensure_ascii=False, default=to_json))
+        )
+        
+        for position, (faction_id, faction) in enumerate(state["factions"].items()):
+            extra = {k: v for k, v in faction.items() if k not in FACTION_COLUMNS}
+            self.conn.execute(
+                """INSERT INTO factions (game_id, faction_id, position, name, base_personality,
+                                         current_personality, trust_score, extra)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (game_id, faction_id) DO UPDATE SET
+                       current_personality = excluded.current_personality,
+                       trust_score = excluded.trust_score,
+                       extra = excluded.extra""",
+                (self.game_id, faction_id, position, faction["name"], faction["base_personality"],
+                 faction["current_personality"], faction["trust_score"], json.dumps(extra, ensure_ascii=False, default=to_json))
+            )
+            for entry in self._unsaved_memory(faction_id, faction):
+                self.conn.execute(
+                    """INSERT INTO memories (game_id, faction_id, turn, trust_change, sentiment, intensity, entry)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (self.game_id, faction_id, entry.get("turn"), entry.get("trust_change"),
+                     entry.get("sentiment"), entry.get("intensity"), json.dumps(entry, ensure_ascii=False, default=to_json))
+                )
+            for entry in self._unsaved(f"personality:{faction_id}", faction["personality_evolution_log"]):
+                self.conn.execute(
+                    "INSERT INTO personality_log (game_id, faction_id, turn, entry) VALUES (?, ?, ?, ?)",
+                    (self.game_id, faction_id, entry.get("turn"), json.dumps(entry, ensure_ascii=False, default=to_json))
+                )
+        
+        for record in self._unsaved("turn_history", state["turn_history"]):
+            self.conn.execute(
+                "INSERT INTO turns (game_id, turn, decision, record) VALUES (?, ?, ?, ?)",
+                (self.game_id, record.get("turn"), record.get("decision"), json.dumps(record, ensure_ascii=False, default=to_json))
+            )
+        for entry in self._unsaved("kingdom_chronicles", state["kingdom_chronicles"]):
+            self.conn.execute(
+                "INSERT INTO chronicles (game_id, turns, chronicle, timestamp) VALUES (?, ?, ?, ?)",
+                (self.game_id, entry["turns"], entry["chronicle"], entry["timestamp"])
+            )
+        for entry in self._unsaved("story_beats", state["story_beats"]):
+            self.conn.execute(
+                "INSERT INTO story_beats (game_id, turn, entry) VALUES (?, ?, ?)",
+                (self.game_id, entry.get("turn"), json.dumps(entry, ensure_ascii=False, default=to_json))
+            )
+        for entry in self._unsaved("kingdom_state_history", state["kingdom_state_history"]):
+            self.conn.execute(
+                "INSERT INTO classifications (game_id, turn, state, entry) VALUES (?, ?, ?, ?)",
+                (self.game_id, entry.get("turn"), entry.get("state"), json.dumps(entry, ensure_ascii=False, default=to_json))
+            )
+        
+        self._mark_persisted(state)
+    
+    def _unsaved(self, key, entries):
+        """Entries appended to a list since the last commit"""
+        return entries[self._persisted.get(key, 0):]
+    
+    def _unsaved_memory(self, faction_id, faction):
+        """
+        Memory entries appended since the last commit
+        The hot list loses entries from its front as they move to the warm tier, so
+        positions are counted over every entry ever appended (memory_trimmed + len)
+        """
+        trimmed = faction.get("memory_trimmed", 0)
+        return faction["memory"][max(0, self._persisted.get(f"memory:{faction_id}", 0) - trimmed):]
+    
+    def _mark_persisted(self, state):
+        self._persisted = {
+            "turn_history": len(state["turn_history"]),
+            "kingdom_chronicles": len(state["kingdom_chronicles"]),
+            "story_beats": len(state["story_beats"]),
+            "kingdom_state_history": len(state["kingdom_state_history"])
+        }
+        for faction_id, faction in state["factions"].items():
+            self._persisted[f"memory:{faction_id}"] = faction.get("memory_trimmed", 0) + len(faction["memory"])
+            self._persisted[f"personality:{faction_id}"] = len(faction["personality_evolution_log"])
+
+class SQLiteGameStateStore(GameState):
+    """
+    A GameState kept in a shared SQLite database under its own game_id
+    Same API as GameState; many games can live in one database file
+    """
+    
+    def __init__(self, db_path, game_id, flush_interval=None, conn=None):
+        super().__init__(
+            filename=db_path,
+            flush_interval=flush_interval,
+            store=SQLiteStore(db_path, game_id, conn=conn)
+        )
+        self.game_id = game_id
+    
+    def close(self):
+        """Flush pending changes and close the database connection"""
+        if self.state is not None:
+            self.flush()
+        self.store.close()
+
+# ==================== LISTING & ANALYTICS ====================
+def list_games(db_path):
+    """List hosted games with their progress, without loading any game state"""
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            """SELECT g.game_id, g.player_name, g.current_turn, g.updated_at,
+                      AVG(f.trust_score) AS average_trust
+               FROM games g LEFT JOIN factions f ON f.game_id = g.game_id
+               GROUP BY g.game_id
+               ORDER BY g.updated_at DESC"""
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+def faction_trust_report(db_path):
+    """Average trust and sentiment counts per faction across all hosted games"""
+    conn = connect(db_path)
+    try:
+        report = {}
+        for row in conn.execute(
+            "SELECT faction_id, AVG(trust_score) AS average_trust, COUNT(*) AS games FROM factions GROUP BY faction_id"
+        ):
+            report[row["faction_id"]] = {
+                "average_trust": row["average_trust"],
+                "games": row["games"],
+                "sentiments": {}
+            }
+        for row in conn.execute(
+            """SELECT faction_id, sentiment, COUNT(*) AS n FROM memories
+               WHERE sentiment IS NOT NULL GROUP BY faction_id, sentiment"""
+        ):
+            if row["faction_id"] in report:
+                report[row["faction_id"]]["sentiments"][row["sentiment"]] = row["n"]
+        return report
+    finally:
+        conn.close()
@@ -0,0 +1,168 @@
+"""
+Storage Backends for The Evolving Kingdom
+GameState records every mutation as an event; a store decides how to persist it
+"""
+
+import json
+import os
+import tempfile
+from config import STORAGE_BACKEND, EVENT_LOG_COMPACT_EVERY, SAVE_FORMAT
+from models import to_json, plain_state
+from snapshot import is_snapshot, encode_snapshot, decode_snapshot
+
+SAVE_FORMATS = ("json", "binary")
+
+def write_atomic(path, data):
+    """Write text or bytes to path atomically (write a temp file, then rename)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix="." + os.path.basename(path) + "-", suffix=".tmp", dir=directory)
+    try:
+        with (os.fdopen(fd, 'wb') if isinstance(data, bytes) else os.fdopen(fd, 'w', encoding='utf-8')) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def read_document(path):
+    """A saved document in either format, told apart by its first bytes"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if is_snapshot(data):
+        return decode_snapshot(data)
+    return json.loads(data)
+
+def check_save_format(save_format):
+    """The configured save format if save_format is None; ValueError if it is unknown"""
+    save_format = save_format or SAVE_FORMAT
+    if save_format not in SAVE_FORMATS:
+        raise ValueError(f"Unknown save format: {save_format}")
+    return save_format
+
+class JSONFileStore:
+    """
+    The original format: the whole state as one pretty-printed JSON document,
+    or as a binary snapshot with save_format="binary"; either loads
+    Every commit rewrites the file, so events are not needed
+    """
+    
+    def __init__(self, filename, save_format=None):
+        self.filename = filename
+        self.save_format = check_save_format(save_format)
+    
+    def load(self):
+        """Return (state, events to replay) or (None, []) if nothing is saved"""
+        if not os.path.exists(self.filename):
+            return None, []
+        return read_document(self.filename), []
+    
+    def reset(self, state):
+        """Start a new game from a full state"""
+        self.commit(state, [])
+    
+    def commit(self, state, events):
+        """Persist pending changes"""
+        if self.save_format == "binary":
+            write_atomic(self.filename, encode_snapshot(plain_state(state)))
+        else:
+            write_atomic(self.filename, json.dumps(state, indent=2, ensure_ascii=False, default=to_json))
+
+class EventLogStore:
+    """
+    Append-only storage: each mutation is one JSONL line in <base>.events.jsonl
+    Loading replays the log on top of the last snapshot in <base>.snapshot.json;
+    every EVENT_LOG_COMPACT_EVERY events the log is folded into a new snapshot
+    (written in save_format; the file keeps its name either way)
+    """
+    
+    def __init__(self, base_path, compact_every=None, save_format=None):
+        self.snapshot_path = base_path + ".snapshot.json"
+        self.save_format = check_save_format(save_format)
+        self.log_path = base_path + ".events.jsonl"
+        self.compact_every = EVENT_LOG_COMPACT_EVERY if compact_every is None else compact_every
+        self.seq = 0  # Sequence number of the last persisted event
+        self.snapshot_seq = 0
+    
+    def load(self):
+        """Return (snapshot state, events logged after the snapshot)"""
+        if not os.path.exists(self.snapshot_path):
+            return None, []
+        snapshot = read_document(self.snapshot_path)
+        self.seq = self.snapshot_seq = snapshot["seq"]
+        
+        events = []
+        if os.path.exists(self.log_path):
+            intact_bytes = 0
+            with open(self.log_path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated line")
+                        event = json.loads(line)
+                    except ValueError:
+                        break  # Torn final write from a crash; everything before it is intact
+                    intact_bytes += len(line)
+                    # Events up to the snapshot survive if we crashed mid-compaction
+                    if event["seq"] > self.seq:
+                        events.append(event)
+                        self.seq = event["seq"]
+            if intact_bytes != os.path.getsize(self.log_path):
+                os.truncate(self.log_path, intact_bytes)
+        return snapshot["state"], events
+    
+    def reset(self, state):
+        """Start a new game: snapshot the initial state and empty the log"""
+        self.seq = 0
+        self._compact(state)
+    
+    def commit(self, state, events):
+        """Append pending events in a single write, compacting when the log is long"""
+        if not events:
+            return
+        lines = []
+        for event in events:
+            self.seq += 1
+            lines.append(json.dumps(dict(event, seq=self.seq), ensure_ascii=False, default=to_json))
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        
+        if self.seq - self.snapshot_seq >= self.compact_every:
+            self._compact(state)
+    
+    def _compact(self, state):
+        """Fold the log into a snapshot; the snapshot lands before the log is cleared"""
+        if self.save_format == "binary":
+            write_atomic(self.snapshot_path, encode_snapshot({"seq": self.seq, "state": plain_state(state)}))
+        else:
+            write_atomic(self.snapshot_path, json.dumps({"seq": self.seq, "state": state}, ensure_ascii=False, default=to_json))
+        with open(self.log_path, 'w', encoding='utf-8'):
+            pass
+        self.snapshot_seq = self.seq
+
+class MemoryStore:
+    """Keeps nothing: for headless simulations whose results are reported elsewhere"""
+    
+    def load(self):
+        """Return (state, events to replay) - there is never a saved game"""
+        return None, []
+    
+    def reset(self, state):
+        """Start a new game"""
+    
+    def commit(self, state, events):
+        """Discard pending changes"""
+
+def create_store(filename, backend=None, save_format=None):
+    """Build the configured storage backend for a game file"""
+    backend = backend or STORAGE_BACKEND
+    if backend == "json":
+        return JSONFileStore(filename, save_format=save_format)
+    if backend == "eventlog":
+        return EventLogStore(os.path.splitext(filename)[0], save_format=save_format)
+    if backend == "memory":
+        return MemoryStore()
+    raise ValueError(f"Unknown storage backend: {backend}")
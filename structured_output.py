@@ -0,0 +1,169 @@
+"""
+Structured Output for The Evolving Kingdom
+Per-task schemas for the LLM tasks that answer in JSON, and the local repairs
+that turn a slightly malformed answer into one that fits its schema. Answers
+that cannot be repaired raise StructuredOutputError so the caller can re-ask
+"""
+
+import re
+import json
+
+# Field specs per task: "type" is str or float; "choices" limits a str, "range" bounds a float;
+# a field with a "default" may be missing from the answer
+SCHEMAS = {
+    "analyze_sentiment": {
+        "sentiment": {"type": str, "choices": ("positive", "negative", "neutral")},
+        "intensity": {"type": float, "range": (0.0, 1.0)},
+        "reasoning": {"type": str, "default": ""}
+    },
+    "evolve_personality": {
+        "new_personality": {"type": str},
+        "key_change": {"type": str, "default": "No reason given"}
+    },
+    "classify_kingdom_state": {
+        "state": {"type": str, "choices": ("prosperity", "rebellion", "stability", "decline")},
+        "reason": {"type": str, "default": ""}
+    },
+    "continue_chronicle": {
+        "chronicle": {"type": str},
+        "reign_summary": {"type": str, "default": ""}
+    }
+}
+
+# Tasks whose answer is a JSON object (JSON mode is requested for these where the API offers it)
+JSON_TASKS = tuple(SCHEMAS) + ("generate_all_faction_responses",)
+
+STRING_LITERAL = re.compile(r'"(?:[^"\\]|\\.)*"?', re.S)  # A string literal; a cut-off one runs to the end
+
+class StructuredOutputError(ValueError):
+    """An answer that does not fit its task's schema, even after local repairs"""
+
+def extract_json(text):
+    """
+    The JSON object inside an answer: without code fences or prose around it
+    An object that was cut off runs to the end of the text
+    """
+    if not isinstance(text, str):
+        raise StructuredOutputError("no answer")
+    start = text.find('{')
+    if start == -1:
+        raise StructuredOutputError("no JSON object in the answer")
+    end = text.rfind('}') + 1
+    return text[start:end] if end > start else text[start:]
+
+def repair_syntax(text):
+    """Bare keys, Python literals and trailing commas, in JSON text outside string literals"""
+    text = re.sub(r'([{,]\s*)([A-Za-z_][A-Za-z0-9_]*)(\s*:)', r'\1"\2"\3', text)
+    text = re.sub(r'(:\s*)True\b', r'\1true', text)
+    text = re.sub(r'(:\s*)False\b', r'\1false', text)
+    text = re.sub(r'(:\s*)None\b', r'\1null', text)
+    return re.sub(r',\s*([}\]])', r'\1', text)
+
+def repair_json(text):
+    """Fix the defects LLMs commonly leave in JSON: smart or single quotes, trailing commas, bare keys, Python literals, truncation"""
+    text = text.replace('“', '"').replace('”', '"').replace('‘', "'").replace('’', "'")
+    if '"' not in text:
+        text = text.replace("'", '"')
+    # String values are left as they are, however much they look like JSON
+    parts = []
+    last = 0
+    for literal in STRING_LITERAL.finditer(text):
+        parts += [repair_syntax(text[last:literal.start()]), literal.group()]
+        last = literal.end()
+    text = "".join(parts) + repair_syntax(text[last:])
+    
+    # Close whatever a cut-off answer left open
+    closers = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            closers.append('}' if char == '{' else ']')
+        elif char in '}]' and closers:
+            closers.pop()
+    if in_string:
+        text += '"'
+    text = re.sub(r',\s*$', '', text)
+    return text + "".join(reversed(closers))
+
+def load_json(text):
+    """
+    Parse the JSON object in an answer, repairing it if it does not parse as is
+    Returns (object, whether it needed repair)
+    """
+    candidate = extract_json(text)
+    try:
+        data, repaired = json.loads(candidate), False
+    except ValueError:
+        try:
+            data, repaired = json.loads(repair_json(candidate)), True
+        except ValueError as e:
+            raise StructuredOutputError(f"invalid JSON ({e.msg})")
+    if not isinstance(data, dict):
+        raise StructuredOutputError("the answer is not a JSON object")
+    return data, repaired
+
+def validate(data, schema):
+    """
+    The fields of a schema, taken from data and coerced where that is safe
+    (case and spacing of choices, numbers in strings, percentages, out-of-range values)
+    Returns (validated object, whether anything was coerced)
+    """
+    result = {}
+    repaired = False
+    for field, spec in schema.items():
+        value = data.get(field)
+        if value is None or value == "":
+            if "default" not in spec:
+                raise StructuredOutputError(f"missing field {field}")
+            result[field] = spec["default"]
+            continue
+        
+        if spec["type"] is float:
+            try:
+                number = float(str(value).strip().rstrip('%')) if isinstance(value, str) else float(value)
+            except (TypeError, ValueError):
+                raise StructuredOutputError(f"{field} is not a number")
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                repaired = True
+            low, high = spec["range"]
+            if high == 1.0 and 1.0 < number <= 100.0:
+                number /= 100.0  # A percentage
+            number = min(max(number, low), high)
+            if number != value:
+                repaired = True
+            result[field] = number
+            continue
+        
+        if not isinstance(value, str):
+            raise StructuredOutputError(f"{field} is not a string")
+        text = value.strip()
+        if "choices" in spec:
+            text = text.lower()
+            if text not in spec["choices"]:
+                raise StructuredOutputError(f"{field} must be one of {', '.join(spec['choices'])}")
+        if text != value:
+            repaired = True
+        result[field] = text
+    return result, repaired
+
+def parse_structured(text, task):
+    """
+    A task's answer as an object matching its schema
+    Returns (object, whether it needed repair); raises StructuredOutputError
+    """
+    data, repaired = load_json(text)
+    result, coerced = validate(data, SCHEMAS[task])
+    return result, repaired or coerced
+
+def reask_prompt(user_prompt, error):
+    """The user prompt again, telling the model what was wrong with its last answer"""
+    return f"{user_prompt}\n\nYour previous answer could not be used ({error}). Reply with only the JSON object, in the format given."
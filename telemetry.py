@@ -0,0 +1,302 @@
+"""
+Telemetry for The Evolving Kingdom
+Records a span for every LLM call (task, turn, faction, latency, tokens,
+cache hit, outcome) and for every stage of a turn, and fans them out to
+pluggable sinks: a JSONL log, an in-memory aggregator and a Prometheus dump
+"""
+
+import json
+import threading
+import time
+import contextvars
+from contextlib import contextmanager
+from config import TELEMETRY_ENABLED, TELEMETRY_JSONL_PATH, TELEMETRY_PROMETHEUS_PATH
+from storage import write_atomic
+
+# Fields (game, turn, faction) attached to every span recorded in the current thread or task
+_CONTEXT = contextvars.ContextVar("kingdom_span_context", default={})
+
+@contextmanager
+def span_context(**fields):
+    """Tag the spans recorded inside the block with fields such as game, turn or faction"""
+    token = _CONTEXT.set(dict(_CONTEXT.get(), **fields))
+    try:
+        yield
+    finally:
+        _CONTEXT.reset(token)
+
+def current_context():
+    """The fields spans recorded here would be tagged with"""
+    return _CONTEXT.get()
+
+async def in_context(fields, coro):
+    """
+    Await coro with fields as its span context
+    run_coroutine_threadsafe does not carry the caller's context onto the loop
+    """
+    token = _CONTEXT.set(fields)
+    try:
+        return await coro
+    finally:
+        _CONTEXT.reset(token)
+
+class Tracer:
+    """Builds spans and hands them to every sink"""
+    
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+    
+    def record(self, kind, name, latency, **fields):
+        """Emit a span of the given kind ("call" or "stage")"""
+        span = dict(current_context())
+        span.update(kind=kind, name=name, latency=round(latency, 6), end=round(time.time(), 3))
+        span.update(fields)
+        for sink in self.sinks:
+            sink.emit(span)
+        return span
+    
+    def call(self, task, latency, outcome, usage=None, error=None, attempts=1, first_chunk=None, queued=None):
+        """
+        Emit the span of one LLM task call
+        outcome is "ok", "cache_hit", "local" (answered without the LLM),
+        "fallback" (the LLM failed and a local answer was used) or "partial"
+        (a stream broke after its first chunk); first_chunk is a streamed
+        call's time to its first chunk, queued the part of latency spent
+        waiting for the request scheduler
+        """
+        usage = usage or {}
+        return self.record(
+            "call", task, latency,
+            outcome=outcome,
+            cache_hit=outcome == "cache_hit",
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            attempts=attempts,
+            first_chunk=None if first_chunk is None else round(first_chunk, 6),
+            queued=None if queued is None else round(queued, 6),
+            error=error
+        )
+    
+    def parse(self, task, outcome, reasks=0, error=None):
+        """
+        Emit the span of parsing a JSON task's answer against its schema
+        outcome is "ok", "repaired" (fixed locally), "reasked" (valid after asking
+        again) or "failed" (the task's default answer was used)
+        """
+        return self.record("parse", task, 0.0, outcome=outcome, reasks=reasks, error=error)
+    
+    @contextmanager
+    def stage(self, name):
+        """Time the block as one stage of a turn"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record("stage", name, time.perf_counter() - started)
+    
+    def summary(self, game=None):
+        """Where a game's time went, from the first sink that aggregates"""
+        for sink in self.sinks:
+            if hasattr(sink, "summary"):
+                return sink.summary(game)
+        return None
+    
+    def close(self):
+        """Flush and close every sink"""
+        for sink in self.sinks:
+            sink.close()
+
+# ==================== SINKS ====================
+class JSONLSink:
+    """Appends every span to a JSONL file"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+    
+    def emit(self, span):
+        line = json.dumps(span, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(line)
+            self.file.flush()
+    
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class MemorySink:
+    """Aggregates spans per game: LLM cost per task and wall time per turn stage"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.games = {}  # game -> {"calls": {task: stats}, "stages": {stage: stats}, "parses": {task: counts}, "turns": set()}
+    
+    def emit(self, span):
+        with self.lock:
+            game = self.games.setdefault(span.get("game"), {"calls": {}, "stages": {}, "parses": {}, "turns": set()})
+            if span.get("turn") is not None:
+                game["turns"].add(span["turn"])
+            if span["kind"] == "parse":
+                counts = game["parses"].setdefault(span["name"], {"ok": 0, "repaired": 0, "reasked": 0, "failed": 0, "reasks": 0})
+                counts[span["outcome"]] += 1
+                counts["reasks"] += span.get("reasks") or 0
+                return
+            if span["kind"] == "call":
+                stats = game["calls"].setdefault(span["name"], {
+                    "calls": 0, "seconds": 0.0, "max_seconds": 0.0, "prompt_tokens": 0,
+                    "completion_tokens": 0, "cache_hits": 0, "local": 0, "fallbacks": 0, "attempts": 0,
+                    "queued_seconds": 0.0
+                })
+                stats["calls"] += 1
+                stats["prompt_tokens"] += span.get("prompt_tokens") or 0
+                stats["completion_tokens"] += span.get("completion_tokens") or 0
+                stats["cache_hits"] += span["outcome"] == "cache_hit"
+                stats["local"] += span["outcome"] == "local"
+                stats["fallbacks"] += span["outcome"] == "fallback"
+                stats["attempts"] += span.get("attempts") or 0
+                stats["queued_seconds"] += span.get("queued") or 0.0
+            else:
+                stats = game["stages"].setdefault(span["name"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+                stats["count"] += 1
+            stats["seconds"] += span["latency"]
+            stats["max_seconds"] = max(stats["max_seconds"], span["latency"])
+    
+    def summary(self, game=None):
+        """
+        Where a game's turn time went
+        Stage shares are of the summed stage time; LLM seconds add up concurrent calls,
+        so they can exceed the stage that waited on them
+        """
+        with self.lock:
+            data = self.games.get(game)
+            if data is None:
+                return None
+            stages = {name: dict(stats) for name, stats in data["stages"].items()}
+            calls = {name: dict(stats) for name, stats in data["calls"].items()}
+            parses = {name: dict(counts) for name, counts in data["parses"].items()}
+            turns = len(data["turns"])
+        
+        turn_seconds = sum(stats["seconds"] for stats in stages.values())
+        for stats in list(stages.values()) + list(calls.values()):
+            stats["seconds"] = round(stats["seconds"], 6)
+            stats["max_seconds"] = round(stats["max_seconds"], 6)
+        for stats in calls.values():
+            stats["queued_seconds"] = round(stats["queued_seconds"], 6)
+        for stats in stages.values():
+            stats["share"] = round(stats["seconds"] / turn_seconds, 3) if turn_seconds else 0.0
+        for counts in parses.values():
+            # Answers that were not usable as first returned
+            parsed = counts["ok"] + counts["repaired"] + counts["reasked"] + counts["failed"]
+            counts["failure_rate"] = round((counts["reasked"] + counts["failed"]) / parsed, 3) if parsed else 0.0
+        
+        ranked = sorted(stages.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        return {
+            "game": game,
+            "turns": turns,
+            "turn_seconds": round(turn_seconds, 6),
+            "stages": dict(ranked),
+            "bottleneck": ranked[0][0] if ranked else None,
+            "llm": dict(sorted(calls.items(), key=lambda item: item[1]["seconds"], reverse=True)),
+            "llm_calls": sum(stats["calls"] for stats in calls.values()),
+            "llm_seconds": round(sum(stats["seconds"] for stats in calls.values()), 6),
+            "structured_output": parses
+        }
+    
+    def close(self):
+        pass
+
+class PrometheusSink:
+    """Counters and latency histograms in the Prometheus text exposition format"""
+    
+    BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    
+    def __init__(self, path=None):
+        self.path = path  # Written on close(); render() works without one
+        self.lock = threading.Lock()
+        self.calls = {}  # (task, outcome) -> count
+        self.parses = {}  # (task, outcome) -> count
+        self.tokens = {}  # (task, kind) -> tokens
+        self.latency = {}  # ("llm" or "stage", name) -> [bucket counts..., sum, count]
+    
+    def emit(self, span):
+        with self.lock:
+            if span["kind"] == "parse":
+                key = (span["name"], span["outcome"])
+                self.parses[key] = self.parses.get(key, 0) + 1
+                return
+            if span["kind"] == "call":
+                key = (span["name"], span["outcome"])
+                self.calls[key] = self.calls.get(key, 0) + 1
+                for kind in ("prompt", "completion"):
+                    tokens = span.get(kind + "_tokens")
+                    if tokens:
+                        self.tokens[(span["name"], kind)] = self.tokens.get((span["name"], kind), 0) + tokens
+                family = "llm"
+            else:
+                family = "stage"
+            histogram = self.latency.setdefault((family, span["name"]), [0] * len(self.BUCKETS) + [0.0, 0])
+            for index, bound in enumerate(self.BUCKETS):
+                if span["latency"] <= bound:
+                    histogram[index] += 1
+            histogram[-2] += span["latency"]
+            histogram[-1] += 1
+    
+    def render(self):
+        """The current metrics as Prometheus exposition text"""
+        with self.lock:
+            lines = [
+                "# HELP kingdom_llm_calls_total LLM task calls by outcome",
+                "# TYPE kingdom_llm_calls_total counter"
+            ]
+            for (task, outcome), count in sorted(self.calls.items()):
+                lines.append(f'kingdom_llm_calls_total{{task="{task}",outcome="{outcome}"}} {count}')
+            
+            lines += [
+                "# HELP kingdom_structured_output_total Parsed JSON answers by outcome",
+                "# TYPE kingdom_structured_output_total counter"
+            ]
+            for (task, outcome), count in sorted(self.parses.items()):
+                lines.append(f'kingdom_structured_output_total{{task="{task}",outcome="{outcome}"}} {count}')
+            
+            lines += [
+                "# HELP kingdom_llm_tokens_total Tokens sent and received per task",
+                "# TYPE kingdom_llm_tokens_total counter"
+            ]
+            for (task, kind), tokens in sorted(self.tokens.items()):
+                lines.append(f'kingdom_llm_tokens_total{{task="{task}",kind="{kind}"}} {tokens}')
+            
+            for family, label, help_text in (
+                ("llm", "task", "LLM task call latency"),
+                ("stage", "stage", "Turn stage wall time")
+            ):
+                metric = f"kingdom_{family}_seconds"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+                for (kind, name), histogram in sorted(self.latency.items()):
+                    if kind != family:
+                        continue
+                    for bound, count in zip(self.BUCKETS, histogram):
+                        lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {count}')
+                    lines.append(f'{metric}_bucket{{{label}="{name}",le="+Inf"}} {histogram[-1]}')
+                    lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram[-2]:.6f}')
+                    lines.append(f'{metric}_count{{{label}="{name}"}} {histogram[-1]}')
+        return "\n".join(lines) + "\n"
+    
+    def close(self):
+        if self.path:
+            write_atomic(self.path, self.render())
+
+def default_tracer():
+    """Tracer built from config.py, or None when telemetry is disabled"""
+    if not TELEMETRY_ENABLED:
+        return None
+    sinks = [MemorySink()]
+    if TELEMETRY_JSONL_PATH:
+        sinks.append(JSONLSink(TELEMETRY_JSONL_PATH))
+    if TELEMETRY_PROMETHEUS_PATH:
+        sinks.append(PrometheusSink(TELEMETRY_PROMETHEUS_PATH))
+    return Tracer(sinks)
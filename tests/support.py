@@ -0,0 +1,48 @@
+"""
+Shared Test Helpers for The Evolving Kingdom
+Reigns played offline against the seeded mock backend with no latency, so
+every run (and every store it is saved to) gives the same game
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai_client import KingdomAI
+from llm_backends import MockBackend
+from engine import KingdomEngine, decision_options
+from models import to_json
+
+def play_reign(game_state, turns=12, seed=1, player_name="Tester"):
+    """Start a new game in game_state and play turns turns, inline; returns the game state"""
+    ai = KingdomAI(cache=False, backend=MockBackend(seed=seed, latency_scale=0), tracer=False)
+    engine = KingdomEngine(game_state, ai, total_turns=turns, background_post_turn=False, streaming=False)
+    rng = random.Random(seed)
+    try:
+        game_state.initialize_new_game(player_name)
+        for turn in range(1, turns + 1):
+            engine.play_turn(turn, rng.choice(decision_options(turn)))
+    finally:
+        engine.close()
+    game_state.flush()
+    return game_state
+
+def dump(state):
+    """A state as canonical JSON, for comparing states whatever their record types"""
+    return json.dumps(state, default=to_json, sort_keys=True)
+
+class TempDirTestCase(unittest.TestCase):
+    """A test case with a fresh temporary directory in self.dir"""
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="kingdom-test-")
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+    
+    def path(self, name):
+        return os.path.join(self.dir, name)
@@ -0,0 +1,138 @@
+"""
+Context Builder Tests for The Evolving Kingdom
+Prompts stay within their token budgets, and what is cut is the least telling part
+"""
+
+import json
+import unittest
+
+from support import play_reign
+from config import CHARS_PER_TOKEN
+from context_builder import (
+    ELLIPSIS, REVIEW_LEVELS, estimate_tokens, truncate_text, keep_latest, clamp_prompt,
+    merge_memory_by_turn, rank_memory, chronicle_delta, build_review_context
+)
+from game_state import GameState
+from storage import create_store
+
+SYSTEM = "You are the royal scribe."
+
+def prompt_tokens(system_prompt, user_prompt):
+    return estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+
+class ClampPromptTest(unittest.TestCase):
+    """clamp_prompt is a hard limit that keeps both ends of the user prompt"""
+    
+    def setUp(self):
+        self.user = "INSTRUCTIONS " + "".join(f"turn {n} happened. " for n in range(400)) + " REPLY IN JSON"
+    
+    def test_prompt_that_fits_is_untouched(self):
+        budget = prompt_tokens(SYSTEM, self.user)
+        self.assertIs(clamp_prompt(SYSTEM, self.user, budget), self.user)
+    
+    def test_budgets_are_kept(self):
+        for budget in (2000, 1000, 200, 50, 12, 10, 9, 8, 7, 0):
+            clamped = clamp_prompt(SYSTEM, self.user, budget)
+            self.assertLessEqual(len(clamped), max(0, (budget - estimate_tokens(SYSTEM)) * CHARS_PER_TOKEN), budget)
+            if len(clamped) < len(self.user):
+                self.assertLessEqual(prompt_tokens(SYSTEM, clamped), max(budget, estimate_tokens(SYSTEM)), budget)
+    
+    def test_middle_is_cut(self):
+        clamped = clamp_prompt(SYSTEM, self.user, 200)
+        head, _, tail = clamped.partition(ELLIPSIS)
+        self.assertTrue(head.startswith("INSTRUCTIONS"))
+        self.assertTrue(tail.endswith("REPLY IN JSON"))
+        self.assertEqual(len(head), 2 * (len(head) + len(tail)) // 3)  # Two thirds from the start
+        self.assertEqual(len(clamped), (200 - estimate_tokens(SYSTEM)) * CHARS_PER_TOKEN)
+    
+    def test_no_room_for_the_marker(self):
+        budget = estimate_tokens(SYSTEM) + 1
+        self.assertEqual(clamp_prompt(SYSTEM, self.user, budget), self.user[:CHARS_PER_TOKEN])
+        self.assertEqual(clamp_prompt(SYSTEM, self.user, estimate_tokens(SYSTEM) - 1), "")
+
+class TextTest(unittest.TestCase):
+    """Token estimates and text cuts"""
+    
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("a" * CHARS_PER_TOKEN), 1)
+        self.assertEqual(estimate_tokens("a" * (CHARS_PER_TOKEN + 1)), 2)
+    
+    def test_truncate_and_keep_latest(self):
+        text = "The merchants grumble about the new levy"
+        self.assertEqual(truncate_text(text, 100), text)
+        self.assertEqual(truncate_text(text, 16), "The merchants...")
+        self.assertEqual(keep_latest(text, 12), "...new levy")
+        self.assertIsNone(truncate_text(None, 5))
+        for limit in (0, 3, 10):
+            self.assertLessEqual(len(truncate_text(text, limit)), max(limit, 3))
+            self.assertLessEqual(len(keep_latest(text, limit)), max(limit, 3))
+
+class MemoryTest(unittest.TestCase):
+    """Per-turn memory records, ranked by how telling they are"""
+    
+    def memory(self):
+        entries = []
+        for turn, delta, intensity in ((1, 1, 0.2), (2, -12, 0.9), (3, 0, 0.1), (4, 2, 0.3), (5, 1, 0.2)):
+            entries.append({"turn": turn, "trust_change": delta, "reason": f"decision {turn}", "new_trust": 50 + delta})
+            entries.append({"turn": turn, "decision": f"decision {turn}", "response": "x" * 300,
+                            "sentiment": "negative" if delta < 0 else "positive", "intensity": intensity})
+        return entries
+    
+    def test_merge_by_turn(self):
+        merged = merge_memory_by_turn(self.memory() + [{"turn": 5, "trust_change": 3, "reason": "again", "new_trust": 56}])
+        self.assertEqual([record["turn"] for record in merged], [1, 2, 3, 4, 5])
+        self.assertEqual(merged[4]["trust_change"], 4)
+        self.assertEqual(merged[4]["new_trust"], 56)
+        self.assertEqual(merged[1]["decision"], "decision 2")
+    
+    def test_rank_keeps_big_swings_in_order(self):
+        ranked = rank_memory(self.memory(), 3, quote_chars=50)
+        self.assertEqual([record["turn"] for record in ranked], [2, 4, 5])
+        self.assertTrue(all(len(record["response"]) <= 50 for record in ranked))
+
+class ChronicleDeltaTest(unittest.TestCase):
+    """chronicle_delta keeps every reaction but only the strongest quotes"""
+    
+    def test_delta(self):
+        turns = [
+            {"turn": turn, "decision": f"decision {turn}", "responses": {
+                "merchants": {"response": f"merchants on {turn}", "trust_change": 2 * turn - 3,
+                              "sentiment": {"sentiment": "negative" if turn < 2 else "positive", "intensity": 0.5}},
+                "clergy": {"response": f"clergy on {turn}", "trust_change": 0, "sentiment": None}
+            }}
+            for turn in (1, 2, 3, 4)
+        ]
+        delta = chronicle_delta(turns, key_quotes=2)
+        self.assertEqual(delta["turns"][0]["reactions"], {"merchants": "negative -1", "clergy": "neutral +0"})
+        self.assertEqual([(q["turn"], q["faction"]) for q in delta["key_quotes"]], [(3, "merchants"), (4, "merchants")])
+
+class ReviewContextTest(unittest.TestCase):
+    """The review context degrades level by level until it fits"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.state = play_reign(GameState(store=create_store(None, "memory")), turns=16).state
+    
+    def test_fits_or_uses_leanest_level(self):
+        sizes = []
+        for budget in (100000, 4000, 2500, 1500, 800, 50):
+            text = build_review_context(self.state, budget)
+            json.loads(text)
+            sizes.append(estimate_tokens(text))
+            if budget >= sizes[-1]:
+                continue
+            # Over budget only when even the leanest view is too large
+            self.assertEqual(sizes[-1], min(sizes))
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        self.assertLess(sizes[-1], sizes[0])
+    
+    def test_richest_level_when_there_is_room(self):
+        context = json.loads(build_review_context(self.state, 100000))
+        self.assertEqual(len(context["timeline"]), 16)
+        self.assertIn("reactions", context["timeline"][0])
+        quotes = [len(faction.get("key_quotes", [])) for faction in context["factions"].values()]
+        self.assertTrue(all(count <= REVIEW_LEVELS[0]["quotes"] for count in quotes))
+
+if __name__ == "__main__":
+    unittest.main()
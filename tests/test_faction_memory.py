@@ -0,0 +1,97 @@
+"""
+Faction Memory Tests for The Evolving Kingdom
+The tiers stay within their caps however long a reign runs, and lose no trust history
+"""
+
+import unittest
+
+from support import play_reign
+from config import MEMORY_HOT_TURNS, MEMORY_WARM_TURNS, MEMORY_COLD_SUMMARIES
+from faction_memory import empty_tiers, demote_hot, fold_warm
+from game_state import GameState
+from storage import create_store
+
+def new_faction():
+    return dict(id="merchants", memory=[], **empty_tiers())
+
+def live_turn(faction, turn, delta=3):
+    """The two raw entries a turn adds to a faction's hot memory, demoting as GameState does"""
+    faction["memory"].append({"turn": turn, "trust_change": delta, "reason": f"decision {turn}", "new_trust": 50})
+    demote_hot(faction)
+    faction["memory"].append({
+        "turn": turn, "decision": f"decision {turn}", "response": "We shall see.",
+        "sentiment": "positive" if delta > 0 else "negative", "intensity": 0.5
+    })
+    demote_hot(faction)
+
+class TierBoundsTest(unittest.TestCase):
+    """Each tier keeps to its cap, and the tiers cover every turn exactly once"""
+    
+    def assert_bounded(self, faction):
+        hot_turns = {entry["turn"] for entry in faction["memory"]}
+        self.assertLessEqual(len(hot_turns), MEMORY_HOT_TURNS)
+        self.assertLessEqual(len(faction["memory_warm"]), MEMORY_WARM_TURNS)
+        self.assertLessEqual(len(faction["memory_cold"]), MEMORY_COLD_SUMMARIES)
+    
+    def test_long_reign_without_chronicles(self):
+        faction = new_faction()
+        for turn in range(1, 301):
+            live_turn(faction, turn)
+            self.assert_bounded(faction)
+        
+        # Cold summaries, then warm records, then hot entries: contiguous and in order
+        covered = []
+        for summary in faction["memory_cold"]:
+            covered += range(summary["from_turn"], summary["to_turn"] + 1)
+        covered += [record["turn"] for record in faction["memory_warm"]]
+        covered += sorted({entry["turn"] for entry in faction["memory"]})
+        self.assertEqual(covered, list(range(1, 301)))
+        self.assertEqual(faction["memory_trimmed"] + len(faction["memory"]), 600)
+    
+    def test_trust_history_is_kept(self):
+        faction = new_faction()
+        deltas = [(turn % 7) - 3 for turn in range(1, 101)]
+        for turn, delta in enumerate(deltas, 1):
+            live_turn(faction, turn, delta)
+        kept = sum(summary["net_trust"] for summary in faction["memory_cold"])
+        kept += sum(record.get("trust_change", 0) for record in faction["memory_warm"])
+        kept += sum(entry.get("trust_change", 0) for entry in faction["memory"])
+        self.assertEqual(kept, sum(deltas))
+    
+    def test_game_state_reign_is_bounded(self):
+        game_state = play_reign(GameState(store=create_store(None, "memory")), turns=40)
+        for faction in game_state.get_all_factions().values():
+            self.assert_bounded(faction)
+            self.assertEqual(len(faction["memory_warm"]), MEMORY_WARM_TURNS)
+
+class FoldWarmTest(unittest.TestCase):
+    """fold_warm with explicit caps"""
+    
+    def test_overflow_becomes_one_summary(self):
+        faction = new_faction()
+        faction["memory_warm"] = [{"turn": turn, "trust_change": turn} for turn in range(1, 11)]
+        fold_warm(faction, warm_turns=4, cold_summaries=3)
+        self.assertEqual([record["turn"] for record in faction["memory_warm"]], [7, 8, 9, 10])
+        self.assertEqual(len(faction["memory_cold"]), 1)
+        summary = faction["memory_cold"][0]
+        self.assertEqual((summary["from_turn"], summary["to_turn"], summary["net_trust"]), (1, 6, 21))
+        self.assertEqual(summary["key_moment"]["turn"], 6)
+    
+    def test_oldest_summaries_merge(self):
+        faction = new_faction()
+        for turn in range(1, 6):
+            faction["memory_warm"].append({"turn": turn, "trust_change": -turn})
+            fold_warm(faction, warm_turns=0, cold_summaries=2)
+        cold = faction["memory_cold"]
+        self.assertEqual([(summary["from_turn"], summary["to_turn"]) for summary in cold], [(1, 4), (5, 5)])
+        self.assertEqual(sum(summary["net_trust"] for summary in cold), -15)
+    
+    def test_nothing_to_fold(self):
+        faction = new_faction()
+        faction["memory_warm"] = [{"turn": 1}]
+        fold_warm(faction, warm_turns=4)
+        self.assertEqual(faction["memory_cold"], [])
+        self.assertEqual(len(faction["memory_warm"]), 1)
+
+if __name__ == "__main__":
+    unittest.main()
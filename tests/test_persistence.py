@@ -0,0 +1,198 @@
+"""
+Persistence Tests for The Evolving Kingdom
+Every store and save format must reload exactly the state that was played
+"""
+
+import json
+import os
+import time
+import unittest
+
+from support import TempDirTestCase, play_reign, dump
+from game_state import GameState
+from storage import create_store, EventLogStore, read_document
+from sqlite_store import SQLiteGameStateStore, list_games
+from snapshot import encode_snapshot, decode_snapshot, is_snapshot
+from kingdom import main as kingdom_main
+
+class StoreRoundTripTest(TempDirTestCase):
+    """A reign saved through each store and format reloads to the same state"""
+    
+    def round_trip(self, backend, save_format):
+        path = self.path("game.json")
+        played = play_reign(GameState(path, store=create_store(path, backend, save_format=save_format)))
+        loaded = GameState(path, store=create_store(path, backend, save_format=save_format))
+        self.assertTrue(loaded.load())
+        self.assertEqual(dump(loaded.state), dump(played.state))
+        self.assertEqual(loaded.get_average_trust(), played.get_average_trust())
+        return played, loaded
+    
+    def test_json_store_json_format(self):
+        self.round_trip("json", "json")
+    
+    def test_json_store_binary_format(self):
+        self.round_trip("json", "binary")
+        with open(self.path("game.json"), 'rb') as f:
+            self.assertTrue(is_snapshot(f.read()))
+    
+    def test_eventlog_store_json_format(self):
+        self.round_trip("eventlog", "json")
+    
+    def test_eventlog_store_binary_format(self):
+        self.round_trip("eventlog", "binary")
+    
+    def test_formats_load_each_other(self):
+        path = self.path("game.json")
+        played = play_reign(GameState(path, store=create_store(path, "json", save_format="binary")))
+        # A store configured for JSON still reads a binary save, and saves JSON from then on
+        loaded = GameState(path, store=create_store(path, "json", save_format="json"))
+        self.assertTrue(loaded.load())
+        self.assertEqual(dump(loaded.state), dump(played.state))
+        loaded.save()
+        with open(path, 'rb') as f:
+            self.assertEqual(json.loads(f.read()), json.loads(dump(played.state)))
+    
+    def test_missing_save(self):
+        path = self.path("none.json")
+        self.assertFalse(GameState(path, store=create_store(path, "json")).load())
+        self.assertFalse(GameState(path, store=create_store(path, "eventlog")).load())
+
+class EventReplayTest(TempDirTestCase):
+    """The event log replays onto its last snapshot"""
+    
+    def play(self, compact_every):
+        base = self.path("game")
+        played = play_reign(GameState(store=EventLogStore(base, compact_every=compact_every)))
+        loaded = GameState(store=EventLogStore(base, compact_every=compact_every))
+        self.assertTrue(loaded.load())
+        self.assertEqual(dump(loaded.state), dump(played.state))
+        return base
+    
+    def test_replay_without_compaction(self):
+        base = self.play(compact_every=10 ** 6)
+        self.assertGreater(os.path.getsize(base + ".events.jsonl"), 0)
+    
+    def test_replay_across_compactions(self):
+        self.play(compact_every=7)
+    
+    def test_torn_final_line_is_dropped(self):
+        base = self.play(compact_every=10 ** 6)
+        log = base + ".events.jsonl"
+        with open(log, 'rb') as f:
+            intact = f.read()
+        with open(log, 'ab') as f:
+            f.write(b'{"op": "add_story_beat", "args": ["half')
+        loaded = GameState(store=EventLogStore(base))
+        self.assertTrue(loaded.load())
+        with open(log, 'rb') as f:
+            self.assertEqual(f.read(), intact)
+    
+    def test_unknown_operation_is_rejected(self):
+        base = self.play(compact_every=10 ** 6)
+        with open(base + ".events.jsonl", 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"op": "initialize_new_game", "args": ["Usurper"], "seq": 10 ** 6}) + "\n")
+        with self.assertRaisesRegex(ValueError, "initialize_new_game"):
+            GameState(store=EventLogStore(base)).load()
+
+class SQLiteStoreTest(TempDirTestCase):
+    """Many games share one database without touching each other"""
+    
+    def test_games_round_trip(self):
+        db = self.path("kingdom.db")
+        played = {}
+        for seed, game_id in enumerate(("first", "second", "third"), 1):
+            game_state = SQLiteGameStateStore(db, game_id)
+            played[game_id] = dump(play_reign(game_state, turns=6 + seed, seed=seed, player_name=game_id).state)
+            game_state.close()
+        
+        self.assertEqual(sorted(game["game_id"] for game in list_games(db)), ["first", "second", "third"])
+        for game_id, state in played.items():
+            loaded = SQLiteGameStateStore(db, game_id)
+            try:
+                self.assertTrue(loaded.load())
+                self.assertEqual(dump(loaded.state), state)
+            finally:
+                loaded.close()
+    
+    def test_new_game_replaces_old_one(self):
+        db = self.path("kingdom.db")
+        game_state = SQLiteGameStateStore(db, "game")
+        play_reign(game_state, turns=6)
+        game_state.close()
+        
+        game_state = SQLiteGameStateStore(db, "game")
+        replayed = dump(play_reign(game_state, turns=2, seed=5).state)
+        game_state.close()
+        loaded = SQLiteGameStateStore(db, "game")
+        try:
+            loaded.load()
+            self.assertEqual(dump(loaded.state), replayed)
+        finally:
+            loaded.close()
+
+class SnapshotTest(TempDirTestCase):
+    """The binary format detects damage and converts losslessly to and from JSON"""
+    
+    def setUp(self):
+        super().setUp()
+        self.state = json.loads(dump(play_reign(GameState(store=create_store(None, "memory")), turns=4).state))
+    
+    def test_encode_decode(self):
+        for compression in (0, 1, 9):
+            self.assertEqual(decode_snapshot(encode_snapshot(self.state, compression)), self.state)
+    
+    def test_damage_is_detected(self):
+        data = encode_snapshot(self.state)
+        flipped = data[:-1] + bytes([data[-1] ^ 1])
+        for damaged in (data[:-1], flipped, data[:10], b'{"player_name": "x"}'):
+            with self.assertRaises(ValueError):
+                decode_snapshot(damaged)
+    
+    def test_convert_round_trip(self):
+        original = self.path("game.json")
+        with open(original, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, ensure_ascii=False)
+        for argv in (["convert", original, self.path("game.ksnap"), "--to", "binary"],
+                     ["convert", self.path("game.ksnap"), self.path("back.json"), "--to", "json"]):
+            with self.assertRaises(SystemExit) as exit_code:
+                kingdom_main(argv)
+            self.assertEqual(exit_code.exception.code, 0)
+        self.assertEqual(read_document(self.path("game.ksnap")), self.state)
+        with open(original, 'rb') as f, open(self.path("back.json"), 'rb') as back:
+            self.assertEqual(back.read(), f.read())
+
+class FlushIntervalTest(TempDirTestCase):
+    """With a flush interval, a dirty state is written once the interval is up"""
+    
+    def saved_trust(self, path):
+        game_state = GameState(path, store=create_store(path, "json"))
+        game_state.load()
+        return game_state.state["factions"]["merchants"]["trust_score"]
+    
+    def test_deferred_write_happens(self):
+        path = self.path("game.json")
+        game_state = GameState(path, flush_interval=0.2, store=create_store(path, "json"))
+        game_state.initialize_new_game("Tester")
+        before = self.saved_trust(path)
+        game_state.update_faction_trust("merchants", 5, "a gift")
+        self.assertEqual(self.saved_trust(path), before)  # Still inside the interval
+        
+        deadline = time.monotonic() + 5
+        while self.saved_trust(path) == before and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.saved_trust(path), before + 5)
+        with game_state._lock:  # The timer thread clears the flag just after the file lands
+            self.assertFalse(game_state._dirty)
+    
+    def test_save_cancels_the_timer(self):
+        path = self.path("game.json")
+        game_state = GameState(path, flush_interval=60, store=create_store(path, "json"))
+        game_state.initialize_new_game("Tester")
+        game_state.update_faction_trust("merchants", 5, "a gift")
+        self.assertIsNotNone(game_state._flush_timer)
+        game_state.flush()
+        self.assertIsNone(game_state._flush_timer)
+        self.assertEqual(self.saved_trust(path), game_state.state["factions"]["merchants"]["trust_score"])
+
+if __name__ == "__main__":
+    unittest.main()
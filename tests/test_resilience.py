@@ -0,0 +1,174 @@
+"""
+Resilience Tests for The Evolving Kingdom
+The circuit breaker opens, lets one trial through, and never loses that trial to a
+cancelled call or an abandoned stream
+"""
+
+import asyncio
+import time
+import unittest
+
+import support  # noqa: F401  (puts the repo on sys.path)
+from resilience import CircuitBreaker, Resilience, LLMUnavailable
+
+class Failing(Exception):
+    """A request the fake API refused"""
+    status_code = 500
+
+class FakeBackend:
+    """Answers, fails or hangs on request; stream() reports whether it was closed"""
+    
+    def __init__(self, fail=False, hang=False):
+        self.fail = fail
+        self.hang = hang
+        self.closed = False
+    
+    def complete(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        if self.fail:
+            raise Failing("refused")
+        return "answer", None
+    
+    def stream(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        try:
+            for word in ("one ", "two ", "three"):
+                yield word, None
+        finally:
+            self.closed = True
+
+class AsyncFakeBackend(FakeBackend):
+    async def complete(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        if self.hang:
+            await asyncio.sleep(3600)
+        if self.fail:
+            raise Failing("refused")
+        return "answer", None
+    
+    async def stream(self, system_prompt, user_prompt, temperature, task=None, timeout=None):
+        try:
+            for word in ("one ", "two ", "three"):
+                yield word, None
+                if self.hang:
+                    await asyncio.sleep(3600)
+        finally:
+            self.closed = True
+
+def resilience(threshold=2, reset_seconds=60):
+    return Resilience(max_retries=0, hedged_tasks=(), breaker=CircuitBreaker(threshold, reset_seconds))
+
+def half_open(policy):
+    """Open policy's circuit and let its reset period run out at once"""
+    for _ in range(policy.breaker.threshold):
+        policy.breaker.record_failure()
+    policy.breaker.opened_at -= policy.breaker.reset_seconds
+    return policy
+
+class CircuitBreakerTest(unittest.TestCase):
+    """The breaker's states and the trial call"""
+    
+    def test_closed_until_threshold(self):
+        breaker = CircuitBreaker(threshold=3, reset_seconds=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")  # A success resets the count
+    
+    def test_open_fails_fast(self):
+        policy = resilience()
+        backend = FakeBackend(fail=True)
+        for _ in range(2):
+            with self.assertRaisesRegex(LLMUnavailable, "Failing"):
+                policy.call(backend, "system", "user", 0.5, "council")
+        self.assertEqual(policy.breaker.state, "open")
+        with self.assertRaisesRegex(LLMUnavailable, "circuit open"):
+            policy.call(FakeBackend(), "system", "user", 0.5, "council")
+    
+    def test_half_open_lets_one_trial_through(self):
+        breaker = half_open(resilience()).breaker
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+    
+    def test_failed_trial_reopens(self):
+        policy = half_open(resilience())
+        with self.assertRaises(LLMUnavailable):
+            policy.call(FakeBackend(fail=True), "system", "user", 0.5, "council")
+        self.assertEqual(policy.breaker.state, "open")
+    
+    def test_reset_period(self):
+        breaker = CircuitBreaker(threshold=1, reset_seconds=0.05)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+
+class AbandonedTrialTest(unittest.TestCase):
+    """A trial that ends without an outcome frees the way for the next one"""
+    
+    def test_cancelled_async_trial(self):
+        policy = half_open(resilience())
+        
+        async def cancel_trial():
+            task = asyncio.ensure_future(policy.acall(AsyncFakeBackend(hang=True), "system", "user", 0.5, "council"))
+            await asyncio.sleep(0.01)
+            self.assertFalse(policy.breaker.allow())  # The trial is in flight
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return await policy.acall(AsyncFakeBackend(), "system", "user", 0.5, "council")
+        
+        content, _, _ = asyncio.run(cancel_trial())
+        self.assertEqual(content, "answer")
+        self.assertEqual(policy.breaker.state, "closed")
+    
+    def test_abandoned_stream_trial(self):
+        policy = half_open(resilience())
+        backend = FakeBackend()
+        stream = policy.stream(backend, "system", "user", 0.5, "council")
+        self.assertEqual(next(stream)[0], "one ")
+        stream.close()
+        self.assertTrue(backend.closed)
+        self.assertEqual(policy.breaker.state, "half_open")
+        self.assertTrue(policy.breaker.allow())
+    
+    def test_abandoned_async_stream_trial(self):
+        policy = half_open(resilience())
+        backend = AsyncFakeBackend()
+        
+        async def read_one():
+            stream = policy.astream(backend, "system", "user", 0.5, "council")
+            delta = (await stream.__anext__())[0]
+            await stream.aclose()
+            return delta
+        
+        self.assertEqual(asyncio.run(read_one()), "one ")
+        self.assertTrue(backend.closed)
+        self.assertTrue(policy.breaker.allow())
+    
+    def test_cancelled_async_stream_trial(self):
+        policy = half_open(resilience())
+        backend = AsyncFakeBackend(hang=True)
+        
+        async def read_all():
+            async for _ in policy.astream(backend, "system", "user", 0.5, "council"):
+                pass
+        
+        async def cancel_trial():
+            task = asyncio.ensure_future(read_all())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        
+        asyncio.run(cancel_trial())
+        self.assertTrue(backend.closed)
+        self.assertTrue(policy.breaker.allow())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Scheduler Tests for The Evolving Kingdom
+Waiting calls are admitted by priority, a passed deadline goes ahead of everything,
+games take turns, and a cancelled call gives back its place
+"""
+
+import asyncio
+import time
+import unittest
+
+import support  # noqa: F401  (puts the repo on sys.path)
+from scheduler import RequestScheduler, TokenBucket, BACKGROUND
+from telemetry import span_context
+
+PRIORITIES = {"default": 1, "council": 0, "chronicle": 2}
+
+def scheduler(max_active=1, reserve=0, deadlines=None):
+    """A scheduler without rate limits, whose deadlines are far off unless given"""
+    return RequestScheduler(max_active=max_active, requests_per_minute=0, tokens_per_minute=0, priorities=PRIORITIES,
+                            deadlines=dict({"default": 60}, **(deadlines or {})), reserve=reserve)
+
+class AdmissionOrderTest(unittest.TestCase):
+    """The order calls queued behind a busy slot are admitted in"""
+    
+    def admitted_order(self, policy, calls):
+        """Queue calls, given as (task, game), behind one holding the only slot; the order they get in"""
+        order = []
+        
+        async def call(task):
+            ticket = await policy.aacquire(task, 0)
+            order.append(task)
+            policy.release(ticket)
+        
+        async def main():
+            holder = await policy.aacquire("holder", 0)
+            tasks = []
+            for task, game in calls:
+                with span_context(game=game):
+                    tasks.append(asyncio.ensure_future(call(task)))
+                await asyncio.sleep(0.01)
+            policy.release(holder)
+            await asyncio.gather(*tasks)
+        
+        asyncio.run(main())
+        return order
+    
+    def test_priority(self):
+        order = self.admitted_order(scheduler(), [("chronicle", None), ("evolve", None), ("council", None)])
+        self.assertEqual(order, ["council", "evolve", "chronicle"])
+    
+    def test_first_come_within_a_class(self):
+        order = self.admitted_order(scheduler(), [("a", None), ("b", None), ("c", None)])
+        self.assertEqual(order, ["a", "b", "c"])
+    
+    def test_passed_deadline_goes_first(self):
+        order = self.admitted_order(scheduler(deadlines={"chronicle": 0}), [("council", None), ("chronicle", None)])
+        self.assertEqual(order, ["chronicle", "council"])
+    
+    def test_games_take_turns(self):
+        policy = scheduler()
+        with span_context(game="first"):
+            policy.release(policy.acquire("earlier", 0))  # The first game was served last
+        order = self.admitted_order(policy, [("first-1", "first"), ("first-2", "first"), ("second-1", "second")])
+        self.assertEqual(order, ["second-1", "first-1", "first-2"])
+
+class BackgroundTest(unittest.TestCase):
+    """Background calls leave reserved slots free, until their deadline"""
+    
+    def test_reserve_until_deadline(self):
+        policy = scheduler(max_active=2, reserve=1, deadlines={"chronicle": 0.2})
+        self.assertEqual(policy.priority_of("chronicle"), BACKGROUND)
+        
+        async def main():
+            holder = await policy.aacquire("council", 0)
+            started = time.monotonic()
+            background = asyncio.ensure_future(policy.aacquire("chronicle", 0))
+            await asyncio.sleep(0.05)
+            self.assertFalse(background.done())  # The free slot is reserved for interactive calls
+            ticket = await asyncio.wait_for(background, 5)
+            self.assertGreaterEqual(time.monotonic() - started, 0.15)
+            policy.release(ticket)
+            policy.release(holder)
+        
+        asyncio.run(main())
+    
+    def test_speculative_calls_are_background(self):
+        with span_context(speculative=True):
+            self.assertEqual(scheduler().priority_of("council"), BACKGROUND)
+
+class AbandonTest(unittest.TestCase):
+    """A cancelled waiting call leaves the queue, and the slots stay counted right"""
+    
+    def test_cancelled_waiter(self):
+        policy = scheduler()
+        
+        async def main():
+            holder = await policy.aacquire("council", 0)
+            waiter = asyncio.ensure_future(policy.aacquire("council", 0))
+            await asyncio.sleep(0.01)
+            self.assertEqual(policy.stats()["queued"], 1)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            self.assertEqual(policy.stats()["queued"], 0)
+            policy.release(holder)
+            self.assertEqual(policy.stats()["active"], 0)
+            policy.release(await asyncio.wait_for(policy.aacquire("council", 0), 1))
+        
+        asyncio.run(main())
+        self.assertEqual(policy.stats()["active"], 0)
+    
+    def test_admission_context(self):
+        policy = scheduler()
+        with policy.admit("council", 10) as admission:
+            self.assertEqual(policy.stats()["active"], 1)
+            self.assertGreaterEqual(admission.waited, 0.0)
+        stats = policy.stats()
+        self.assertEqual(stats["active"], 0)
+        self.assertEqual(stats["classes"][0]["admitted"], 1)
+
+class TokenBucketTest(unittest.TestCase):
+    """The per-minute budgets"""
+    
+    def test_wait_and_refill(self):
+        bucket = TokenBucket(60)
+        now = bucket.updated
+        self.assertEqual(bucket.wait_for(60, 0, now), 0.0)
+        bucket.take(60)
+        self.assertAlmostEqual(bucket.wait_for(30, 0, now), 30.0)
+        self.assertAlmostEqual(bucket.wait_for(10, 0, now + 5), 5.0)
+        self.assertAlmostEqual(bucket.wait_for(10, 20, now + 5), 25.0)  # Leaving a floor untouched
+    
+    def test_oversized_call_waits_for_a_full_bucket(self):
+        bucket = TokenBucket(60)
+        now = bucket.updated
+        self.assertEqual(bucket.wait_for(500, 0, now), 0.0)
+        bucket.take(500)  # Settled usage may leave it in debt
+        self.assertAlmostEqual(bucket.wait_for(1, 0, now), 441.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Sentiment Tests for The Evolving Kingdom
+The lexicon analyzer's negation, modifier and contrast rules score courtly replies as a reader would
+"""
+
+import unittest
+
+import support  # noqa: F401  (puts the repo on sys.path)
+from sentiment import LexiconSentimentAnalyzer, LEXICON, NEUTRAL_BAND
+
+class ScoreTest(unittest.TestCase):
+    """score() returns (net, positive, negative, cue words)"""
+    
+    def setUp(self):
+        self.analyzer = LexiconSentimentAnalyzer()
+    
+    def net(self, text):
+        return self.analyzer.score(text)[0]
+    
+    def test_plain_words(self):
+        self.assertEqual(self.analyzer.score("The king is wise."), (2.0, 2.0, 0.0, 1))
+        self.assertEqual(self.analyzer.score("Such folly and such ruin"), (-2.0 * 1.3 - 2.5 * 1.3, 0.0, 5.85, 2))
+        self.assertEqual(self.net("He betrays us"), LEXICON["betray"])  # Suffixes are stripped
+    
+    def test_negation_flips_and_softens(self):
+        self.assertAlmostEqual(self.net("The king is not wise."), -0.8 * LEXICON["wise"])
+        self.assertAlmostEqual(self.net("We don't trust him"), -0.8 * LEXICON["trust"])
+        self.assertAlmostEqual(self.net("This is never a betrayal"), 0.8 * -LEXICON["betrayal"])
+        self.assertAlmostEqual(self.net("not very wise"), -0.8 * 1.5 * LEXICON["wise"])  # Modifiers do not use up the window
+    
+    def test_negation_window(self):
+        self.assertAlmostEqual(self.net("We are not at all pleased"), -0.8 * LEXICON["pleased"])
+        self.assertEqual(self.net("Not that we had doubted, our loyalty"), LEXICON["loyalty"])  # Three words on
+        self.assertEqual(self.net("No. We rejoice."), LEXICON["rejoice"])  # A sentence end closes it
+    
+    def test_dampeners(self):
+        self.assertAlmostEqual(self.net("We are somewhat pleased"), 0.6 * LEXICON["pleased"])
+        self.assertAlmostEqual(self.net("slightly very angry"), 0.5 * 1.5 * LEXICON["angry"])
+    
+    def test_contrast_weighs_what_follows(self):
+        _, positive, negative, _ = self.analyzer.score("We rejoice, but we fear the cost.")
+        self.assertEqual((positive, negative), (0.5 * LEXICON["rejoice"], -1.5 * LEXICON["fear"]))
+        self.assertLess(positive - negative, 0)
+        self.assertGreater(self.net("We fear the cost, but we rejoice."), 0)
+        # Two contrasts: the first clause counts a quarter, the last one and a half
+        _, positive, negative, _ = self.analyzer.score("We rejoice, but we fear, yet we hope")
+        self.assertEqual(positive, 0.25 * LEXICON["rejoice"] + 1.5 * LEXICON["hope"])
+        self.assertEqual(negative, 0.5 * 1.5 * -LEXICON["fear"])
+    
+    def test_negated_contrast_clause(self):
+        self.assertLess(self.net("You are wise, but this is not good"), 0)
+        self.assertGreater(self.net("This is not good, not good at all, but we shall trust you."), 0)
+    
+    def test_exclamations(self):
+        self.assertAlmostEqual(self.net("We rejoice!"), LEXICON["rejoice"] * 1.1)
+        self.assertAlmostEqual(self.net("We rejoice!!!!!"), LEXICON["rejoice"] * 1.3)  # At most three count
+    
+    def test_no_cues(self):
+        for text in ("", None, "The harvest comes in autumn.", "but"):
+            self.assertEqual(self.analyzer.score(text), (0.0, 0.0, 0.0, 0))
+
+class AnalyzeTest(unittest.TestCase):
+    """analyze() labels, intensity and confidence"""
+    
+    def setUp(self):
+        self.analyzer = LexiconSentimentAnalyzer()
+    
+    def test_labels(self):
+        self.assertEqual(self.analyzer.analyze("We are glad and grateful")[0]["sentiment"], "positive")
+        self.assertEqual(self.analyzer.analyze("This is tyranny")[0]["sentiment"], "negative")
+        self.assertEqual(self.analyzer.analyze("We rejoice, yet we fear")[0]["sentiment"], "negative")
+        self.assertEqual(self.analyzer.analyze("A fair decision, but a burden")[0]["sentiment"], "negative")
+        self.assertEqual(self.analyzer.analyze("Perhaps it is good")[0]["sentiment"], "neutral")
+    
+    def test_neutral_band(self):
+        analyzer = LexiconSentimentAnalyzer({"fine": NEUTRAL_BAND - 0.01, "grand": NEUTRAL_BAND})
+        self.assertEqual(analyzer.analyze("fine")[0]["sentiment"], "neutral")
+        self.assertEqual(analyzer.analyze("grand")[0]["sentiment"], "positive")
+    
+    def test_intensity_and_confidence(self):
+        mild, mild_confidence = self.analyzer.analyze("good")
+        strong, strong_confidence = self.analyzer.analyze("We rejoice, we celebrate, we are grateful and loyal!")
+        self.assertLess(mild["intensity"], strong["intensity"])
+        self.assertLessEqual(strong["intensity"], 1.0)
+        self.assertLess(mild_confidence, strong_confidence)
+        mixed_confidence = self.analyzer.analyze("We rejoice and celebrate, but fear treachery")[1]
+        self.assertLess(mixed_confidence, strong_confidence)
+    
+    def test_empty_reply(self):
+        result, confidence = self.analyzer.analyze("")
+        self.assertEqual((result["sentiment"], result["intensity"], confidence), ("neutral", 0.3, 0.0))
+        self.assertIn("0 cue word(s)", result["reasoning"])
+
+if __name__ == "__main__":
+    unittest.main()
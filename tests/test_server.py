@@ -0,0 +1,117 @@
+"""
+Server Tests for The Evolving Kingdom
+Stored reigns leave memory once reviewed or idle, and shutting down saves every reign
+only after its turn in flight is done
+"""
+
+import asyncio
+import os
+import unittest
+
+from support import TempDirTestCase
+from game_state import GameState
+from storage import create_store
+from server import KingdomServer, HTTPError, shared_ai
+
+class ServerTestCase(TempDirTestCase):
+    """Runs a coroutine against a server on the mock backend; self.server is set inside it"""
+    
+    def run_server(self, scenario, stored=True, **options):
+        async def main():
+            ai = shared_ai("mock", 4, latency_scale=0)
+            self.server = KingdomServer(ai, total_turns=2, state_dir=self.dir if stored else None, **options)
+            self.server.loop = asyncio.get_running_loop()
+            try:
+                return await scenario()
+            finally:
+                if not self.server.stopping:
+                    await self.server.shutdown()
+                await ai.aclose()
+        return asyncio.run(main())
+    
+    async def start(self, name="Tester"):
+        status, reply = await self.server.dispatch("POST", "/games", {"player_name": name})
+        self.assertEqual(status, 201)
+        return reply["game"]
+    
+    async def play(self, game_id):
+        return await self.server.dispatch("POST", f"/games/{game_id}/turns", {"choice": 1})
+    
+    def saved_turn(self, game_id):
+        path = os.path.join(self.dir, f"{game_id}.json")
+        game_state = GameState(path, store=create_store(path))
+        self.assertTrue(game_state.load())
+        return game_state.state["current_turn"]
+
+class SessionEvictionTest(ServerTestCase):
+    """With a store, reviewed and idle reigns are saved and dropped, and reopen when asked for"""
+    
+    def test_review_drops_the_session(self):
+        async def scenario():
+            game_id = await self.start()
+            await self.play(game_id)
+            await self.play(game_id)
+            status, reply = await self.server.dispatch("POST", f"/games/{game_id}/review", {})
+            self.assertEqual(status, 200)
+            self.assertTrue(reply["review"])
+            self.assertEqual(self.server.sessions, {})
+            _, status = await self.server.dispatch("GET", f"/games/{game_id}", {})
+            return game_id, status
+        
+        game_id, status = self.run_server(scenario)
+        self.assertTrue(status["finished"])
+        self.assertEqual(self.saved_turn(game_id), 3)
+    
+    def test_idle_sessions_make_room(self):
+        async def scenario():
+            first = await self.start("First")
+            await self.play(first)
+            second = await self.start("Second")  # Full, but the first reign is idle
+            self.assertEqual(list(self.server.sessions), [second])
+            _, status = await self.server.dispatch("GET", f"/games/{first}", {})
+            self.assertEqual(list(self.server.sessions), [first])
+            return first, status
+        
+        first, status = self.run_server(scenario, max_sessions=1, idle_seconds=0)
+        self.assertEqual(status["turn"], 2)
+        self.assertEqual(self.saved_turn(first), 2)
+    
+    def test_active_sessions_stay(self):
+        async def scenario():
+            await self.start()
+            self.assertEqual(await self.server.drop_idle(), 0)
+            with self.assertRaises(HTTPError) as refused:
+                await self.start()
+            return refused.exception.status
+        
+        self.assertEqual(self.run_server(scenario, max_sessions=1), 503)
+    
+    def test_memory_sessions_are_never_dropped(self):
+        async def scenario():
+            await self.start()
+            return await self.server.drop_idle()
+        
+        self.assertEqual(self.run_server(scenario, stored=False, idle_seconds=0), 0)
+
+class ShutdownTest(ServerTestCase):
+    """shutdown() lets a turn in flight finish before its session is saved and closed"""
+    
+    def test_turn_in_flight_is_saved(self):
+        async def scenario():
+            game_id = await self.start()
+            turn = asyncio.ensure_future(self.play(game_id))
+            await asyncio.sleep(0)
+            self.assertTrue(self.server.sessions[game_id].busy)
+            await self.server.shutdown()
+            self.assertTrue(turn.done())
+            self.assertEqual(self.server.sessions, {})
+            with self.assertRaises(HTTPError):
+                await self.play(game_id)
+            return game_id, (await turn)[0]
+        
+        game_id, status = self.run_server(scenario)
+        self.assertEqual(status, 200)
+        self.assertEqual(self.saved_turn(game_id), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Structured Output Tests for The Evolving Kingdom
+Malformed answers are repaired without touching the text inside their strings
+"""
+
+import json
+import unittest
+
+import support  # noqa: F401  (puts the repo on sys.path)
+from structured_output import (
+    StructuredOutputError, extract_json, repair_json, load_json, validate, parse_structured, SCHEMAS
+)
+
+class RepairTest(unittest.TestCase):
+    """repair_json fixes the syntax around strings, never inside them"""
+    
+    def repaired(self, text):
+        return json.loads(repair_json(text))
+    
+    def test_bare_keys(self):
+        self.assertEqual(self.repaired('{state: "decline", reason: "taxes"}'), {"state": "decline", "reason": "taxes"})
+    
+    def test_strings_that_look_like_keys(self):
+        self.assertEqual(self.repaired('{note: "time: 5, value: 3"}'), {"note": "time: 5, value: 3"})
+        self.assertEqual(self.repaired('{"a": "{b: 1,}", c: 2,}'), {"a": "{b: 1,}", "c": 2})
+    
+    def test_python_literals(self):
+        self.assertEqual(self.repaired('{"a": True, "b": False, "c": None, "d": "None: True"}'),
+                         {"a": True, "b": False, "c": None, "d": "None: True"})
+    
+    def test_quotes(self):
+        self.assertEqual(self.repaired("{'sentiment': 'positive', 'note': 'x, y: z'}"),
+                         {"sentiment": "positive", "note": "x, y: z"})
+        self.assertEqual(self.repaired('{“state”: “stability”}'), {"state": "stability"})
+    
+    def test_trailing_commas(self):
+        self.assertEqual(self.repaired('{"a": [1, 2,], "b": {"c": 3,},}'), {"a": [1, 2], "b": {"c": 3}})
+    
+    def test_truncation(self):
+        self.assertEqual(self.repaired('{"chronicle": "The realm, at last'), {"chronicle": "The realm, at last"})
+        self.assertEqual(self.repaired('{"a": [1, {"b": "c\\" d'), {"a": [1, {"b": 'c" d'}]})
+        self.assertEqual(self.repaired('{"a": 1,'), {"a": 1})
+
+class LoadTest(unittest.TestCase):
+    """load_json finds the object in an answer and says whether it was repaired"""
+    
+    def test_fenced_answer(self):
+        answer = 'Here you go:\n```json\n{"state": "rebellion", "reason": "riots"}\n```'
+        self.assertEqual(extract_json(answer), '{"state": "rebellion", "reason": "riots"}')
+        self.assertEqual(load_json(answer), ({"state": "rebellion", "reason": "riots"}, False))
+    
+    def test_repaired_answer(self):
+        self.assertEqual(load_json("{state: 'decline'}"), ({"state": "decline"}, True))
+    
+    def test_unusable_answers(self):
+        for answer in (None, "no json here", "{]", "[1, 2]"):
+            with self.assertRaises(StructuredOutputError):
+                load_json(answer)
+
+class ValidateTest(unittest.TestCase):
+    """validate coerces what is safe to coerce and rejects the rest"""
+    
+    def test_clean_answer(self):
+        data = {"sentiment": "negative", "intensity": 0.75, "reasoning": "angry"}
+        self.assertEqual(validate(data, SCHEMAS["analyze_sentiment"]), (data, False))
+    
+    def test_coercions(self):
+        result, coerced = validate({"sentiment": " Positive ", "intensity": "80%"}, SCHEMAS["analyze_sentiment"])
+        self.assertTrue(coerced)
+        self.assertEqual(result, {"sentiment": "positive", "intensity": 0.8, "reasoning": ""})
+        self.assertEqual(validate({"sentiment": "neutral", "intensity": -2}, SCHEMAS["analyze_sentiment"])[0]["intensity"], 0.0)
+    
+    def test_rejections(self):
+        schema = SCHEMAS["analyze_sentiment"]
+        for data in ({"intensity": 0.5}, {"sentiment": "furious", "intensity": 0.5},
+                     {"sentiment": "neutral", "intensity": "very"}, {"sentiment": 3, "intensity": 0.5}):
+            with self.assertRaises(StructuredOutputError):
+                validate(data, schema)
+    
+    def test_parse_structured(self):
+        result, repaired = parse_structured('{new_personality: "Wary, but loyal: for now",}', "evolve_personality")
+        self.assertTrue(repaired)
+        self.assertEqual(result, {"new_personality": "Wary, but loyal: for now", "key_change": "No reason given"})
+
+if __name__ == "__main__":
+    unittest.main()